@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -166,3 +167,18 @@ LOGOUT_REDIRECT_URL = '/login/'
 
 # Custom User Model
 AUTH_USER_MODEL = 'inventory.User'
+
+# Resolved staff permission sets are reused across requests from here:
+# 'session' (default), 'cache' (Django cache framework) or None (per request only)
+PERMISSION_CACHE = 'session'
+
+# Audit logging: events are buffered and bulk inserted by a background thread.
+# AUDIT_LOG_SYNC writes each event immediately (forced on for the test runner).
+AUDIT_LOG_SYNC = 'test' in sys.argv
+AUDIT_LOG_BATCH_SIZE = 100
+AUDIT_LOG_FLUSH_INTERVAL_MS = 500
+AUDIT_LOG_QUEUE_SIZE = 10000
+# Events that cannot reach the database are appended here and replayed on the next write
+AUDIT_LOG_SPOOL_PATH = BASE_DIR / 'audit_spool.jsonl'
+# Gzipped monthly JSONL files written by `manage.py archive_audit_logs --older-than DAYS`
+AUDIT_LOG_ARCHIVE_DIR = BASE_DIR / 'audit_archive'
@@ -3,7 +3,8 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import User, UserLinks, UserAccess, AuditLog, Supplier, Item, StockLot, StockMovement, Recipe, RecipeItem, PurchaseOrder, PurchaseOrderItem
+from .models import User, UserLinks, UserAccess, AuditLog, AuditLogArchive, Supplier, Item, ItemStockBalance, DailyMovementRollup, InventorySnapshot, SequenceCounter, StockLot, StockMovement, Recipe, RecipeItem, PurchaseOrder, PurchaseOrderItem
+from .services import InventoryService, PurchaseOrderService
 
 
 @admin.register(User)
@@ -98,6 +99,25 @@ class AuditLogAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(AuditLogArchive)
+class AuditLogArchiveAdmin(admin.ModelAdmin):
+    """
+    Admin for audit log archive files written by archive_audit_logs (read-only)
+    """
+    list_display = ('month', 'row_count', 'first_timestamp', 'last_timestamp', 'file_path', 'updated_at')
+    ordering = ('-month',)
+    readonly_fields = ('month', 'file_path', 'row_count', 'first_timestamp', 'last_timestamp', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # --- INVENTORY ADMIN ---
 
 @admin.register(Supplier)
@@ -175,6 +195,17 @@ class StockLotAdmin(admin.ModelAdmin):
         if not change:  # Creating new lot
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
+        InventoryService.refresh_stock_balances([obj.item_id])
+    
+    def delete_model(self, request, obj):
+        item_id = obj.item_id
+        super().delete_model(request, obj)
+        InventoryService.refresh_stock_balances([item_id])
+    
+    def delete_queryset(self, request, queryset):
+        item_ids = set(queryset.values_list('item_id', flat=True))
+        super().delete_queryset(request, queryset)
+        InventoryService.refresh_stock_balances(item_ids)
 
 
 @admin.register(StockMovement)
@@ -198,6 +229,89 @@ class StockMovementAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(ItemStockBalance)
+class ItemStockBalanceAdmin(admin.ModelAdmin):
+    """
+    Admin for materialized stock balances (read-only, maintained by InventoryService)
+    """
+    list_display = ('item', 'on_hand_qty', 'on_hand_value', 'lot_count', 'earliest_expiry', 'avg_unit_cost', 'updated_at')
+    list_filter = ('item__category',)
+    search_fields = ('item__code', 'item__name')
+    ordering = ('item__code',)
+    readonly_fields = ('item', 'on_hand_qty', 'on_hand_value', 'lot_count', 'earliest_expiry', 'avg_unit_cost', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyMovementRollup)
+class DailyMovementRollupAdmin(admin.ModelAdmin):
+    """
+    Admin for daily movement rollups (read-only, maintained by InventoryService)
+    """
+    list_display = ('date', 'item', 'movement_type', 'count', 'qty', 'value', 'updated_at')
+    list_filter = ('movement_type', 'date')
+    search_fields = ('item__code', 'item__name')
+    date_hierarchy = 'date'
+    readonly_fields = ('date', 'item', 'movement_type', 'count', 'qty', 'value', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    """
+    Admin for point-in-time inventory snapshots (read-only, written by snapshot_inventory)
+    """
+    list_display = ('date', 'item', 'qty', 'value', 'created_at')
+    list_filter = ('date', 'item__category')
+    search_fields = ('item__code', 'item__name')
+    date_hierarchy = 'date'
+    readonly_fields = ('date', 'item', 'qty', 'value', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SequenceCounter)
+class SequenceCounterAdmin(admin.ModelAdmin):
+    """
+    Admin for document-number sequences (read-only, advanced by SequenceCounter.reserve)
+    """
+    list_display = ('key', 'value', 'updated_at')
+    search_fields = ('key',)
+    ordering = ('key',)
+    readonly_fields = ('key', 'value', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 class RecipeItemInline(admin.TabularInline):
     """
     Inline admin for RecipeItem
@@ -289,6 +403,11 @@ class PurchaseOrderAdmin(admin.ModelAdmin):
         if not change:  # Creating new purchase order
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline line edits change the order total
+        PurchaseOrderService.refresh_order_totals([form.instance])
 
 
 @admin.register(PurchaseOrderItem)
@@ -313,3 +432,17 @@ class PurchaseOrderItemAdmin(admin.ModelAdmin):
     def subtotal_display(self, obj):
         return f"₱{obj.subtotal():,.2f}"
     subtotal_display.short_description = 'Subtotal'
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        PurchaseOrderService.refresh_order_totals([obj.purchase_order])
+    
+    def delete_model(self, request, obj):
+        order = obj.purchase_order
+        super().delete_model(request, obj)
+        PurchaseOrderService.refresh_order_totals([order])
+    
+    def delete_queryset(self, request, queryset):
+        orders = list(PurchaseOrder.objects.filter(pk__in=queryset.values('purchase_order')))
+        super().delete_queryset(request, queryset)
+        PurchaseOrderService.refresh_order_totals(orders)
@@ -0,0 +1,230 @@
+"""
+Buffered audit log writer.
+
+Audit events are queued in-process and written by a background thread with bulk_create
+every AUDIT_LOG_BATCH_SIZE events or AUDIT_LOG_FLUSH_INTERVAL_MS milliseconds, whichever
+comes first. Batches that cannot reach the database are appended to a JSON-lines spool
+file and replayed before the next successful write; a batch rejected for any other reason
+is retried one event at a time so only the bad events are lost. Set AUDIT_LOG_SYNC to write each
+event immediately instead (used by the test suite).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """
+    In-process queue of audit events drained in batches by a daemon thread
+    """
+
+    def __init__(self, batch_size=100, flush_interval_ms=500, max_queue_size=10000, spool_path=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.spool_path = spool_path
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._write_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, entry):
+        """Queue one event (a dict of AuditLog field values) without touching the database"""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            # Never block a request on auditing; keep the event durable instead
+            self._spool([entry])
+
+    def flush(self):
+        """Write everything currently queued in the calling thread"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self, timeout=5):
+        """Stop the background thread and drain whatever is left in the buffer"""
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked worker: the parent's buffered events are the parent's to write
+                self.queue = queue.Queue(maxsize=self.max_queue_size)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                batch = self._collect()
+                if batch:
+                    self._write(batch)
+        finally:
+            connection.close()
+
+    def _collect(self):
+        """Block for the first event, then gather more until the batch is full or the interval ends"""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._write_lock:
+            close_old_connections()
+            try:
+                self._replay_spool()
+                AuditLog.objects.bulk_create([AuditLog(**entry) for entry in batch])
+            except (OperationalError, InterfaceError) as e:
+                logger.error(f"Audit log database unavailable, spooling {len(batch)} event(s): {e}")
+                self._spool(batch)
+            except Exception as e:
+                logger.warning(f"Audit log batch of {len(batch)} event(s) failed, writing them one at a time: {e}")
+                self._write_rows(batch)
+
+    def _write_rows(self, batch):
+        """Insert events one at a time so one bad event does not lose the rest of its batch"""
+        for entry in batch:
+            try:
+                with transaction.atomic():
+                    AuditLog.objects.create(**entry)
+            except (OperationalError, InterfaceError) as e:
+                logger.error(f"Audit log database unavailable, spooling 1 event(s): {e}")
+                self._spool([entry])
+            except Exception as e:
+                logger.error(f"Failed to write audit log {serialize_entry(entry)}: {e}")
+
+    def _spool(self, batch):
+        if not self.spool_path:
+            logger.error(f"No audit spool configured, dropping {len(batch)} audit event(s)")
+            return
+        with self._spool_lock:
+            with open(self.spool_path, 'a', encoding='utf-8') as spool:
+                for entry in batch:
+                    spool.write(json.dumps(serialize_entry(entry)) + '\n')
+
+    def _replay_spool(self):
+        """Insert spooled events; the spool is only removed once they are all written"""
+        if not self.spool_path:
+            return
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return
+            with open(self.spool_path, encoding='utf-8') as spool:
+                entries = [deserialize_entry(json.loads(line)) for line in spool if line.strip()]
+            if entries:
+                # Spooled events keep their ids, so a partly replayed spool is safe to replay again
+                AuditLog.objects.bulk_create(
+                    [AuditLog(**entry) for entry in entries],
+                    batch_size=self.batch_size,
+                    ignore_conflicts=True
+                )
+                logger.info(f"Replayed {len(entries)} spooled audit event(s)")
+            os.remove(self.spool_path)
+
+
+def serialize_entry(entry):
+    """JSON-safe copy of an audit event"""
+    data = dict(entry)
+    data['id'] = str(data['id'])
+    data['user_id'] = str(data['user_id']) if data.get('user_id') is not None else None
+    data['timestamp'] = data['timestamp'].isoformat()
+    return data
+
+
+def deserialize_entry(data):
+    """Inverse of serialize_entry"""
+    entry = dict(data)
+    entry['timestamp'] = parse_datetime(entry['timestamp'])
+    return entry
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    """Process-wide writer built from settings; drained at interpreter exit"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditLogWriter(
+                    batch_size=getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 100),
+                    flush_interval_ms=getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL_MS', 500),
+                    max_queue_size=getattr(settings, 'AUDIT_LOG_QUEUE_SIZE', 10000),
+                    spool_path=getattr(settings, 'AUDIT_LOG_SPOOL_PATH', None),
+                )
+                atexit.register(_writer.shutdown)
+    return _writer
+
+
+def record_audit_event(user, action_type, target_model, target_id=None, description="",
+                       ip_address='Unknown', user_agent='Unknown'):
+    """
+    Record an audit event. The id and timestamp are fixed now so buffered events keep
+    their real time and order.
+    """
+    entry = {
+        'id': uuid.uuid4(),
+        'user_id': getattr(user, 'pk', None),
+        'action_type': action_type,
+        'target_model': target_model,
+        'target_id': target_id,
+        'description': description,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'timestamp': timezone.now(),
+    }
+
+    if getattr(settings, 'AUDIT_LOG_SYNC', False):
+        AuditLog.objects.create(**entry)
+    else:
+        get_audit_writer().enqueue(entry)
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
 from .models import User, UserAccess, UserLinks, Supplier, Item, StockLot, StockMovement, Recipe, RecipeItem, PurchaseOrder, PurchaseOrderItem
@@ -654,13 +655,55 @@ class RecipeItemForm(forms.ModelForm):
         return loss_factor
 
 
+class TypeaheadSelect(forms.Select):
+    """
+    Select that renders only the chosen option; the rest are fetched from the search API as
+    the user types (see inventory/stock/typeahead_select.html), so large tables are never rendered
+    """
+
+    def __init__(self, search_type, attrs=None):
+        super().__init__(attrs)
+        self.search_type = search_type
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs'].update({
+            'data-typeahead-url': reverse('inventory:api_search'),
+            'data-typeahead-type': self.search_type,
+        })
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if v not in (None, '')]
+        queryset = self.choices.queryset.filter(pk__in=selected) if selected else self.choices.queryset.none()
+        groups = [(None, [self.create_option(name, '', '---------', False, 0)], 0)]
+        for index, obj in enumerate(queryset, start=1):
+            groups.append((None, [self.create_option(name, str(obj.pk), str(obj), True, index)], index))
+        return groups
+
+
+def lots_for_selected_item(form):
+    """
+    Lots with stock for the form's selected item (none until one is chosen), so the lot select
+    never lists every lot; the stock pages reload the options when the item changes
+    """
+    item_id = form.data.get('item') if form.is_bound else form.initial.get('item')
+    lots = StockLot.objects.filter(qty__gt=0).select_related('item').order_by('expires_at', 'received_at')
+    if not item_id:
+        return lots.none()
+    try:
+        return lots.filter(item_id=getattr(item_id, 'pk', item_id))
+    except ValidationError:
+        return lots.none()
+
+
 class StockReceiveForm(forms.Form):
     """
     Form for receiving stock (lot_no is auto-generated if not provided)
     """
     item = forms.ModelChoiceField(
         queryset=Item.objects.filter(is_active=True),
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=TypeaheadSelect('item', attrs={'class': 'form-control'})
     )
     lot_no = forms.CharField(
         max_length=100,
@@ -720,7 +763,7 @@ class StockConsumeForm(forms.Form):
     """
     item = forms.ModelChoiceField(
         queryset=Item.objects.filter(is_active=True),
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=TypeaheadSelect('item', attrs={'class': 'form-control'})
     )
     lot = forms.ModelChoiceField(
         queryset=StockLot.objects.filter(qty__gt=0),
@@ -752,6 +795,10 @@ class StockConsumeForm(forms.Form):
         widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3})
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['lot'].queryset = lots_for_selected_item(self)
+
     def clean_qty(self):
         qty = self.cleaned_data.get('qty')
         if qty is not None and qty <= 0:
@@ -764,7 +811,7 @@ class ProductionForm(forms.Form):
     Form for production workflow with pricing
     """
     recipe = forms.ModelChoiceField(
-        queryset=Recipe.objects.filter(is_active=True),
+        queryset=Recipe.objects.filter(is_active=True).select_related('product'),
         widget=forms.Select(attrs={'class': 'form-control'}),
         label="Recipe"
     )
@@ -944,13 +991,39 @@ class QRCodeScanForm(forms.Form):
         return qr_code
 
 
+class QRCodeBatchScanForm(forms.Form):
+    """
+    Form for receiving several purchase orders in one scan session
+    """
+    MAX_CODES = 200
+    
+    qr_codes = forms.CharField(
+        required=True,
+        widget=forms.Textarea(attrs={
+            'class': 'form-control font-monospace',
+            'rows': 10,
+            'placeholder': 'Scan or enter one QR code per line...',
+            'autofocus': True
+        }),
+        help_text="Scan every package in the delivery; each scan adds a line"
+    )
+
+    def clean_qr_codes(self):
+        qr_codes = list(dict.fromkeys(code.upper() for code in self.cleaned_data.get('qr_codes', '').replace(',', ' ').split()))
+        if not qr_codes:
+            raise ValidationError("Scan at least one QR code.")
+        if len(qr_codes) > self.MAX_CODES:
+            raise ValidationError(f"At most {self.MAX_CODES} QR codes can be received in one session.")
+        return qr_codes
+
+
 class DamageLogForm(forms.Form):
     """
     Form for logging damaged/lost products
     """
     item = forms.ModelChoiceField(
         queryset=Item.objects.filter(is_active=True),
-        widget=forms.Select(attrs={'class': 'form-control'}),
+        widget=TypeaheadSelect('item', attrs={'class': 'form-control'}),
         label="Item"
     )
     lot = forms.ModelChoiceField(
@@ -990,16 +1063,7 @@ class DamageLogForm(forms.Form):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Update lot queryset dynamically based on selected item
-        if 'item' in self.data:
-            try:
-                item_id = self.data.get('item')
-                self.fields['lot'].queryset = StockLot.objects.filter(
-                    item_id=item_id, 
-                    qty__gt=0
-                ).order_by('-created_at')
-            except (ValueError, TypeError):
-                pass
+        self.fields['lot'].queryset = lots_for_selected_item(self)
     
     def clean_qty(self):
         qty = self.cleaned_data.get('qty')
@@ -0,0 +1,115 @@
+"""
+Management command to move old audit logs out of audit_log into compressed monthly JSONL archives
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from inventory.models import AuditLog, AuditLogArchive
+
+
+ARCHIVE_FIELDS = (
+    'id', 'timestamp', 'user_id', 'action_type', 'target_model', 'target_id',
+    'description', 'ip_address', 'user_agent',
+)
+
+
+class Command(BaseCommand):
+    help = 'Archive audit logs older than N days to gzipped JSONL files (one per month) and delete them in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            required=True,
+            help='Archive logs older than this many days'
+        )
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=None,
+            help='Directory for the archive files (default: settings.AUDIT_LOG_ARCHIVE_DIR)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of logs read, written and deleted per batch (default: 5000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the logs that would be archived'
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError('--older-than must be at least 1 day')
+        chunk_size = options['chunk_size']
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        old_logs = AuditLog.objects.filter(timestamp__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{old_logs.count()} audit log(s) older than {cutoff:%Y-%m-%d %H:%M} would be archived.')
+            return
+
+        output_dir = options['output_dir'] or getattr(settings, 'AUDIT_LOG_ARCHIVE_DIR', 'audit_archive')
+        os.makedirs(output_dir, exist_ok=True)
+
+        total = 0
+        last = None
+        while True:
+            # Keyset over the (timestamp, id) index so each chunk is a short range read
+            chunk = old_logs.order_by('timestamp', 'id')
+            if last is not None:
+                chunk = chunk.filter(Q(timestamp__gt=last[0]) | Q(timestamp=last[0], id__gt=last[1]))
+            rows = list(chunk.values(*ARCHIVE_FIELDS, username=F('user__username'))[:chunk_size])
+            if not rows:
+                break
+
+            by_month = {}
+            for row in rows:
+                month = timezone.localtime(row['timestamp']).date().replace(day=1)
+                by_month.setdefault(month, []).append(row)
+
+            # Rows are written before they are deleted; an interrupted run may archive a chunk twice but never loses one
+            paths = {}
+            for month, month_rows in by_month.items():
+                paths[month] = os.path.join(output_dir, f'audit_log_{month:%Y_%m}.jsonl.gz')
+                with gzip.open(paths[month], 'at', encoding='utf-8') as archive:
+                    for row in month_rows:
+                        archive.write(json.dumps(row, default=str) + '\n')
+
+            with transaction.atomic():
+                for month, month_rows in by_month.items():
+                    self.record_archive(month, paths[month], month_rows)
+                AuditLog.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+
+            total += len(rows)
+            last = (rows[-1]['timestamp'], rows[-1]['id'])
+            self.stdout.write(f'Archived {total} audit log(s)...')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Archived {total} audit log(s) older than {cutoff:%Y-%m-%d %H:%M} to {output_dir}.')
+        )
+
+    def record_archive(self, month, path, rows):
+        archive, created = AuditLogArchive.objects.select_for_update().get_or_create(
+            month=month,
+            defaults={
+                'file_path': path,
+                'row_count': 0,
+                'first_timestamp': rows[0]['timestamp'],
+                'last_timestamp': rows[-1]['timestamp'],
+            }
+        )
+        archive.file_path = path
+        archive.row_count += len(rows)
+        archive.first_timestamp = min(archive.first_timestamp, rows[0]['timestamp'])
+        archive.last_timestamp = max(archive.last_timestamp, rows[-1]['timestamp'])
+        archive.save()
@@ -0,0 +1,69 @@
+"""
+Management command to rebuild daily stock movement rollups from StockMovement history
+"""
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from inventory.models import StockMovement
+from inventory.services import InventoryService
+
+
+class Command(BaseCommand):
+    help = 'Backfill DailyMovementRollup rows from StockMovement for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=str,
+            help='First date to rebuild, YYYY-MM-DD (default: date of the earliest movement)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            type=str,
+            help='Last date to rebuild, YYYY-MM-DD (default: today)'
+        )
+        parser.add_argument(
+            '--days-per-chunk',
+            type=int,
+            default=31,
+            help='Number of days recalculated per transaction (default: 31)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else timezone.localdate()
+            if options['date_from']:
+                date_from = date.fromisoformat(options['date_from'])
+            else:
+                earliest = StockMovement.objects.aggregate(earliest=Min('timestamp'))['earliest']
+                if earliest is None:
+                    self.stdout.write(self.style.SUCCESS('No stock movements to roll up.'))
+                    return
+                date_from = timezone.localdate(earliest)
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        if date_from > date_to:
+            raise CommandError('--from must not be after --to')
+
+        chunk_days = max(options['days_per_chunk'], 1)
+        total_rows = 0
+        start = date_from
+
+        while start <= date_to:
+            end = min(start + timedelta(days=chunk_days - 1), date_to)
+            with transaction.atomic():
+                rollups = InventoryService.refresh_movement_rollups(start_date=start, end_date=end)
+            total_rows += len(rollups)
+            self.stdout.write(f'{start} to {end}: {len(rollups)} rollup row(s)')
+            start = end + timedelta(days=1)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Backfilled {total_rows} rollup row(s) from {date_from} to {date_to}.'
+            )
+        )
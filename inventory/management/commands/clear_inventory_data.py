@@ -3,9 +3,10 @@ Management command to clear all inventory data while preserving user accounts
 """
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.utils import timezone
 from inventory.models import (
     AuditLog, AttendanceRecord, ShiftSchedule, StockMovement, 
-    StockLot, RecipeItem, Recipe, Item, Supplier, UserAccess, UserLinks
+    StockLot, RecipeItem, Recipe, Item, Supplier, User, UserAccess, UserLinks
 )
 
 
@@ -83,6 +84,8 @@ class Command(BaseCommand):
                 # 10. Delete user access records
                 access_count = UserAccess.objects.all().count()
                 UserAccess.objects.all().delete()
+                # Bump every user's permission version stamp so cached permission sets are dropped
+                User.objects.update(updated_at=timezone.now())
                 self.stdout.write(self.style.SUCCESS(f'✓ Deleted {access_count} user access records'))
 
                 # 11. Delete user links
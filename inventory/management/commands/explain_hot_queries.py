@@ -0,0 +1,107 @@
+"""
+Management command to EXPLAIN the hot queries and fail when any of them scans a whole table
+"""
+import json
+import re
+import uuid
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from inventory.models import AttendanceRecord, Item, PurchaseOrder, StockMovement, Supplier
+from inventory.services import InventoryService
+
+
+def sample_pk(model):
+    """An existing primary key when there is one; plans do not depend on the value otherwise"""
+    return model.objects.values_list('pk', flat=True).first() or uuid.uuid4()
+
+
+def today_range():
+    today = timezone.localdate()
+    return (
+        timezone.make_aware(datetime.combine(today, time.min)),
+        timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min)),
+    )
+
+
+# name -> callable returning the queryset as the application builds it
+HOT_QUERIES = {
+    'fefo_lots': lambda: InventoryService.get_available_lots(Item(pk=sample_pk(Item), is_perishable=True)),
+    'expiring_lots': lambda: InventoryService.get_expiring_items(7),
+    'expired_lots': lambda: InventoryService.get_expired_items(),
+    'production_today': lambda: StockMovement.objects.filter(
+        movement_type='produce',
+        timestamp__gte=today_range()[0],
+        timestamp__lt=today_range()[1]
+    ).select_related('item', 'lot', 'created_by').order_by('-timestamp'),
+    'item_movements': lambda: StockMovement.objects.filter(item_id=sample_pk(Item)).order_by('-timestamp')[:20],
+    'recent_movements': lambda: StockMovement.objects.select_related('item', 'lot', 'created_by').order_by('-timestamp')[:10],
+    'movement_rollup_range': lambda: StockMovement.objects.filter(
+        timestamp__gte=today_range()[0],
+        timestamp__lt=today_range()[1]
+    ),
+    'supplier_orders_by_status': lambda: PurchaseOrder.objects.filter(supplier_id=sample_pk(Supplier), status='pending'),
+    'supplier_recent_orders': lambda: PurchaseOrder.objects.filter(supplier_id=sample_pk(Supplier)).order_by('-created_at')[:5],
+    'attendance_today': lambda: AttendanceRecord.objects.filter(date=timezone.localdate()),
+}
+
+
+def full_scans(plan, vendor):
+    """Tables read in full according to an EXPLAIN plan from `vendor`"""
+    if vendor == 'mysql':
+        tables = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                if node.get('access_type') == 'ALL':
+                    tables.append(node.get('table_name', '?'))
+                for value in node.values():
+                    walk(value)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value)
+
+        walk(json.loads(plan))
+        return tables
+    if vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)', plan)
+    # SQLite: "SCAN <table>" without an index; "SCAN <table> USING [COVERING] INDEX" walks an index
+    return [
+        match.group(1)
+        for match in re.finditer(r'\bSCAN (?:TABLE )?(\w+)([^\n]*)', plan)
+        if 'USING' not in match.group(2) and match.group(1) != 'CONSTANT'
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN for each hot query and fail if any of them does a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--query',
+            action='append',
+            choices=sorted(HOT_QUERIES),
+            help='Only explain this query (repeatable; default: all)'
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        failures = []
+        for name in options['query'] or HOT_QUERIES:
+            queryset = HOT_QUERIES[name]()
+            # MySQL's JSON plan carries the access type of every table, including joined ones
+            plan = queryset.explain(format='json') if vendor == 'mysql' else queryset.explain()
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{name}:\n{plan}\n')
+
+            scanned = full_scans(plan, vendor)
+            if scanned:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN {name}: {", ".join(scanned)}'))
+            else:
+                self.stdout.write(f'ok {name}')
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot query(ies) do a full table scan: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index.'))
@@ -0,0 +1,112 @@
+"""
+Management command to run several production runs in one transaction
+"""
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import Recipe
+from inventory.services import ProductionService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Produce several recipes at once from a CSV file (recipe,qty,lot_no[,expires_at,unit_cost,notes])'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            type=str,
+            help='CSV file with a header row; recipe is a recipe name or id, expires_at is YYYY-MM-DD'
+        )
+        parser.add_argument(
+            '--user',
+            type=str,
+            required=True,
+            help='Username recorded as the producer'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only validate pooled ingredient stock for the runs'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        runs = self.read_runs(options['file'])
+        if not runs:
+            raise CommandError('No production runs found in file')
+
+        validation = ProductionService.validate_batch(runs)
+        if not validation['can_produce']:
+            for missing in validation['missing_ingredients']:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"{missing['ingredient'].name}: Need {missing['needed']}, Available {missing['available']}"
+                    )
+                )
+            raise CommandError('Insufficient ingredients for batch')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(runs)} run(s) can be produced.'))
+            return
+
+        try:
+            results = ProductionService.produce_batch(runs, user)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for result in results:
+            self.stdout.write(
+                f"{result['recipe'].name}: Lot {result['lot'].lot_no} - "
+                f"{result['production_qty']} {result['lot'].unit} from {len(result['consumed'])} ingredient lot(s)"
+            )
+        self.stdout.write(self.style.SUCCESS(f'Produced {len(results)} run(s).'))
+
+    def read_runs(self, path):
+        recipes = {}
+        runs = []
+
+        with open(path, newline='', encoding='utf-8') as handle:
+            for line_no, row in enumerate(csv.DictReader(handle), start=2):
+                key = (row.get('recipe') or '').strip()
+                if key not in recipes:
+                    recipe = Recipe.objects.filter(is_active=True, name=key).first()
+                    if recipe is None:
+                        try:
+                            recipe = Recipe.objects.filter(is_active=True, pk=key).first()
+                        except ValidationError:
+                            recipe = None
+                    if recipe is None:
+                        raise CommandError(f"Line {line_no}: unknown recipe '{key}'")
+                    recipes[key] = recipe
+
+                try:
+                    production_qty = Decimal(row['qty'])
+                    unit_cost = Decimal(row['unit_cost']) if row.get('unit_cost') else None
+                    expires_at = date.fromisoformat(row['expires_at']) if row.get('expires_at') else None
+                except (InvalidOperation, ValueError, KeyError) as e:
+                    raise CommandError(f'Line {line_no}: {e}')
+
+                if production_qty <= 0:
+                    raise CommandError(f'Line {line_no}: quantity must be greater than 0')
+                if not row.get('lot_no'):
+                    raise CommandError(f'Line {line_no}: lot_no is required')
+
+                runs.append({
+                    'recipe': recipes[key],
+                    'production_qty': production_qty,
+                    'lot_no': row['lot_no'].strip(),
+                    'expires_at': expires_at,
+                    'notes': row.get('notes') or None,
+                    'unit_cost': unit_cost if unit_cost is not None else ProductionService.get_auto_unit_cost(recipes[key]),
+                })
+
+        return runs
@@ -0,0 +1,77 @@
+"""
+Management command to reconcile materialized item stock balances against stock lots
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from inventory.models import Item, ItemStockBalance
+from inventory.services import InventoryService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ItemStockBalance rows from StockLot and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--item',
+            type=str,
+            nargs='+',
+            help='Item codes to rebuild (default: all items)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of items recalculated per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report items whose stored balance differs from their lots'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+
+        items = Item.objects.order_by('code')
+        if options['item']:
+            items = items.filter(code__in=options['item'])
+
+        item_ids = list(items.values_list('id', flat=True))
+        total_drift = 0
+
+        for start in range(0, len(item_ids), chunk_size):
+            chunk = item_ids[start:start + chunk_size]
+            stored = {
+                balance.item_id: balance
+                for balance in ItemStockBalance.objects.filter(item_id__in=chunk)
+            }
+
+            with transaction.atomic():
+                rebuilt = InventoryService.refresh_stock_balances(chunk)
+                if dry_run:
+                    transaction.set_rollback(True)
+
+            for balance in rebuilt:
+                old = stored.get(balance.item_id)
+                if old is None or (
+                    old.on_hand_qty != balance.on_hand_qty
+                    or old.on_hand_value != balance.on_hand_value
+                    or old.lot_count != balance.lot_count
+                    or old.earliest_expiry != balance.earliest_expiry
+                    or old.avg_unit_cost != balance.avg_unit_cost
+                ):
+                    total_drift += 1
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f'Drift on item {balance.item_id}: '
+                            f'stored {old.on_hand_qty if old else "missing"}, actual {balance.on_hand_qty}'
+                        )
+                    )
+
+        action = 'Found' if dry_run else 'Fixed'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Checked {len(item_ids)} items. {action} {total_drift} drifted balance(s).'
+            )
+        )
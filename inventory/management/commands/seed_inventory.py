@@ -0,0 +1,378 @@
+"""
+Management command to generate a large, realistic and reproducible dataset for load and benchmark work
+"""
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from inventory.models import (
+    AttendanceRecord, Item, PurchaseOrder, PurchaseOrderItem, Recipe, RecipeItem,
+    StockLot, StockMovement, Supplier, User
+)
+from inventory.services import InventoryService
+
+
+# (name, unit, shelf life in days or 0 when not perishable), most used first
+INGREDIENTS = [
+    ('Flour', 'kg', 0), ('Sugar', 'kg', 0), ('Butter', 'kg', 60), ('Eggs', 'pcs', 21), ('Yeast', 'g', 120),
+    ('Salt', 'kg', 0), ('Milk', 'L', 7), ('Cream', 'L', 10), ('Baking Powder', 'g', 365), ('Vanilla', 'mL', 365),
+    ('Chocolate', 'kg', 180), ('Cocoa', 'kg', 365), ('Cheese', 'kg', 30), ('Cinnamon', 'g', 365), ('Coconut', 'kg', 30),
+    ('Ube', 'kg', 14), ('Raisins', 'kg', 180), ('Almonds', 'kg', 180), ('Ham', 'kg', 14), ('Mango', 'kg', 7),
+]
+INGREDIENT_GRADES = ['', 'Premium ', 'Bulk ', 'Local ', 'Imported ', 'Organic ', 'Fine ', 'Coarse ']
+PRODUCTS = [
+    'Pandesal', 'Ensaymada', 'Croissant', 'Baguette', 'Chiffon Cake', 'Muffin',
+    'Cookie', 'Brownie', 'Donut', 'Loaf Bread', 'Hopia', 'Spanish Bread',
+]
+PRODUCT_FLAVORS = ['', 'Ube ', 'Cheese ', 'Chocolate ', 'Mango ', 'Cinnamon ', 'Coconut ', 'Ham and Cheese ']
+SUPPLIER_NAMES = [
+    'Golden Mills', 'Sunrise Dairy', 'Island Sugar', 'Metro Baking Supply', 'Farm Fresh Eggs',
+    'Pacific Traders', 'Highland Produce', 'Prime Ingredients',
+]
+DAMAGE_REASONS = [reason for reason, _ in StockMovement.DAMAGE_REASONS]
+PO_STATUSES = [status for status, _ in PurchaseOrder.STATUS_CHOICES]
+
+# Share of items that are finished goods (the rest are ingredients)
+FINISHED_GOOD_RATIO = 0.2
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep the generated values of auto_now/auto_now_add fields instead of stamping now"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field, _, _ in saved:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset (items, recipes, lots, movements, POs, attendance) with chunked bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help='Number of items (default: 1000)')
+        parser.add_argument('--lots-per-item', type=int, default=4, help='Stock lots received or produced per item (default: 4)')
+        parser.add_argument('--days', type=int, default=90, help='Days of history to generate (default: 90)')
+        parser.add_argument('--users', type=int, default=20, help='Number of staff users with attendance (default: 20)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed and end date give the same data (default: 1)')
+        parser.add_argument('--end-date', type=str, default=None, help='Last day of history as YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk insert and items per transaction (default: 5000)')
+        parser.add_argument('--password', type=str, default='seed12345', help='Password for the generated users (default: seed12345)')
+
+    def handle(self, *args, **options):
+        if options['items'] < 1 or options['lots_per_item'] < 1 or options['days'] < 1 or options['users'] < 0:
+            raise CommandError('--items, --lots-per-item and --days must be at least 1 and --users at least 0')
+        if User.objects.filter(username='seed_admin').exists():
+            raise CommandError('Seed data already exists (user seed_admin); seed into an empty database')
+
+        try:
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date() if options['end_date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('--end-date must be YYYY-MM-DD')
+
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.end = timezone.make_aware(datetime.combine(end_date, time(18, 0)))
+        self.start = self.end - timedelta(days=options['days'])
+        self.password = make_password(options['password'])
+
+        with transaction.atomic():
+            self.admin = self.create_users(options['users'])
+            self.suppliers = self.create_suppliers(max(5, options['items'] // 100))
+        self.create_items(options['items'], options['lots_per_item'])
+        self.create_purchase_orders(max(len(PO_STATUSES) * 2, options['items'] // 10))
+        self.create_attendance(end_date, options['days'])
+
+        InventoryService.refresh_movement_rollups(start_date=timezone.localdate(self.start), end_date=end_date)
+        self.stdout.write(self.style.SUCCESS(f'Seeded {options["items"]} items with seed {options["seed"]}.'))
+
+    def uid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def moment(self, start=None, end=None):
+        """Random aware datetime between start and end (the whole history by default)"""
+        start, end = start or self.start, end or self.end
+        return start + timedelta(seconds=self.rng.uniform(0, (end - start).total_seconds()))
+
+    def create_users(self, count):
+        admin = User(
+            id=self.uid(), username='seed_admin', email='seed_admin@example.com', password=self.password,
+            role='admin', first_name='Seed', last_name='Admin'
+        )
+        self.staff = [
+            User(
+                id=self.uid(), username=f'seed_staff_{n:04d}', email=f'seed_staff_{n:04d}@example.com',
+                password=self.password, role='staff', first_name=f'Staff{n}', last_name='Seed'
+            )
+            for n in range(1, count + 1)
+        ]
+        User.objects.bulk_create([admin, *self.staff], batch_size=self.chunk_size)
+        self.stdout.write(f'Created {count + 1} user(s)')
+        return admin
+
+    def create_suppliers(self, count):
+        suppliers = [
+            Supplier(
+                id=self.uid(),
+                name=f'{SUPPLIER_NAMES[n % len(SUPPLIER_NAMES)]} {n // len(SUPPLIER_NAMES) + 1:04d}',
+                contact_person=f'Contact {n + 1}',
+                email=f'orders{n + 1}@supplier.example.com',
+                phone=f'09{self.rng.randint(100000000, 999999999)}',
+                created_by=self.admin
+            )
+            for n in range(count)
+        ]
+        Supplier.objects.bulk_create(suppliers, batch_size=self.chunk_size)
+        self.stdout.write(f'Created {count} supplier(s)')
+        return suppliers
+
+    def reserve_item_codes(self, count):
+        """Codes from the item code sequence, moving to earlier months once a month's 9999 codes are used"""
+        codes = []
+        while len(codes) < count:
+            reserved = Item.generate_item_codes(count - len(codes), month=self.code_month)
+            codes += [code for code in reserved if len(code) == 10]
+            if len(codes) < count:
+                self.code_month = (self.code_month - timedelta(days=1)).replace(day=1)
+        return codes
+
+    def create_items(self, count, lots_per_item):
+        """Ingredients first so every recipe can reference them, then finished goods with their recipes"""
+        finished_goods = max(1, int(count * FINISHED_GOOD_RATIO)) if count > 1 else 0
+        self.code_month = self.end.date().replace(day=1)
+        self.ingredients = []
+        created = 0
+        while created < count:
+            specs = range(created, min(count, created + self.chunk_size))
+            with transaction.atomic():
+                codes = self.reserve_item_codes(len(specs))
+                items = [self.build_item(code, n, is_finished=n >= count - finished_goods) for code, n in zip(codes, specs)]
+                with explicit_timestamps(Item._meta.get_field('created_at')):
+                    Item.objects.bulk_create(items, batch_size=self.chunk_size)
+                self.ingredients.extend(item for item in items if item.category == 'ingredient')
+
+                recipes = self.create_recipes([item for item in items if item.category == 'finished_good'])
+                self.create_stock_history(items, recipes, lots_per_item)
+                InventoryService.refresh_stock_balances(items)
+            created += len(specs)
+            self.stdout.write(f'Created {created}/{count} item(s) with stock history')
+
+    def build_item(self, code, n, is_finished):
+        if is_finished:
+            name = f'{self.rng.choice(PRODUCT_FLAVORS)}{PRODUCTS[n % len(PRODUCTS)]}'
+            unit, shelf_life, category = 'pcs', self.rng.randint(2, 5), 'finished_good'
+        else:
+            base, unit, shelf_life = INGREDIENTS[n % len(INGREDIENTS)]
+            name, category = f'{self.rng.choice(INGREDIENT_GRADES)}{base}', 'ingredient'
+        item = Item(
+            id=self.uid(),
+            code=code,
+            name=name,
+            category=category,
+            unit=unit,
+            reorder_level=Decimal(self.rng.choice([5, 10, 20, 50])),
+            min_order_qty=Decimal(self.rng.choice([1, 5, 10])),
+            is_perishable=shelf_life > 0,
+            shelf_life_days=shelf_life,
+            created_by=self.admin,
+            created_at=self.start,
+        )
+        # Popularity in recipes follows the INGREDIENTS order (flour and sugar in almost everything)
+        item.popularity = 1 / (n % len(INGREDIENTS) + 1)
+        return item
+
+    def create_recipes(self, products):
+        if not products:
+            return {}
+        cum_weights = list(accumulate(ingredient.popularity for ingredient in self.ingredients))
+        recipes = {}
+        recipe_items = []
+        for product in products:
+            recipe = Recipe(
+                id=self.uid(), name=f'{product.name} ({product.code})', product=product,
+                yield_qty=Decimal(self.rng.choice([12, 24, 36, 48])), yield_unit='pcs', created_by=self.admin
+            )
+            recipes[product.pk] = recipe
+            fan_out = min(len(self.ingredients), self.rng.randint(3, 10))
+            chosen = {}
+            while len(chosen) < fan_out:
+                ingredient = self.rng.choices(self.ingredients, cum_weights=cum_weights)[0]
+                chosen[ingredient.pk] = ingredient
+            for ingredient in chosen.values():
+                recipe_items.append(RecipeItem(
+                    id=self.uid(), recipe=recipe, ingredient=ingredient, unit=ingredient.unit,
+                    qty=Decimal(self.rng.randint(1, 40)) / 4, loss_factor=Decimal(self.rng.choice([0, 0, 2, 5]))
+                ))
+        Recipe.objects.bulk_create(recipes.values(), batch_size=self.chunk_size)
+        RecipeItem.objects.bulk_create(recipe_items, batch_size=self.chunk_size)
+        return recipes
+
+    def create_stock_history(self, items, recipes, lots_per_item):
+        lots, movements = [], []
+        for item in items:
+            item_lots, item_movements = self.simulate_item(item, recipes.get(item.pk), lots_per_item)
+            lots.extend(item_lots)
+            movements.extend(item_movements)
+        with explicit_timestamps(StockLot._meta.get_field('received_at'), StockMovement._meta.get_field('timestamp')):
+            StockLot.objects.bulk_create(lots, batch_size=self.chunk_size)
+            StockMovement.objects.bulk_create(movements, batch_size=self.chunk_size)
+
+    def simulate_item(self, item, recipe, lots_per_item):
+        """
+        Lots arrive through the history and are drawn down in FEFO order (FIFO when not perishable);
+        perishable stock left past its expiry is written off as spoilage
+        """
+        lots, movements = [], []
+        produced = item.category == 'finished_good'
+        for n, received_at in enumerate(sorted(self.moment() for _ in range(lots_per_item)), start=1):
+            qty = Decimal(self.rng.randint(2, 40) * (12 if produced else 5))
+            lot = StockLot(
+                id=self.uid(),
+                item=item,
+                lot_no=f'{item.code}-{n:03d}',
+                qty=qty,
+                unit=item.unit,
+                received_at=received_at,
+                expires_at=timezone.localdate(received_at) + timedelta(days=item.shelf_life_days) if item.is_perishable else None,
+                unit_cost=Decimal(self.rng.randint(100, 5000)) / 100,
+                supplier=None if produced else self.rng.choice(self.suppliers),
+                created_by=self.admin,
+            )
+            lots.append(lot)
+            movements.append(self.movement(
+                item, lot, 'produce' if produced else 'receive', qty, received_at,
+                ref_no=f'PROD-{recipe.pk}' if produced and recipe else f'RCV-{item.code}-{n:03d}'
+            ))
+
+        order = (lambda lot: (lot.expires_at, lot.received_at)) if item.is_perishable else (lambda lot: lot.received_at)
+        # Two draws per lot, mostly within its shelf life so spoilage stays the exception
+        window = timedelta(days=item.shelf_life_days or 30)
+        draws = sorted(min(self.end, self.moment(lot.received_at, lot.received_at + window)) for lot in lots for _ in range(2))
+        for at in draws:
+            available = sorted((lot for lot in lots if lot.received_at <= at and lot.qty > 0), key=order)
+            if item.is_perishable:
+                for lot in [lot for lot in available if lot.expires_at < timezone.localdate(at)]:
+                    spoiled_at = timezone.make_aware(datetime.combine(lot.expires_at + timedelta(days=1), time(8, 0)))
+                    movements.append(self.movement(item, lot, 'spoilage', lot.qty, min(spoiled_at, at), reason='Expired'))
+                    lot.qty = Decimal('0')
+                    available.remove(lot)
+            if not available:
+                continue
+
+            if self.rng.random() < 0.05:
+                lot = self.rng.choice(available)
+                qty = min(lot.qty, Decimal(self.rng.randint(1, 5)))
+                lot.qty -= qty
+                movements.append(self.movement(item, lot, 'damage', qty, at, reason=self.rng.choice(DAMAGE_REASONS)))
+                continue
+
+            # Draw a share of what is on hand, overflowing from lot to lot as InventoryService.consume_stock does
+            remaining = (sum(lot.qty for lot in available) * Decimal(self.rng.randint(20, 60)) / 100).quantize(Decimal('1'))
+            for lot in available:
+                if remaining <= 0:
+                    break
+                qty = min(lot.qty, remaining)
+                lot.qty -= qty
+                remaining -= qty
+                movements.append(self.movement(item, lot, 'consume', qty, at, reason='Sales' if produced else 'Production'))
+        return lots, movements
+
+    def movement(self, item, lot, movement_type, qty, at, ref_no=None, reason=None):
+        return StockMovement(
+            id=self.uid(), item=item, lot=lot, movement_type=movement_type, qty=qty, unit=item.unit,
+            ref_no=ref_no, reason=reason, created_by=self.admin, timestamp=at
+        )
+
+    def create_purchase_orders(self, count):
+        """Orders cycle through every status, with the timestamps each status implies"""
+        created = 0
+        while created < count:
+            orders, lines = [], []
+            for n in range(created, min(count, created + self.chunk_size)):
+                ordered_at = self.moment()
+                status = PO_STATUSES[n % len(PO_STATUSES)]
+                order = PurchaseOrder(
+                    id=self.uid(),
+                    qr_code=f'PO-{self.rng.getrandbits(64):016X}',
+                    supplier=self.rng.choice(self.suppliers),
+                    status=status,
+                    order_date=ordered_at,
+                    created_at=ordered_at,
+                    created_by=self.admin,
+                )
+                self.apply_status_timestamps(order, ordered_at)
+                orders.append(order)
+
+                total = Decimal('0')
+                for ingredient in self.rng.sample(self.ingredients, min(len(self.ingredients), self.rng.randint(1, 8))):
+                    qty = Decimal(self.rng.randint(1, 20) * 5)
+                    price = Decimal(self.rng.randint(100, 5000)) / 100 if status not in ('draft', 'pending') else Decimal('0')
+                    lines.append(PurchaseOrderItem(
+                        id=self.uid(), purchase_order=order, item=ingredient, qty_ordered=qty, unit=ingredient.unit,
+                        unit_price=price, qty_received=qty if status == 'received' else Decimal('0')
+                    ))
+                    total += qty * price
+                order.total_amount = total
+
+            with transaction.atomic(), explicit_timestamps(
+                PurchaseOrder._meta.get_field('order_date'), PurchaseOrder._meta.get_field('created_at')
+            ):
+                # One block of order numbers per order day
+                by_day = {}
+                for order in orders:
+                    by_day.setdefault(timezone.localdate(order.order_date), []).append(order)
+                for day, day_orders in sorted(by_day.items()):
+                    for order, order_no in zip(day_orders, PurchaseOrder.generate_order_numbers(len(day_orders), day=day)):
+                        order.order_no = order_no
+                PurchaseOrder.objects.bulk_create(orders, batch_size=self.chunk_size)
+                PurchaseOrderItem.objects.bulk_create(lines, batch_size=self.chunk_size)
+            created += len(orders)
+            self.stdout.write(f'Created {created}/{count} purchase order(s)')
+
+    def apply_status_timestamps(self, order, ordered_at):
+        step = timedelta(hours=self.rng.randint(4, 48))
+        reached = PO_STATUSES.index(order.status)
+        if order.status == 'cancelled':
+            order.cancelled_at, order.cancelled_by = ordered_at + step, self.admin
+            order.cancellation_reason = 'Supplier could not fulfil the order'
+            return
+        if reached >= PO_STATUSES.index('supplier_approved'):
+            order.supplier_approved_at = ordered_at + step
+            order.expected_delivery_date = timezone.localdate(ordered_at + step * 4)
+        if reached >= PO_STATUSES.index('admin_approved'):
+            order.admin_approved_at, order.admin_approved_by = ordered_at + step * 2, self.admin
+        if reached >= PO_STATUSES.index('shipped'):
+            order.shipped_at = ordered_at + step * 3
+        if reached >= PO_STATUSES.index('received'):
+            order.received_at, order.received_by = ordered_at + step * 4, self.admin
+            order.actual_delivery_date = timezone.localdate(order.received_at)
+
+    def create_attendance(self, end_date, days):
+        """Weekday AM/PM clock-ins for every staff user, with occasional absences"""
+        records = []
+        for user in self.staff:
+            for offset in range(days):
+                day = end_date - timedelta(days=offset)
+                if day.weekday() == 6 or self.rng.random() < 0.05:
+                    continue
+
+                time_in_am, time_out_am, time_in_pm, time_out_pm = (
+                    timezone.make_aware(datetime.combine(day, time(hour))) + timedelta(minutes=self.rng.randint(-10, 15))
+                    for hour in (8, 12, 13, 17)
+                )
+                records.append(AttendanceRecord(
+                    id=self.uid(), user=user, date=day, created_at=time_in_am,
+                    time_in_am=time_in_am, time_out_am=time_out_am, time_in_pm=time_in_pm, time_out_pm=time_out_pm,
+                ))
+        with explicit_timestamps(AttendanceRecord._meta.get_field('created_at')):
+            AttendanceRecord.objects.bulk_create(records, batch_size=self.chunk_size)
+        self.stdout.write(f'Created {len(records)} attendance record(s)')
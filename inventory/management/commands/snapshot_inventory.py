@@ -0,0 +1,30 @@
+"""
+Management command to record nightly point-in-time inventory valuation snapshots
+"""
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory.services import InventoryService
+
+
+class Command(BaseCommand):
+    help = 'Record InventorySnapshot rows (qty and value per item) from current stock balances; schedule nightly'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            help='Date to record the snapshot under, YYYY-MM-DD (default: today). Balances are always read as of now.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            snapshot_date = date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        count = InventoryService.snapshot_inventory(snapshot_date)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Recorded inventory snapshot for {snapshot_date}: {count} item(s).')
+        )
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_stock_balances(apps, schema_editor):
+    """Seed balances for existing items from their positive stock lots"""
+    from django.db.models import Count, DecimalField, ExpressionWrapper, F, Min, Sum
+
+    Item = apps.get_model('inventory', 'Item')
+    StockLot = apps.get_model('inventory', 'StockLot')
+    ItemStockBalance = apps.get_model('inventory', 'ItemStockBalance')
+
+    totals = {
+        row['item_id']: row
+        for row in StockLot.objects.filter(qty__gt=0).order_by().values('item_id').annotate(
+            total_qty=Sum('qty'),
+            total_value=Sum(ExpressionWrapper(F('qty') * F('unit_cost'), output_field=DecimalField(max_digits=14, decimal_places=2))),
+            lot_count=Count('id'),
+            earliest_expiry=Min('expires_at'),
+        )
+    }
+    balances = []
+    for item_id in Item.objects.values_list('id', flat=True).iterator():
+        row = totals.get(item_id, {})
+        balances.append(ItemStockBalance(
+            item_id=item_id,
+            on_hand_qty=row.get('total_qty') or 0,
+            on_hand_value=row.get('total_value') or 0,
+            lot_count=row.get('lot_count') or 0,
+            earliest_expiry=row.get('earliest_expiry'),
+        ))
+    ItemStockBalance.objects.bulk_create(balances, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_alter_stockmovement_movement_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemStockBalance',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_balance', serialize=False, to='inventory.item')),
+                ('on_hand_qty', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('on_hand_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('lot_count', models.PositiveIntegerField(default=0)),
+                ('earliest_expiry', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Item Stock Balance',
+                'verbose_name_plural': 'Item Stock Balances',
+                'db_table': 'item_stock_balance',
+            },
+        ),
+        migrations.RunPython(populate_stock_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:05
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def populate_avg_unit_cost(apps, schema_editor):
+    """Seed cached weighted average costs from positive stock lots"""
+    from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+    StockLot = apps.get_model('inventory', 'StockLot')
+    ItemStockBalance = apps.get_model('inventory', 'ItemStockBalance')
+
+    balances = []
+    for row in StockLot.objects.filter(qty__gt=0).order_by().values('item_id').annotate(
+        total_qty=Sum('qty'),
+        total_value=Sum(ExpressionWrapper(F('qty') * F('unit_cost'), output_field=DecimalField(max_digits=18, decimal_places=4))),
+    ).iterator():
+        if row['total_qty']:
+            balances.append(ItemStockBalance(
+                item_id=row['item_id'],
+                avg_unit_cost=(Decimal(row['total_value'] or 0) / Decimal(row['total_qty'])).quantize(Decimal('0.0001')),
+            ))
+    ItemStockBalance.objects.bulk_update(balances, ['avg_unit_cost'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_itemstockbalance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemstockbalance',
+            name='avg_unit_cost',
+            field=models.DecimalField(decimal_places=4, default=0, help_text='Weighted average cost of on-hand lots', max_digits=12),
+        ),
+        migrations.RunPython(populate_avg_unit_cost, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_itemstockbalance_avg_unit_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMovementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('movement_type', models.CharField(choices=[('receive', 'Receive Stock'), ('consume', 'Consume Stock'), ('produce', 'Produce Stock'), ('adjust', 'Adjust Stock'), ('transfer', 'Transfer Stock'), ('spoilage', 'Spoilage'), ('damage', 'Damage/Loss')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('qty', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_movement_rollups', to='inventory.item')),
+            ],
+            options={
+                'verbose_name': 'Daily Movement Rollup',
+                'verbose_name_plural': 'Daily Movement Rollups',
+                'db_table': 'daily_movement_rollup',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date', 'movement_type'], name='rollup_date_type_idx')],
+                'unique_together': {('date', 'item', 'movement_type')},
+            },
+        ),
+    ]
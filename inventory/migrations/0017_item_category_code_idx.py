@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_auditlog_indexes_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'code'], name='item_category_code_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+# (table, index name, columns); keep in step with inventory.search.SEARCH_FIELDS
+FULLTEXT_INDEXES = [
+    ('item', 'item_search_ft', ('code', 'name', 'description')),
+    ('supplier', 'supplier_search_ft', ('name', 'contact_person', 'email')),
+    ('user', 'user_search_ft', ('username', 'first_name', 'last_name', 'email')),
+]
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    """FULLTEXT indexes are MySQL-only; other backends search through the in-process trigram index"""
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(
+            f'CREATE FULLTEXT INDEX {quote(name)} ON {quote(table)} ({", ".join(quote(column) for column in columns)})'
+        )
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'DROP INDEX {quote(name)} ON {quote(table)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_item_category_code_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
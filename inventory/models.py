@@ -4,6 +4,7 @@ from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from decimal import Decimal
 import uuid
 
 
@@ -50,14 +51,10 @@ class UserManager(BaseUserManager):
     
     def search_users_safe(self, search_term):
         """
-        Safely search users using Django ORM
+        Ranked search over active users (FULLTEXT on MySQL, see inventory.search)
         """
-        return self.filter(
-            models.Q(username__icontains=search_term) |
-            models.Q(first_name__icontains=search_term) |
-            models.Q(last_name__icontains=search_term) |
-            models.Q(email__icontains=search_term)
-        ).filter(is_active=True)
+        from .search import search
+        return search(self.filter(is_active=True), search_term)
 
 
 class User(AbstractUser):
@@ -163,10 +160,8 @@ class User(AbstractUser):
         
         # Staff users need explicit permissions
         if self.role == 'staff':
-            return self.user_accesses.filter(
-                permission_type=permission_type,
-                is_active=True
-            ).exists()
+            from .security import resolve_user_permissions
+            return permission_type in resolve_user_permissions(self)
         
         return False
 
@@ -243,6 +238,15 @@ class UserAccess(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+        from .security import invalidate_user_permissions
+        invalidate_user_permissions(self.user_id)
+    
+    def delete(self, *args, **kwargs):
+        user_id = self.user_id
+        result = super().delete(*args, **kwargs)
+        from .security import invalidate_user_permissions
+        invalidate_user_permissions(user_id)
+        return result
     
     def is_expired(self):
         """Check if permission has expired"""
@@ -274,18 +278,46 @@ class AuditLog(models.Model):
     description = models.TextField()
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event is recorded, not when the buffered writer inserts it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         db_table = 'audit_log'
         verbose_name = 'Audit Log'
         verbose_name_plural = 'Audit Logs'
         ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination (timestamp, id) and archival range scans
+            models.Index(fields=['timestamp', 'id'], name='audit_ts_id_idx'),
+            models.Index(fields=['user', 'timestamp'], name='audit_user_ts_idx'),
+            models.Index(fields=['action_type', 'timestamp'], name='audit_action_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username if self.user else 'System'} - {self.get_action_type_display()} - {self.timestamp}"
 
 
+class AuditLogArchive(models.Model):
+    """
+    Monthly archive file of audit logs moved out of audit_log by archive_audit_logs
+    """
+    month = models.DateField(unique=True, help_text="First day of the archived month")
+    file_path = models.CharField(max_length=500)
+    row_count = models.PositiveIntegerField(default=0)
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'audit_log_archive'
+        verbose_name = 'Audit Log Archive'
+        verbose_name_plural = 'Audit Log Archives'
+        ordering = ['-month']
+    
+    def __str__(self):
+        return f"{self.month:%Y-%m} - {self.row_count} logs"
+
+
 # --- Attendance / DTR ---
 class ShiftSchedule(models.Model):
     """Schedule assignment for users (future-ready)."""
@@ -330,6 +362,10 @@ class AttendanceRecord(models.Model):
         verbose_name_plural = 'Attendance Records'
         unique_together = ['user', 'date']
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Daily overviews filter on date across all users
+            models.Index(fields=['date'], name='attendance_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.date}"
@@ -343,6 +379,48 @@ class AttendanceRecord(models.Model):
 
 # --- INVENTORY MANAGEMENT MODELS ---
 
+class SequenceCounter(models.Model):
+    """
+    Last value issued for a document-number sequence such as item codes for a month,
+    purchase order numbers for a day or generated lot numbers for a day
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'sequence_counter'
+        verbose_name = 'Sequence Counter'
+        verbose_name_plural = 'Sequence Counters'
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+    @classmethod
+    def reserve(cls, key, count=1, start=None):
+        """
+        Reserve `count` consecutive values of the `key` sequence and return them as a range.
+        The counter row is bumped with a single UPDATE ... SET value = value + count, so
+        concurrent callers queue on that one row instead of racing into unique constraints.
+        `start` is called once, when the counter does not exist yet, to get the last value
+        already used (e.g. by rows created before the counter), and defaults to 0.
+        """
+        from django.db import IntegrityError, transaction
+        if count < 1:
+            raise ValueError("count must be at least 1")
+
+        with transaction.atomic():
+            if not cls.objects.filter(key=key).update(value=models.F('value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(key=key, value=(start() if start else 0) + count)
+                except IntegrityError:
+                    # Another transaction created the counter first
+                    cls.objects.filter(key=key).update(value=models.F('value') + count)
+            last = cls.objects.filter(key=key).values_list('value', flat=True).get()
+        return range(last - count + 1, last + 1)
+
+
 class Supplier(models.Model):
     """
     Supplier master data
@@ -368,6 +446,57 @@ class Supplier(models.Model):
         return self.name
 
 
+class ItemQuerySet(models.QuerySet):
+    """
+    QuerySet for Item with stock balance helpers
+    """
+    def with_stock_balance(self):
+        """
+        Annotate items with their materialized stock balance (zero when no balance row exists yet):
+        balance_qty, balance_value, balance_lot_count, balance_earliest_expiry
+        """
+        from django.db.models.functions import Coalesce
+        zero = models.Value(Decimal('0.00'), output_field=models.DecimalField(max_digits=14, decimal_places=2))
+        return self.annotate(
+            balance_qty=Coalesce('stock_balance__on_hand_qty', zero),
+            balance_value=Coalesce('stock_balance__on_hand_value', zero),
+            balance_lot_count=Coalesce('stock_balance__lot_count', models.Value(0)),
+            balance_earliest_expiry=models.F('stock_balance__earliest_expiry'),
+        )
+
+    def expiring_lots(self, days=7):
+        """Lots with stock left that expire within `days`, correlated to the outer item"""
+        from datetime import timedelta
+        expiry_date = timezone.now().date() + timedelta(days=days)
+        return StockLot.objects.filter(
+            item=models.OuterRef('pk'),
+            qty__gt=0,
+            expires_at__isnull=False,
+            expires_at__lte=expiry_date
+        ).order_by()
+
+    def with_stock_status(self, expiring_days=7):
+        """
+        Annotate items with their stock balance plus is_low_stock (on hand at or below reorder level)
+        and expiring_count (lots expiring within expiring_days), all computed in the same query
+        """
+        from django.db.models.functions import Coalesce
+        expiring_count = self.expiring_lots(expiring_days).values('item').annotate(
+            count=models.Count('pk')
+        ).values('count')
+        return self.with_stock_balance().annotate(
+            is_low_stock=models.ExpressionWrapper(
+                models.Q(balance_qty__lte=models.F('reorder_level')),
+                output_field=models.BooleanField()
+            ),
+            expiring_count=Coalesce(models.Subquery(expiring_count), models.Value(0)),
+        )
+
+    def expiring_only(self, days=7):
+        """Items with at least one lot expiring within `days`"""
+        return self.filter(models.Exists(self.expiring_lots(days)))
+
+
 class Item(models.Model):
     """
     Item master (ingredients/products): code, name, category, unit, reorder_level, min_order_qty, is_perishable, shelf_life_days
@@ -411,11 +540,17 @@ class Item(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_items')
 
+    objects = ItemQuerySet.as_manager()
+
     class Meta:
         db_table = 'item'
         verbose_name = 'Item'
         verbose_name_plural = 'Items'
         ordering = ['code']
+        indexes = [
+            # Category filter walked in code order by item_list
+            models.Index(fields=['category', 'code'], name='item_category_code_idx'),
+        ]
 
     def __str__(self):
         return f"{self.code} - {self.name}"
@@ -423,23 +558,20 @@ class Item(models.Model):
     @staticmethod
     def generate_item_code():
         """Generate item code in format YYYYMM0001"""
-        from django.utils import timezone
-        now = timezone.now()
-        prefix = now.strftime('%Y%m')  # e.g., 202510 for October 2025
-        
-        # Get the last item code with this prefix
-        last_item = Item.objects.filter(code__startswith=prefix).order_by('code').last()
+        return Item.generate_item_codes(1)[0]
+    
+    @staticmethod
+    def generate_item_codes(count, month=None):
+        """Reserve `count` consecutive item codes for `month` (the current month by default), e.g. for bulk imports"""
+        prefix = (month or timezone.now()).strftime('%Y%m')  # e.g., 202510 for October 2025
         
-        if last_item:
-            # Extract the numeric part and increment
-            last_number = int(last_item.code[-4:])
-            new_number = last_number + 1
-        else:
-            # First item of the month
-            new_number = 1
+        def last_number():
+            # Codes issued before the month's counter existed
+            last_item = Item.objects.filter(code__startswith=prefix).order_by('code').last()
+            return int(last_item.code[-4:]) if last_item else 0
         
         # Format: YYYYMM0001
-        return f"{prefix}{new_number:04d}"
+        return [f"{prefix}{number:04d}" for number in SequenceCounter.reserve(f"item:{prefix}", count, start=last_number)]
     
     def save(self, *args, **kwargs):
         # Auto-generate code if not provided (new item)
@@ -493,6 +625,12 @@ class StockLot(models.Model):
         verbose_name = 'Stock Lot'
         verbose_name_plural = 'Stock Lots'
         ordering = ['-received_at']
+        indexes = [
+            # FEFO lot picking: item equality, then walked in expiry/receipt order
+            models.Index(fields=['item', 'expires_at', 'received_at'], name='lot_item_fefo_idx'),
+            # Expiring/expired lot reports range over expiry dates
+            models.Index(fields=['expires_at'], name='lot_expires_idx'),
+        ]
 
     def __str__(self):
         return f"{self.item.code} - Lot {self.lot_no} ({self.qty} {self.unit})"
@@ -557,6 +695,14 @@ class StockMovement(models.Model):
         verbose_name = 'Stock Movement'
         verbose_name_plural = 'Stock Movements'
         ordering = ['-timestamp']
+        indexes = [
+            # Production list/dashboard: one movement type over a time range, newest first
+            models.Index(fields=['movement_type', 'timestamp'], name='movement_type_ts_idx'),
+            # Item detail recent movements
+            models.Index(fields=['item', 'timestamp'], name='movement_item_ts_idx'),
+            # Rollup refresh date ranges and the recent movements feed
+            models.Index(fields=['timestamp'], name='movement_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_movement_type_display()} - {self.item.code} ({self.qty} {self.unit})"
@@ -570,6 +716,104 @@ class StockMovement(models.Model):
         return self.movement_type in ['consume', 'spoilage', 'transfer', 'damage']
 
 
+class ItemStockBalance(models.Model):
+    """
+    Materialized per-item stock balance (on-hand qty, value, lot count, earliest expiry, average cost).
+    Maintained by InventoryService in the same transaction as every lot change;
+    reconcile against StockLot with the rebuild_stock_balances command.
+    """
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='stock_balance')
+    on_hand_qty = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    on_hand_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    lot_count = models.PositiveIntegerField(default=0)
+    earliest_expiry = models.DateField(null=True, blank=True)
+    avg_unit_cost = models.DecimalField(max_digits=12, decimal_places=4, default=0, help_text="Weighted average cost of on-hand lots")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'item_stock_balance'
+        verbose_name = 'Item Stock Balance'
+        verbose_name_plural = 'Item Stock Balances'
+
+    def __str__(self):
+        return f"{self.item.code} - {self.on_hand_qty} on hand"
+
+
+class DailyMovementRollup(models.Model):
+    """
+    Pre-aggregated stock movements per day, item and movement type (count, qty, value at lot cost).
+    Maintained by InventoryService alongside every movement it records;
+    rebuild history with the backfill_movement_rollups command.
+    """
+    date = models.DateField()
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='daily_movement_rollups')
+    movement_type = models.CharField(max_length=20, choices=StockMovement.MOVEMENT_TYPES)
+    count = models.PositiveIntegerField(default=0)
+    qty = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'daily_movement_rollup'
+        verbose_name = 'Daily Movement Rollup'
+        verbose_name_plural = 'Daily Movement Rollups'
+        ordering = ['-date']
+        unique_together = ['date', 'item', 'movement_type']
+        indexes = [
+            models.Index(fields=['date', 'movement_type'], name='rollup_date_type_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.item.code} {self.movement_type} ({self.count})"
+
+
+class InventorySnapshot(models.Model):
+    """
+    Point-in-time on-hand quantity and value per item, written nightly by the snapshot_inventory command.
+    Items without stock on the snapshot date have no row.
+    """
+    date = models.DateField()
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='inventory_snapshots')
+    qty = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'inventory_snapshot'
+        verbose_name = 'Inventory Snapshot'
+        verbose_name_plural = 'Inventory Snapshots'
+        ordering = ['-date']
+        unique_together = ['date', 'item']
+
+    def __str__(self):
+        return f"{self.date} - {self.item.code} ({self.qty} on hand)"
+
+
+class RecipeQuerySet(models.QuerySet):
+    """
+    QuerySet for Recipe with cost rollup helpers
+    """
+    def with_cost(self):
+        """
+        Annotate recipes with total_cost (sum of loss-adjusted ingredient qty x cached
+        ingredient average cost) and ingredient_count, in one query
+        """
+        from django.db.models.functions import Coalesce
+        cost_field = models.DecimalField(max_digits=18, decimal_places=4)
+        hundred = models.Value(Decimal('100.0'), output_field=cost_field)
+        line_cost = models.ExpressionWrapper(
+            models.F('recipe_items__qty')
+            * (hundred + models.F('recipe_items__loss_factor'))
+            * models.F('recipe_items__ingredient__stock_balance__avg_unit_cost')
+            / hundred,
+            output_field=cost_field
+        )
+        return self.annotate(
+            total_cost=Coalesce(models.Sum(line_cost), models.Value(Decimal('0'), output_field=cost_field)),
+            ingredient_count=models.Count('recipe_items'),
+        )
+
+
 class Recipe(models.Model):
     """
     Recipe model (product, yield_qty, unit)
@@ -586,6 +830,8 @@ class Recipe(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_recipes')
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         db_table = 'recipe'
         verbose_name = 'Recipe'
@@ -691,6 +937,10 @@ class PurchaseOrder(models.Model):
         verbose_name = 'Purchase Order'
         verbose_name_plural = 'Purchase Orders'
         ordering = ['-created_at']
+        indexes = [
+            # Supplier portal status counts and newest-first order lists
+            models.Index(fields=['supplier', 'status', 'created_at'], name='po_supplier_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"PO-{self.order_no} - {self.supplier.name} ({self.get_status_display()})"
@@ -698,22 +948,19 @@ class PurchaseOrder(models.Model):
     @staticmethod
     def generate_order_no():
         """Generate unique order number in format PO-YYYYMMDD-XXXX"""
-        from django.utils import timezone
-        now = timezone.now()
-        prefix = f"PO-{now.strftime('%Y%m%d')}"
-        
-        # Get the last order with this prefix
-        last_order = PurchaseOrder.objects.filter(order_no__startswith=prefix).order_by('order_no').last()
+        return PurchaseOrder.generate_order_numbers(1)[0]
+    
+    @staticmethod
+    def generate_order_numbers(count, day=None):
+        """Reserve `count` consecutive order numbers for `day` (today by default)"""
+        prefix = f"PO-{(day or timezone.now()).strftime('%Y%m%d')}"
         
-        if last_order:
-            # Extract the numeric part and increment
-            last_number = int(last_order.order_no.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            # First order of the day
-            new_number = 1
+        def last_number():
+            # Orders numbered before the day's counter existed
+            last_order = PurchaseOrder.objects.filter(order_no__startswith=prefix).order_by('order_no').last()
+            return int(last_order.order_no.split('-')[-1]) if last_order else 0
         
-        return f"{prefix}-{new_number:04d}"
+        return [f"{prefix}-{number:04d}" for number in SequenceCounter.reserve(f"order:{prefix}", count, start=last_number)]
     
     def generate_qr_code(self):
         """Generate unique QR code for order tracking"""
@@ -738,9 +985,11 @@ class PurchaseOrder(models.Model):
         super().save(*args, **kwargs)
     
     def calculate_total(self):
-        """Calculate total order amount"""
-        total = sum(item.subtotal() for item in self.order_items.all())
-        return total
+        """Calculate total order amount (kept in total_amount by PurchaseOrderService.refresh_order_totals)"""
+        total = self.order_items.aggregate(
+            total=models.Sum(models.F('qty_ordered') * models.F('unit_price'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )['total']
+        return total or Decimal('0.00')
     
     def can_supplier_approve(self):
         """Check if supplier can approve order"""
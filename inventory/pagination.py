@@ -0,0 +1,142 @@
+"""
+Keyset (cursor) pagination for list views.
+
+Pages are selected with a WHERE on the view's ordering columns instead of COUNT(*) and OFFSET,
+so a deep page costs the same as the first one. Next/previous cursors are opaque tokens that
+encode the ordering values of the row a page continues from.
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import date, time
+from decimal import Decimal
+
+from django.db.models import F, Q
+
+
+class CursorPage:
+    """
+    One page of results with next/previous cursor tokens
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset by keyset on `ordering`, e.g. CursorPaginator(qs, ('-timestamp',)).
+    The primary key is appended as a tie-breaker, so ordering values need not be unique,
+    but they must not be NULL. Related lookups such as 'user__first_name' are supported.
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        if not any(field.lstrip('-') in ('pk', queryset.model._meta.pk.name) for field in self.ordering):
+            descending = self.ordering[-1].startswith('-') if self.ordering else False
+            self.ordering.append('-pk' if descending else 'pk')
+
+        # Ordering paths are exposed under plain aliases so keys can be read back from each row
+        self.keys = []
+        annotations = {}
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-')
+            path = field.lstrip('-')
+            if '__' in path:
+                alias = f'cursor_key_{index}'
+                annotations[alias] = F(path)
+                path = alias
+            self.keys.append((path, descending))
+        self.queryset = queryset.annotate(**annotations) if annotations else queryset
+
+    def get_page(self, cursor=None):
+        """Return the CursorPage for a token from a previous page (None or an invalid token: first page)"""
+        try:
+            values, reverse = decode_cursor(cursor) if cursor else (None, False)
+        except ValueError:
+            values, reverse = None, False
+        if values is not None and len(values) != len(self.keys):
+            values, reverse = None, False
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        order_by = [('-' if descending != reverse else '') + path for path, descending in self.keys]
+        rows = list(queryset.order_by(*order_by)[:self.per_page + 1])
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            if not has_more:
+                # Walked back to the start: show the real first page rather than a short one
+                return self.get_page()
+
+        has_next = has_more if not reverse else True
+        has_previous = values is not None if not reverse else has_more
+        return CursorPage(
+            rows,
+            next_cursor=encode_cursor(self._key(rows[-1]), False) if has_next and rows else None,
+            previous_cursor=encode_cursor(self._key(rows[0]), True) if has_previous and rows else None,
+        )
+
+    def _key(self, row):
+        if isinstance(row, dict):
+            return [row[path] for path, _ in self.keys]
+        return [getattr(row, path) for path, _ in self.keys]
+
+    def _after(self, values, reverse):
+        """Rows strictly beyond `values` in ordering order (before them when reverse)"""
+        condition = Q()
+        equal = Q()
+        for (path, descending), value in zip(self.keys, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{path}__{lookup}': value})
+            equal &= Q(**{path: value})
+        return condition
+
+
+def _encode_value(value):
+    # isoformat keeps microseconds, which DjangoJSONEncoder would truncate
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def encode_cursor(values, reverse=False):
+    """Opaque URL-safe token for a page boundary"""
+    payload = json.dumps({'k': [_encode_value(value) for value in values], 'r': int(reverse)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; raises ValueError for a malformed token"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return list(payload['k']), bool(payload['r'])
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
@@ -0,0 +1,143 @@
+"""
+Ranked search over items, suppliers and users.
+
+On MySQL, matches come from the FULLTEXT indexes added in migration 0018 (MATCH ... AGAINST in
+boolean mode with prefix terms, so partial words work for typeahead). Other backends, such as
+SQLite in tests, use an in-process trigram index per model that is rebuilt whenever the table
+changes. Either way the result is the caller's queryset narrowed to matches, annotated with
+search_rank and ordered best match first.
+"""
+import re
+import threading
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Case, Count, FloatField, Max, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Item, Supplier, User
+
+
+# model -> columns covered by its FULLTEXT index (order must match the index definition)
+SEARCH_FIELDS = {
+    Item: ('code', 'name', 'description'),
+    Supplier: ('name', 'contact_person', 'email'),
+    User: ('username', 'first_name', 'last_name', 'email'),
+}
+
+# InnoDB ignores words shorter than innodb_ft_min_token_size (3 by default)
+FULLTEXT_MIN_TOKEN = 3
+
+# Cap on fallback candidates turned into a SQL CASE expression
+TRIGRAM_LIMIT = 500
+TRIGRAM_THRESHOLD = 0.5
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search(queryset, query, limit=None):
+    """
+    Narrow `queryset` (items, suppliers or users) to rows matching `query`,
+    annotated with search_rank and ordered best first
+    """
+    fields = SEARCH_FIELDS[queryset.model]
+    words = [word.lower() for word in WORD_RE.findall(query or '')]
+    if not words:
+        return queryset.none()
+
+    if connection.vendor == 'mysql':
+        return _fulltext_search(queryset, fields, words)
+    return _trigram_search(queryset, fields, words, limit)
+
+
+def _fulltext_search(queryset, fields, words):
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    columns = ', '.join(f'{table}.{connection.ops.quote_name(field)}' for field in fields)
+    terms = [f'+{word}*' for word in words if len(word) >= FULLTEXT_MIN_TOKEN]
+    if not terms:
+        # Too short for the FULLTEXT index: fall back to a prefix match on the leading column
+        return queryset.filter(**{f'{fields[0]}__istartswith': ' '.join(words)}).annotate(
+            search_rank=Value(1.0, output_field=FloatField())
+        ).order_by(fields[0])
+
+    rank = RawSQL(f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)', [' '.join(terms)], output_field=FloatField())
+    return queryset.annotate(search_rank=rank).filter(search_rank__gt=0).order_by('-search_rank', 'pk')
+
+
+def _trigram_search(queryset, fields, words, limit):
+    ranked = TrigramIndex.for_model(queryset.model).search(words, limit or TRIGRAM_LIMIT)
+    if not ranked:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=pk, then=Value(score)) for pk, score in ranked],
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    return queryset.filter(pk__in=[pk for pk, _ in ranked]).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+def trigrams(word):
+    """Padded character trigrams of a word, as in PostgreSQL pg_trgm"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    In-memory trigram postings for one model's search fields. The index is rebuilt when the
+    table's row count or latest updated_at changes, which costs one aggregate query per search.
+    """
+    _indexes = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = SEARCH_FIELDS[model]
+        self.stamp = None
+        self.texts = {}
+        self.postings = {}
+
+    @classmethod
+    def for_model(cls, model):
+        with cls._lock:
+            index = cls._indexes.get(model)
+            if index is None:
+                index = cls._indexes[model] = cls(model)
+            index.refresh()
+            return index
+
+    def refresh(self):
+        stamp = self.model._default_manager.aggregate(count=Count('pk'), latest=Max('updated_at'))
+        if stamp == self.stamp:
+            return
+        texts = {}
+        postings = {}
+        for row in self.model._default_manager.values_list('pk', *self.fields):
+            text = ' '.join(str(value) for value in row[1:] if value).lower()
+            texts[row[0]] = text
+            for word in WORD_RE.findall(text):
+                for gram in trigrams(word):
+                    postings.setdefault(gram, set()).add(row[0])
+        self.texts, self.postings, self.stamp = texts, postings, stamp
+
+    def search(self, words, limit):
+        """Return [(pk, score)] best first; every query word must match a word in the row"""
+        scores = None
+        for word in words:
+            grams = trigrams(word)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.postings.get(gram, ()))
+            word_scores = {}
+            for pk, count in shared.items():
+                score = count / len(grams)
+                if word in self.texts[pk]:
+                    score += 1.0
+                if score >= TRIGRAM_THRESHOLD:
+                    word_scores[pk] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {pk: scores[pk] + score for pk, score in word_scores.items() if pk in scores}
+        ranked = sorted(scores.items(), key=lambda pair: (-pair[1], str(pair[0])))
+        return ranked[:limit]
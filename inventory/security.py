@@ -9,7 +9,12 @@ from django.utils.decorators import method_decorator
 from django.views.generic import View
 from functools import wraps
 import logging
-from .models import User, UserAccess, AuditLog
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from .models import User, UserAccess
+from .audit import record_audit_event
 from django.utils import timezone
 try:
     # Prefer zoneinfo from stdlib (Python 3.9+)
@@ -22,10 +27,10 @@ logger = logging.getLogger(__name__)
 
 def log_user_action(user, action_type, target_model, target_id=None, description="", request=None):
     """
-    Log user actions for audit trail
+    Log user actions for audit trail (buffered, see audit.AuditLogWriter)
     """
     try:
-        AuditLog.objects.create(
+        record_audit_event(
             user=user,
             action_type=action_type,
             target_model=target_model,
@@ -38,6 +43,90 @@ def log_user_action(user, action_type, target_model, target_id=None, description
         logger.error(f"Failed to create audit log: {e}")
 
 
+# Where resolved permission sets are kept between requests: 'session', 'cache' or None (request only)
+PERMISSION_CACHE = getattr(settings, 'PERMISSION_CACHE', 'session')
+PERMISSION_SESSION_KEY = '_inventory_permissions'
+
+
+def _permission_stamp(user):
+    """Version stamp of a user's grants; bumped by invalidate_user_permissions"""
+    return user.updated_at.isoformat() if user.updated_at else ''
+
+
+def _load_permission_entry(user):
+    """Load a user's active, non-expired permission types from UserAccess"""
+    now = timezone.now()
+    rows = UserAccess.objects.filter(user=user, is_active=True).filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+    ).values_list('permission_type', 'expires_at')
+    
+    permissions = []
+    valid_until = None
+    for permission_type, expires_at in rows:
+        permissions.append(permission_type)
+        if expires_at and (valid_until is None or expires_at < valid_until):
+            valid_until = expires_at
+    
+    return {
+        'user_id': str(user.pk),
+        'stamp': _permission_stamp(user),
+        'permissions': permissions,
+        'valid_until': valid_until.isoformat() if valid_until else None,
+    }
+
+
+def _entry_is_current(entry, user):
+    """Check a stored entry matches the user's version stamp and no grant in it has expired"""
+    if not entry or entry.get('user_id') != str(user.pk) or entry.get('stamp') != _permission_stamp(user):
+        return False
+    valid_until = entry.get('valid_until')
+    return valid_until is None or timezone.now() < datetime.fromisoformat(valid_until)
+
+
+def resolve_user_permissions(user, request=None):
+    """
+    Resolve the set of permission types granted to a user through UserAccess.
+    The result is memoized on the user object (request.user lives for one request) and,
+    when a request is given, backed by the session or cache per settings.PERMISSION_CACHE.
+    Stored sets are discarded when the user's version stamp changes or a grant expires.
+    """
+    memo = getattr(user, '_permission_entry', None)
+    if _entry_is_current(memo, user):
+        return memo['permission_set']
+    
+    entry = None
+    cache_key = f'user_permissions:{user.pk}'
+    if PERMISSION_CACHE == 'session' and request is not None and hasattr(request, 'session'):
+        entry = request.session.get(PERMISSION_SESSION_KEY)
+    elif PERMISSION_CACHE == 'cache':
+        entry = cache.get(cache_key)
+    
+    if not _entry_is_current(entry, user):
+        entry = _load_permission_entry(user)
+        if PERMISSION_CACHE == 'session' and request is not None and hasattr(request, 'session'):
+            request.session[PERMISSION_SESSION_KEY] = entry
+        elif PERMISSION_CACHE == 'cache':
+            cache.set(cache_key, entry)
+    
+    entry = dict(entry, permission_set=frozenset(entry['permissions']))
+    user._permission_entry = entry
+    return entry['permission_set']
+
+
+def invalidate_user_permissions(user):
+    """
+    Invalidate cached permission sets for a user (instance or id) after grants or revokes
+    by bumping the version stamp
+    """
+    user_id = getattr(user, 'pk', user)
+    now = timezone.now()
+    User.objects.filter(pk=user_id).update(updated_at=now)
+    if isinstance(user, User):
+        user.updated_at = now
+        user.__dict__.pop('_permission_entry', None)
+    cache.delete(f'user_permissions:{user_id}')
+
+
 def role_required(allowed_roles):
     """
     Decorator to check user role
@@ -72,13 +161,7 @@ def permission_required(permission_type):
                 return view_func(request, *args, **kwargs)
             
             # Check specific permission
-            has_permission = UserAccess.objects.filter(
-                user=request.user,
-                permission_type=permission_type,
-                is_active=True
-            ).exists()
-            
-            if not has_permission:
+            if not check_user_permissions(request.user, permission_type, request=request):
                 messages.error(request, f"You don't have permission to perform this action.")
                 return redirect('inventory:dashboard')
             
@@ -263,7 +346,7 @@ def get_manila_now():
     return now
 
 
-def check_user_permissions(user, permission_type):
+def check_user_permissions(user, permission_type, request=None):
     """
     Check if user has specific permission
     """
@@ -272,11 +355,7 @@ def check_user_permissions(user, permission_type):
         return True
     
     # Check specific permission
-    return UserAccess.objects.filter(
-        user=user,
-        permission_type=permission_type,
-        is_active=True
-    ).exists()
+    return permission_type in resolve_user_permissions(user, request=request)
 
 
 def can_manage_user(current_user, target_user):
@@ -295,7 +374,7 @@ def can_manage_user(current_user, target_user):
     return False
 
 
-def get_user_permissions(user):
+def get_user_permissions(user, request=None):
     """
     Get all permissions for a user
     """
@@ -310,7 +389,7 @@ def get_user_permissions(user):
                       if choice[0] not in ['user_write', 'user_delete']]
     else:
         # Staff permissions from UserAccess
-        user_accesses = UserAccess.objects.filter(user=user, is_active=True)
-        permissions = [access.permission_type for access in user_accesses]
+        granted = resolve_user_permissions(user, request=request)
+        permissions = [choice[0] for choice in UserAccess.PERMISSION_TYPES if choice[0] in granted]
     
     return permissions
@@ -1,11 +1,15 @@
 """
 Inventory management services for FEFO/FIFO logic and stock calculations
 """
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, OuterRef, PositiveIntegerField, Prefetch, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from decimal import Decimal
-from .models import Item, StockLot, StockMovement, Recipe, RecipeItem, Supplier, PurchaseOrder, PurchaseOrderItem
+from bisect import bisect_right
+from .models import Item, ItemStockBalance, DailyMovementRollup, InventorySnapshot, SequenceCounter, StockLot, StockMovement, Recipe, RecipeItem, Supplier, PurchaseOrder, PurchaseOrderItem
 
 
 class InventoryService:
@@ -14,10 +18,11 @@ class InventoryService:
     """
     
     @staticmethod
-    def get_available_lots(item, qty_needed=None):
+    def get_available_lots(item, qty_needed=None, lock=False):
         """
         Get available stock lots for an item using FEFO (First Expiry, First Out) logic
         Falls back to FIFO (First In, First Out) for non-perishable items
+        With lock=True the lots are row-locked (SELECT ... FOR UPDATE) until the transaction ends
         """
         if item.is_perishable:
             # FEFO: Order by expiry date (earliest first), then by received date
@@ -32,6 +37,9 @@ class InventoryService:
                 qty__gt=0
             ).order_by('received_at')
         
+        if lock:
+            lots = lots.select_for_update()
+        
         if qty_needed:
             # Filter lots that have enough quantity
             available_lots = []
@@ -49,14 +57,20 @@ class InventoryService:
         return lots
     
     @staticmethod
-    def calculate_consumption_lots(item, qty_needed):
+    def allocate_lots(lots, qty_needed, preferred_lot=None):
         """
-        Calculate which lots to consume and how much from each lot
+        Plan consumption across lots already in FEFO/FIFO order, starting from
+        preferred_lot when given and overflowing to the next lots
         Returns list of tuples: (lot, qty_to_consume)
         """
-        lots = InventoryService.get_available_lots(item, qty_needed)
+        qty_needed = Decimal(str(qty_needed))
+        lots = list(lots)
+        if preferred_lot is not None:
+            # Move the preferred lot to the front, keeping the locked instance
+            lots.sort(key=lambda lot: lot.pk != preferred_lot.pk)
+        
         consumption_plan = []
-        remaining_qty = Decimal(str(qty_needed))
+        remaining_qty = qty_needed
         
         for lot in lots:
             if remaining_qty <= 0:
@@ -72,86 +86,80 @@ class InventoryService:
         
         return consumption_plan
     
+    @staticmethod
+    def calculate_consumption_lots(item, qty_needed, lot=None, lock=False):
+        """
+        Calculate which lots to consume and how much from each lot
+        Returns list of tuples: (lot, qty_to_consume)
+        """
+        lots = InventoryService.get_available_lots(item, lock=lock)
+        return InventoryService.allocate_lots(lots, qty_needed, preferred_lot=lot)
+    
+    @staticmethod
+    def apply_lot_decrements(consumption_plan):
+        """
+        Decrement lot quantities in the database with F() expressions.
+        Each UPDATE only matches while the lot still holds enough stock, so a lot can never go negative.
+        """
+        for lot, qty_to_consume in consumption_plan:
+            updated = StockLot.objects.filter(
+                pk=lot.pk,
+                qty__gte=qty_to_consume
+            ).update(qty=F('qty') - qty_to_consume)
+            
+            if not updated:
+                raise ValueError(f"Insufficient stock in lot {lot.lot_no}. Need {qty_to_consume}")
+            
+            lot.qty -= qty_to_consume
+    
     @staticmethod
     @transaction.atomic
     def consume_stock(item, qty, reason, user, lot=None, ref_no=None, notes=None):
         """
-        Consume stock from inventory with automatic overflow to next lots
+        Consume stock from inventory with automatic overflow to next lots.
+        Candidate lots are locked in FEFO/FIFO order so concurrent consumers
+        of the same item serialize instead of over-drawing a lot.
         """
         qty = Decimal(str(qty))
-        remaining_qty = qty
+        InventoryService.lock_stock_balances([item])
         
-        if lot:
-            # Start consuming from specific lot, overflow to next lots if needed
-            # First, consume what we can from the selected lot
-            qty_from_selected = min(lot.qty, remaining_qty)
-            
-            if qty_from_selected > 0:
-                lot.qty -= qty_from_selected
-                lot.save()
-                
-                # Create movement record for selected lot
-                StockMovement.objects.create(
-                    item=item,
-                    lot=lot,
-                    movement_type='consume',
-                    qty=qty_from_selected,
-                    unit=item.unit,
-                    reason=reason,
-                    ref_no=ref_no,
-                    notes=notes,
-                    created_by=user
-                )
-                
-                remaining_qty -= qty_from_selected
-            
-            # If still need more, consume from other lots using FEFO/FIFO
-            if remaining_qty > 0:
-                # Get other available lots (excluding the one we just used)
-                consumption_plan = InventoryService.calculate_consumption_lots(item, remaining_qty)
-                
-                for next_lot, qty_to_consume in consumption_plan:
-                    # Skip the lot we already consumed from
-                    if next_lot.id == lot.id:
-                        continue
-                    
-                    # Update lot quantity
-                    next_lot.qty -= qty_to_consume
-                    next_lot.save()
-                    
-                    # Create movement record
-                    StockMovement.objects.create(
-                        item=item,
-                        lot=next_lot,
-                        movement_type='consume',
-                        qty=qty_to_consume,
-                        unit=item.unit,
-                        reason=reason,
-                        ref_no=ref_no,
-                        notes=f"{notes} (overflow from lot {lot.lot_no})" if notes else f"Overflow from lot {lot.lot_no}",
-                        created_by=user
-                    )
-        else:
-            # Auto-select lots using FEFO/FIFO
-            consumption_plan = InventoryService.calculate_consumption_lots(item, qty)
+        consumption_plan = InventoryService.calculate_consumption_lots(item, qty, lot=lot, lock=True)
+        InventoryService.apply_lot_decrements(consumption_plan)
+        
+        movements = []
+        for consumed_lot, qty_to_consume in consumption_plan:
+            movement_notes = notes
+            if lot and consumed_lot.pk != lot.pk:
+                movement_notes = f"{notes} (overflow from lot {lot.lot_no})" if notes else f"Overflow from lot {lot.lot_no}"
             
-            for lot, qty_to_consume in consumption_plan:
-                # Update lot quantity
-                lot.qty -= qty_to_consume
-                lot.save()
-                
-                # Create movement record
-                StockMovement.objects.create(
-                    item=item,
-                    lot=lot,
-                    movement_type='consume',
-                    qty=qty_to_consume,
-                    unit=item.unit,
-                    reason=reason,
-                    ref_no=ref_no,
-                    notes=notes,
-                    created_by=user
-                )
+            movements.append(StockMovement(
+                item=item,
+                lot=consumed_lot,
+                movement_type='consume',
+                qty=qty_to_consume,
+                unit=item.unit,
+                reason=reason,
+                ref_no=ref_no,
+                notes=movement_notes,
+                created_by=user
+            ))
+        StockMovement.objects.bulk_create(movements)
+        
+        if lot:
+            # Keep the caller's instance in step with the database
+            lot.qty = next((l.qty for l, _ in consumption_plan if l.pk == lot.pk), lot.qty)
+        
+        InventoryService.refresh_stock_balances([item])
+        InventoryService.record_movement_rollups(movements)
+    
+    @staticmethod
+    def generate_lot_numbers(prefix, count=1, item=None):
+        """
+        Reserve `count` unique lot numbers PREFIX-[ITEMCODE-]YYYYMMDD-0001 from the day's sequence for `prefix`
+        """
+        day = timezone.localdate().strftime('%Y%m%d')
+        middle = f"{item.code}-{day}" if item else day
+        return [f"{prefix}-{middle}-{number:04d}" for number in SequenceCounter.reserve(f"lot:{prefix}-{day}", count)]
     
     @staticmethod
     @transaction.atomic
@@ -160,6 +168,8 @@ class InventoryService:
         """
         Receive stock into inventory
         """
+        InventoryService.lock_stock_balances([item])
+        
         # Create stock lot
         lot = StockLot.objects.create(
             item=item,
@@ -174,7 +184,7 @@ class InventoryService:
         )
         
         # Create movement record
-        StockMovement.objects.create(
+        movement = StockMovement.objects.create(
             item=item,
             lot=lot,
             movement_type='receive',
@@ -185,15 +195,43 @@ class InventoryService:
             created_by=user
         )
         
+        InventoryService.refresh_stock_balances([item])
+        InventoryService.record_movement_rollups([movement])
+        
         return lot
     
     @staticmethod
-    @transaction.atomic
-    def produce_stock(recipe, production_qty, lot_no, user, expires_at=None, notes=None, unit_cost=None):
+    def get_lot_pool(items, lock=False):
         """
-        Produce stock using recipe with optional unit cost
+        Fetch available lots for several items in one query
+        Returns dict of item_id -> lots in FEFO/FIFO order
+        """
+        items = list(items)
+        lots = StockLot.objects.filter(
+            item_id__in=[item.id for item in items],
+            qty__gt=0
+        ).order_by('item_id', 'expires_at', 'received_at')
+        
+        if lock:
+            lots = lots.select_for_update()
+        
+        pool = {item.id: [] for item in items}
+        for lot in lots:
+            pool[lot.item_id].append(lot)
+        
+        for item in items:
+            if not item.is_perishable:
+                # FIFO for non-perishable items
+                pool[item.id].sort(key=lambda lot: lot.received_at)
+        
+        return pool
+    
+    @staticmethod
+    def get_required_ingredients(recipe, production_qty):
+        """
+        Calculate ingredient quantities (including loss factor) for a production run
+        Returns list of dicts with ingredient, qty and unit
         """
-        # Calculate required ingredients
         required_ingredients = []
         for recipe_item in recipe.recipe_items.all():
             # Calculate quantity needed (including loss factor)
@@ -202,58 +240,50 @@ class InventoryService:
             
             required_ingredients.append({
                 'ingredient': recipe_item.ingredient,
-                'qty': qty_needed,
+                'qty': Decimal(str(qty_needed)),
                 'unit': recipe_item.unit
             })
         
-        # Check if all ingredients are available
+        return required_ingredients
+    
+    @staticmethod
+    def plan_ingredient_consumption(required_ingredients, pool):
+        """
+        Plan consumption for every ingredient against an in-memory lot pool.
+        Lot quantities in the pool are decremented so the pool can be reused by later plans.
+        Returns list of tuples: (ingredient, lot, qty_to_consume)
+        """
         for ingredient_data in required_ingredients:
             ingredient = ingredient_data['ingredient']
-            qty_needed = Decimal(str(ingredient_data['qty']))
-            
-            available_stock = sum(lot.qty for lot in InventoryService.get_available_lots(ingredient))
-            if available_stock < qty_needed:
-                raise ValueError(f"Insufficient stock for {ingredient.name}. Need: {qty_needed}, Available: {available_stock}")
+            available_stock = sum(lot.qty for lot in pool[ingredient.id])
+            if available_stock < ingredient_data['qty']:
+                raise ValueError(f"Insufficient stock for {ingredient.name}. Need: {ingredient_data['qty']}, Available: {available_stock}")
         
-        # Consume ingredients
+        plan = []
         for ingredient_data in required_ingredients:
             ingredient = ingredient_data['ingredient']
-            qty_needed = Decimal(str(ingredient_data['qty']))
-            
-            InventoryService.consume_stock(
-                item=ingredient,
-                qty=qty_needed,
-                reason=f"Production: {recipe.name}",
-                user=user,
-                ref_no=f"PROD-{recipe.id}",
-                notes=f"Used in production of {recipe.product.name}"
-            )
-        
-        # Create produced stock lot
-        produced_lot = StockLot.objects.create(
-            item=recipe.product,
-            lot_no=lot_no,
-            qty=production_qty,
-            unit=recipe.yield_unit,
-            unit_cost=unit_cost or 0,
-            expires_at=expires_at,
-            notes=notes,
-            created_by=user
-        )
+            for lot, qty_to_consume in InventoryService.allocate_lots(pool[ingredient.id], ingredient_data['qty']):
+                lot.qty -= qty_to_consume
+                plan.append((ingredient, lot, qty_to_consume))
         
-        # Create movement record for production
-        StockMovement.objects.create(
-            item=recipe.product,
-            lot=produced_lot,
-            movement_type='produce',
-            qty=production_qty,
-            unit=recipe.yield_unit,
-            ref_no=f"PROD-{recipe.id}",
-            notes=f"Produced using recipe: {recipe.name}",
-            created_by=user
-        )
+        return plan
+    
+    @staticmethod
+    @transaction.atomic
+    def produce_stock(recipe, production_qty, lot_no, user, expires_at=None, notes=None, unit_cost=None):
+        """
+        Produce stock using recipe with optional unit cost
+        """
+        results = ProductionService.produce_batch([{
+            'recipe': recipe,
+            'production_qty': production_qty,
+            'lot_no': lot_no,
+            'expires_at': expires_at,
+            'notes': notes,
+            'unit_cost': unit_cost,
+        }], user)
         
-        return produced_lot
+        return results[0]['lot']
     
     @staticmethod
     @transaction.atomic
@@ -262,13 +292,14 @@ class InventoryService:
         Adjust stock (increase or decrease)
         """
         qty = Decimal(str(qty))
+        InventoryService.lock_stock_balances([item])
         
         if lot:
-            # Adjust specific lot
-            lot.qty += qty
-            if lot.qty < 0:
+            # Adjust specific lot in the database; a decrease only matches while the lot holds enough stock
+            updated = StockLot.objects.filter(pk=lot.pk, qty__gte=max(-qty, 0)).update(qty=F('qty') + qty)
+            if not updated:
                 raise ValueError("Lot quantity cannot be negative")
-            lot.save()
+            lot.refresh_from_db(fields=['qty'])
         else:
             # For negative adjustments, consume from available lots
             if qty < 0:
@@ -283,7 +314,7 @@ class InventoryService:
                 return
             
             # For positive adjustments, create new lot
-            lot_no = f"ADJ-{timezone.now().strftime('%Y%m%d-%H%M%S')}"
+            lot_no = InventoryService.generate_lot_numbers('ADJ')[0]
             lot = StockLot.objects.create(
                 item=item,
                 lot_no=lot_no,
@@ -294,7 +325,7 @@ class InventoryService:
             )
         
         # Create movement record
-        StockMovement.objects.create(
+        movement = StockMovement.objects.create(
             item=item,
             lot=lot,
             movement_type='adjust',
@@ -305,26 +336,289 @@ class InventoryService:
             notes=notes,
             created_by=user
         )
+        
+        InventoryService.refresh_stock_balances([item])
+        InventoryService.record_movement_rollups([movement])
+    
+    @staticmethod
+    @transaction.atomic
+    def log_damage(item, qty, unit, reason, user, lot=None, ref_no=None, notes=None):
+        """
+        Log damaged or lost stock, deducting it from the lot when one is given
+        """
+        InventoryService.lock_stock_balances([item])
+        
+        if lot:
+            # Deduct with F() so concurrent logs against the same lot cannot overwrite each other or overdraw it
+            InventoryService.apply_lot_decrements([(lot, Decimal(str(qty)))])
+            lot.refresh_from_db(fields=['qty'])
+        
+        movement = StockMovement.objects.create(
+            item=item,
+            lot=lot,
+            movement_type='damage',
+            qty=qty,
+            unit=unit,
+            reason=reason,
+            ref_no=ref_no,
+            notes=notes,
+            created_by=user
+        )
+        
+        InventoryService.refresh_stock_balances([item])
+        InventoryService.record_movement_rollups([movement])
+        
+        return movement
+    
+    @staticmethod
+    def lock_stock_balances(items):
+        """
+        Row-lock the ItemStockBalance rows of the given items (Item instances or ids) until the transaction ends,
+        creating the rows that do not exist yet. Stock operations take this lock before they touch any lot,
+        so concurrent changes to the same item run one after another.
+        """
+        item_ids = sorted({getattr(item, 'pk', item) for item in items})
+        if not item_ids:
+            return
+        
+        # Lock in item order so transactions touching several items cannot deadlock
+        locked = set(
+            ItemStockBalance.objects.select_for_update().filter(item_id__in=item_ids).order_by('item_id').values_list('item_id', flat=True)
+        )
+        missing = [item_id for item_id in item_ids if item_id not in locked]
+        if missing:
+            ItemStockBalance.objects.bulk_create([ItemStockBalance(item_id=item_id) for item_id in missing], ignore_conflicts=True)
+            # Rows another transaction inserted first still need our lock
+            list(ItemStockBalance.objects.select_for_update().filter(item_id__in=missing).order_by('item_id').values_list('item_id', flat=True))
+    
+    @staticmethod
+    @transaction.atomic
+    def refresh_stock_balances(items):
+        """
+        Recalculate the materialized ItemStockBalance rows (including the cached average cost)
+        for the given items (Item instances or ids) from their stock lots and write them with one upsert.
+        The balance rows are locked first and the lots are read with a locking read, which returns the latest
+        committed lots even under MySQL's REPEATABLE READ snapshot, so concurrent operations cannot
+        overwrite each other's totals. Call inside the transaction that changed the lots.
+        """
+        item_ids = {getattr(item, 'pk', item) for item in items}
+        if not item_ids:
+            return []
+        
+        InventoryService.lock_stock_balances(item_ids)
+        
+        totals = {}
+        lots = StockLot.objects.select_for_update().filter(item_id__in=item_ids, qty__gt=0).order_by().values_list(
+            'item_id', 'qty', 'unit_cost', 'expires_at'
+        )
+        for item_id, qty, unit_cost, expires_at in lots:
+            row = totals.setdefault(item_id, {'total_qty': Decimal('0'), 'total_value': Decimal('0'), 'lot_count': 0, 'earliest_expiry': None})
+            row['total_qty'] += qty
+            row['total_value'] += qty * unit_cost
+            row['lot_count'] += 1
+            if expires_at and (row['earliest_expiry'] is None or expires_at < row['earliest_expiry']):
+                row['earliest_expiry'] = expires_at
+        
+        cents = Decimal('0.01')
+        balances = []
+        for item_id in item_ids:
+            row = totals.get(item_id, {})
+            total_qty = Decimal(row.get('total_qty') or 0)
+            total_value = Decimal(row.get('total_value') or 0)
+            balances.append(ItemStockBalance(
+                item_id=item_id,
+                on_hand_qty=total_qty.quantize(cents),
+                on_hand_value=total_value.quantize(cents),
+                lot_count=row.get('lot_count') or 0,
+                earliest_expiry=row.get('earliest_expiry'),
+                avg_unit_cost=(total_value / total_qty).quantize(Decimal('0.0001')) if total_qty > 0 else Decimal('0'),
+            ))
+        
+        # MySQL upserts on any unique key and rejects an explicit conflict target
+        unique_fields = ['item'] if connection.features.supports_update_conflicts_with_target else None
+        return ItemStockBalance.objects.bulk_create(
+            balances,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['on_hand_qty', 'on_hand_value', 'lot_count', 'earliest_expiry', 'avg_unit_cost', 'updated_at'],
+        )
+    
+    @staticmethod
+    def record_movement_rollups(movements):
+        """
+        Add newly written StockMovements to their DailyMovementRollup buckets (local date, item, movement type).
+        The buckets are row-locked, missing ones created empty, then all of them incremented with one
+        UPDATE ... SET count = count + n, qty = qty + q, value = value + v, so concurrent movements
+        add up instead of overwriting each other. Call inside the transaction that wrote the movements.
+        """
+        deltas = {}
+        for movement in movements:
+            key = (timezone.localdate(movement.timestamp), movement.item_id, movement.movement_type)
+            qty = Decimal(str(movement.qty))
+            unit_cost = Decimal(str(movement.lot.unit_cost)) if movement.lot_id else Decimal('0')
+            count, total_qty, total_value = deltas.get(key, (0, Decimal('0'), Decimal('0')))
+            deltas[key] = (count + 1, total_qty + qty, total_value + qty * unit_cost)
+        if not deltas:
+            return
+        
+        def lock(keys):
+            dates, item_ids, movement_types = (set(values) for values in zip(*keys))
+            rows = DailyMovementRollup.objects.select_for_update().filter(
+                date__in=dates, item_id__in=item_ids, movement_type__in=movement_types
+            ).order_by('date', 'item_id', 'movement_type').values_list('pk', 'date', 'item_id', 'movement_type')
+            return {(date, item_id, movement_type): pk for pk, date, item_id, movement_type in rows}
+        
+        buckets = lock(deltas)
+        missing = [key for key in deltas if key not in buckets]
+        if missing:
+            DailyMovementRollup.objects.bulk_create([
+                DailyMovementRollup(date=date, item_id=item_id, movement_type=movement_type)
+                for date, item_id, movement_type in missing
+            ], ignore_conflicts=True)
+            # Buckets another transaction created first still need our lock
+            buckets.update(lock(missing))
+        
+        cents = Decimal('0.01')
+        deltas = {
+            key: (count, total_qty.quantize(cents), total_value.quantize(cents))
+            for key, (count, total_qty, total_value) in deltas.items()
+        }
+        
+        def increment(field, index, output_field):
+            return F(field) + Case(
+                *[When(pk=buckets[key], then=Value(delta[index])) for key, delta in deltas.items()],
+                default=Value(0),
+                output_field=output_field
+            )
+        
+        DailyMovementRollup.objects.filter(pk__in=[buckets[key] for key in deltas]).update(
+            count=increment('count', 0, PositiveIntegerField()),
+            qty=increment('qty', 1, DecimalField(max_digits=14, decimal_places=2)),
+            value=increment('value', 2, DecimalField(max_digits=16, decimal_places=2)),
+            updated_at=timezone.now()
+        )
+    
+    @staticmethod
+    def refresh_movement_rollups(items=None, start_date=None, end_date=None):
+        """
+        Recalculate DailyMovementRollup buckets for the given items (all items when None)
+        and local dates (today by default) from StockMovement with one grouped query and one upsert.
+        Buckets in range that no longer have movements are removed.
+        Used by the backfill_movement_rollups command to rebuild history; stock operations
+        increment their buckets with record_movement_rollups instead.
+        """
+        start_date = start_date or timezone.localdate()
+        end_date = end_date or start_date
+        
+        movements = StockMovement.objects.filter(
+            timestamp__gte=timezone.make_aware(datetime.combine(start_date, time.min)),
+            timestamp__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+        )
+        existing = DailyMovementRollup.objects.filter(date__gte=start_date, date__lte=end_date)
+        if items is not None:
+            item_ids = {getattr(item, 'pk', item) for item in items}
+            if not item_ids:
+                return []
+            movements = movements.filter(item_id__in=item_ids)
+            existing = existing.filter(item_id__in=item_ids)
+        
+        rows = movements.order_by().annotate(date=TruncDate('timestamp')).values(
+            'date', 'item_id', 'movement_type'
+        ).annotate(
+            movement_count=Count('id'),
+            total_qty=Sum('qty'),
+            total_value=Sum(ExpressionWrapper(
+                F('qty') * Coalesce(F('lot__unit_cost'), Value(Decimal('0'))),
+                output_field=DecimalField(max_digits=18, decimal_places=4)
+            )),
+        )
+        
+        cents = Decimal('0.01')
+        rollups = [
+            DailyMovementRollup(
+                date=row['date'],
+                item_id=row['item_id'],
+                movement_type=row['movement_type'],
+                count=row['movement_count'],
+                qty=Decimal(row['total_qty'] or 0).quantize(cents),
+                value=Decimal(row['total_value'] or 0).quantize(cents),
+            )
+            for row in rows.iterator()
+        ]
+        
+        keys = {(rollup.date, rollup.item_id, rollup.movement_type) for rollup in rollups}
+        stale = [
+            pk for pk, date, item_id, movement_type
+            in existing.values_list('pk', 'date', 'item_id', 'movement_type')
+            if (date, item_id, movement_type) not in keys
+        ]
+        if stale:
+            DailyMovementRollup.objects.filter(pk__in=stale).delete()
+        
+        # MySQL upserts on any unique key and rejects an explicit conflict target
+        unique_fields = ['date', 'item', 'movement_type'] if connection.features.supports_update_conflicts_with_target else None
+        return DailyMovementRollup.objects.bulk_create(
+            rollups,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['count', 'qty', 'value', 'updated_at'],
+        )
+    
+    @staticmethod
+    @transaction.atomic
+    def snapshot_inventory(snapshot_date=None):
+        """
+        Record the current materialized balances of every item with stock as InventorySnapshot
+        rows for snapshot_date (today by default) in one bulk insert, replacing any earlier
+        snapshot for that date. Returns the number of rows written.
+        """
+        snapshot_date = snapshot_date or timezone.localdate()
+        
+        InventorySnapshot.objects.filter(date=snapshot_date).delete()
+        balances = ItemStockBalance.objects.exclude(on_hand_qty=0, on_hand_value=0).values_list(
+            'item_id', 'on_hand_qty', 'on_hand_value'
+        )
+        snapshots = InventorySnapshot.objects.bulk_create([
+            InventorySnapshot(date=snapshot_date, item_id=item_id, qty=qty, value=value)
+            for item_id, qty, value in balances.iterator()
+        ])
+        
+        return len(snapshots)
+    
+    @staticmethod
+    def get_snapshot_date(on_date):
+        """
+        Latest snapshot date on or before on_date, or None when no snapshot was taken by then
+        """
+        return InventorySnapshot.objects.filter(date__lte=on_date).order_by('-date').values_list('date', flat=True).first()
+    
+    @staticmethod
+    def get_inventory_on(on_date):
+        """
+        What was on hand on a date: snapshot rows from the latest snapshot on or before on_date
+        """
+        snapshot_date = InventoryService.get_snapshot_date(on_date)
+        return InventorySnapshot.objects.filter(date=snapshot_date).select_related('item')
     
     @staticmethod
     def get_low_stock_items():
         """
         Get items that are below reorder level
         """
-        low_stock_items = []
-        items = Item.objects.filter(is_active=True)
-        
-        for item in items:
-            current_stock = item.get_current_stock()
-            if current_stock <= item.reorder_level:
-                low_stock_items.append({
-                    'item': item,
-                    'current_stock': current_stock,
-                    'reorder_level': item.reorder_level,
-                    'shortage': item.reorder_level - current_stock
-                })
+        items = Item.objects.filter(is_active=True).with_stock_balance().filter(
+            balance_qty__lte=F('reorder_level')
+        )
         
-        return low_stock_items
+        return [
+            {
+                'item': item,
+                'current_stock': item.balance_qty,
+                'reorder_level': item.reorder_level,
+                'shortage': item.reorder_level - item.balance_qty
+            }
+            for item in items
+        ]
     
     @staticmethod
     def get_expiring_items(days=7):
@@ -359,24 +653,102 @@ class InventoryService:
     @staticmethod
     def calculate_item_cost(item):
         """
-        Calculate weighted average cost for an item
+        Weighted average cost for an item, read from its cached stock balance
         """
-        lots = StockLot.objects.filter(item=item, qty__gt=0)
+        cost = ItemStockBalance.objects.filter(item=item).values_list('avg_unit_cost', flat=True).first()
+        return cost if cost is not None else Decimal('0.00')
+    
+    @staticmethod
+    def calculate_item_costs(item_ids):
+        """
+        Weighted average cost for many items (Item instances or ids), read from their cached stock balances
+        with one query. Returns dict of item_id -> cost; items without a balance map to 0.
+        """
+        item_ids = {getattr(item_id, 'pk', item_id) for item_id in item_ids}
+        costs = {item_id: Decimal('0.00') for item_id in item_ids}
+        if not item_ids:
+            return costs
         
-        if not lots.exists():
-            return Decimal('0.00')
+        costs.update(ItemStockBalance.objects.filter(item_id__in=item_ids).values_list('item_id', 'avg_unit_cost'))
+        return costs
+    
+    @staticmethod
+    def get_movement_totals(item_ids=None, start_date=None, end_date=None):
+        """
+        Consumed, received, produced and adjusted quantities per item in a date range
+        with one grouped query over StockMovement.
+        Returns dict of item_id -> totals dict.
+        """
+        movements = StockMovement.objects.filter(
+            movement_type__in=['consume', 'receive', 'produce', 'adjust']
+        )
+        if item_ids is not None:
+            movements = movements.filter(item_id__in=item_ids)
+        if start_date:
+            movements = movements.filter(timestamp__date__gte=start_date)
+        if end_date:
+            movements = movements.filter(timestamp__date__lte=end_date)
         
-        total_cost = Decimal('0.00')
-        total_qty = Decimal('0.00')
+        def total_for(movement_type):
+            return Sum(Case(
+                When(movement_type=movement_type, then=F('qty')),
+                default=Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            ))
         
-        for lot in lots:
-            total_cost += lot.qty * lot.unit_cost
-            total_qty += lot.qty
+        rows = movements.order_by().values('item_id').annotate(
+            consumed=total_for('consume'),
+            received=total_for('receive'),
+            produced=total_for('produce'),
+            adjusted=total_for('adjust'),
+        )
+        return {row['item_id']: row for row in rows.iterator()}
+    
+    @staticmethod
+    def get_stock_report(category=None, low_stock_only=False, start_date=None, end_date=None, expiring_days=7):
+        """
+        Yield stock report rows for active items: stock, cost and value from the materialized
+        balance, expiring lot count, and movement totals for the date range.
+        Runs two queries regardless of the number of items and streams items in chunks.
+        """
+        expiry_date = timezone.now().date() + timedelta(days=expiring_days)
+        expiring_lots = StockLot.objects.filter(
+            item=OuterRef('pk'),
+            qty__gt=0,
+            expires_at__lte=expiry_date,
+            expires_at__isnull=False
+        ).order_by().values('item').annotate(count=Count('id')).values('count')
+        
+        items = Item.objects.filter(is_active=True).with_stock_balance().annotate(
+            unit_cost=Coalesce(F('stock_balance__avg_unit_cost'), Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=4))),
+            expiring_soon=Coalesce(Subquery(expiring_lots), 0),
+        ).order_by('code')
+        
+        if category:
+            items = items.filter(category=category)
+        if low_stock_only:
+            items = items.filter(balance_qty__lte=F('reorder_level'))
         
-        if total_qty > 0:
-            return total_cost / total_qty
+        movement_totals = InventoryService.get_movement_totals(
+            item_ids=items.values('id'), start_date=start_date, end_date=end_date
+        )
+        zero = Decimal('0.00')
         
-        return Decimal('0.00')
+        for item in items.iterator(chunk_size=2000):
+            totals = movement_totals.get(item.id, {})
+            yield {
+                'item': item,
+                'current_stock': item.balance_qty,
+                'reorder_level': item.reorder_level,
+                'is_low_stock': item.balance_qty <= item.reorder_level,
+                'expiring_soon': item.expiring_soon,
+                'unit_cost': item.unit_cost,
+                'item_value': item.balance_qty * item.unit_cost,
+                'consumed': totals.get('consumed') or zero,
+                'received': totals.get('received') or zero,
+                'produced': totals.get('produced') or zero,
+                'adjusted': totals.get('adjusted') or zero,
+            }
     
     @staticmethod
     def get_stock_summary():
@@ -397,6 +769,167 @@ class InventoryService:
         }
 
 
+class DashboardMetricsService:
+    """
+    Service class for dashboard KPIs computed with a fixed number of grouped queries,
+    independent of catalogue size
+    """
+    
+    TREND_MONTHS = 6
+    SERIES_DAYS = 7
+    ACTIVITY_DAYS = 30
+    EXPIRY_DAYS = 30
+    
+    @staticmethod
+    def get_inventory_kpis():
+        """
+        Get product, stock status and finished goods KPIs in a single conditional aggregate
+        """
+        active = Q(is_active=True)
+        finished_good = active & Q(category='finished_good')
+        out_of_stock = Q(balance_qty=0)
+        low_stock = Q(balance_qty__gt=0, balance_qty__lte=F('reorder_level'))
+        
+        kpis = Item.objects.with_stock_balance().aggregate(
+            total_products=Count('id', filter=active),
+            total_value=Sum('balance_value'),
+            low_stock_count=Count('id', filter=active & low_stock),
+            out_of_stock_count=Count('id', filter=active & out_of_stock),
+            finished_goods_count=Count('id', filter=finished_good),
+            finished_goods_low_stock=Count('id', filter=finished_good & low_stock),
+            finished_goods_value=Sum('balance_value', filter=finished_good),
+        )
+        kpis['total_value'] = kpis['total_value'] or Decimal('0.00')
+        kpis['finished_goods_value'] = float(kpis['finished_goods_value'] or 0)
+        
+        return kpis
+    
+    @staticmethod
+    def get_value_trend(months=TREND_MONTHS, now=None, current_value=None):
+        """
+        Get stock value at 30-day steps over the last N months plus one month ago from
+        InventorySnapshot totals (latest snapshot on or before each date) in one grouped query.
+        The final point uses current_value when given, so today's figure is live.
+        Returns dict with keys: labels, values, prev_total_value
+        """
+        today = timezone.localdate(now) if now else timezone.localdate()
+        month_dates = [today - timedelta(days=30 * (months - 1 - i)) for i in range(months)]
+        prev_month_date = today - timedelta(days=30)
+        
+        rows = list(
+            InventorySnapshot.objects.filter(
+                date__gt=month_dates[0] - timedelta(days=30),
+                date__lte=today
+            ).order_by('date').values('date').annotate(total=Sum('value'))
+        )
+        snapshot_dates = [row['date'] for row in rows]
+        
+        def value_on(target):
+            index = bisect_right(snapshot_dates, target)
+            return rows[index - 1]['total'] if index else Decimal('0.00')
+        
+        values = [value_on(month_date) for month_date in month_dates]
+        if current_value is not None:
+            values[-1] = current_value
+        
+        return {
+            'labels': [month_date.strftime('%b') for month_date in month_dates],
+            'values': [float(value) for value in values],
+            'prev_total_value': value_on(prev_month_date),
+        }
+    
+    @staticmethod
+    def get_daily_movement_series(days=SERIES_DAYS, movement_types=('produce', 'consume', 'receive'), today=None):
+        """
+        Get daily movement counts per type over the last N days from DailyMovementRollup
+        in one range query
+        Returns dict with keys: labels and one list of counts per movement type
+        """
+        today = today or timezone.localdate()
+        dates = [today - timedelta(days=days - 1 - i) for i in range(days)]
+        
+        counts = {
+            (row['date'], row['movement_type']): row['total']
+            for row in DailyMovementRollup.objects.filter(
+                date__gte=dates[0],
+                date__lte=today,
+                movement_type__in=movement_types
+            ).order_by().values('date', 'movement_type').annotate(total=Sum('count'))
+        }
+        
+        series = {'labels': [date.strftime('%m/%d') for date in dates]}
+        for movement_type in movement_types:
+            series[movement_type] = [counts.get((date, movement_type), 0) for date in dates]
+        return series
+    
+    @staticmethod
+    def get_movement_activity(days=ACTIVITY_DAYS, top=5, today=None):
+        """
+        Get movement counts per type and the most consumed items over the last N days
+        from DailyMovementRollup
+        Returns dict with keys: counts (movement_type -> count), top_consumed
+        """
+        today = today or timezone.localdate()
+        rollups = DailyMovementRollup.objects.filter(date__gt=today - timedelta(days=days), date__lte=today)
+        
+        counts = {
+            row['movement_type']: row['total']
+            for row in rollups.order_by().values('movement_type').annotate(total=Sum('count'))
+        }
+        top_consumed = rollups.filter(movement_type='consume').values(
+            'item__name', 'item__code'
+        ).annotate(total_qty=Sum('qty')).order_by('-total_qty')[:top]
+        
+        return {
+            'counts': counts,
+            'top_consumed': top_consumed,
+        }
+    
+    @staticmethod
+    def get_expiry_trend(days=EXPIRY_DAYS, today=None):
+        """
+        Get the number of stocked lots expiring on each of the next N days in one grouped query
+        Returns dict with keys: labels, values
+        """
+        today = today or timezone.localdate()
+        dates = [today + timedelta(days=i) for i in range(days)]
+        
+        counts = {
+            row['expires_at']: row['total']
+            for row in StockLot.objects.filter(
+                qty__gt=0,
+                expires_at__gte=dates[0],
+                expires_at__lte=dates[-1]
+            ).order_by().values('expires_at').annotate(total=Count('id'))
+        }
+        
+        return {
+            'labels': [date.strftime('%m/%d') for date in dates],
+            'values': [counts.get(date, 0) for date in dates],
+        }
+    
+    @staticmethod
+    def get_dashboard_metrics():
+        """
+        Get all main dashboard KPIs and the stock value trend
+        """
+        metrics = DashboardMetricsService.get_inventory_kpis()
+        trend = DashboardMetricsService.get_value_trend(current_value=metrics['total_value'])
+        
+        # Calculate percentage change against last month
+        value_change = 0
+        prev_total_value = trend['prev_total_value']
+        if prev_total_value > 0:
+            value_change = ((float(metrics['total_value']) - float(prev_total_value)) / float(prev_total_value)) * 100
+        
+        metrics.update({
+            'monthly_labels': trend['labels'],
+            'monthly_values': trend['values'],
+            'value_change': value_change,
+        })
+        return metrics
+
+
 class RecipeService:
     """
     Service class for recipe management
@@ -405,16 +938,14 @@ class RecipeService:
     @staticmethod
     def calculate_recipe_cost(recipe):
         """
-        Calculate total cost of a recipe
+        Calculate total cost of recipe from cached ingredient average costs.
+        Uses the total_cost annotation when the recipe came from Recipe.objects.with_cost().
         """
-        total_cost = Decimal('0.00')
-        
-        for recipe_item in recipe.recipe_items.all():
-            ingredient_cost = InventoryService.calculate_item_cost(recipe_item.ingredient)
-            qty_with_loss = recipe_item.get_adjusted_qty()
-            total_cost += Decimal(str(qty_with_loss)) * ingredient_cost
+        total_cost = getattr(recipe, 'total_cost', None)
+        if total_cost is None:
+            total_cost = Recipe.objects.with_cost().filter(pk=recipe.pk).values_list('total_cost', flat=True).first()
         
-        return total_cost
+        return Decimal(total_cost or 0)
     
     @staticmethod
     def validate_recipe_production(recipe, production_qty):
@@ -427,13 +958,18 @@ class RecipeService:
             'total_cost': Decimal('0.00')
         }
         
-        for recipe_item in recipe.recipe_items.all():
+        recipe_items = list(recipe.recipe_items.select_related('ingredient'))
+        ingredients = [recipe_item.ingredient for recipe_item in recipe_items]
+        pool = InventoryService.get_lot_pool(ingredients)
+        costs = InventoryService.calculate_item_costs(ingredients)
+        
+        for recipe_item in recipe_items:
             # Calculate quantity needed
             qty_needed = float(recipe_item.qty) * float(production_qty) / float(recipe.yield_qty)
             qty_needed = qty_needed * recipe_item.get_adjusted_qty() / float(recipe_item.qty)
             
             # Check available stock
-            available_stock = sum(lot.qty for lot in InventoryService.get_available_lots(recipe_item.ingredient))
+            available_stock = sum(lot.qty for lot in pool[recipe_item.ingredient_id])
             
             if available_stock < qty_needed:
                 validation_result['can_produce'] = False
@@ -445,17 +981,219 @@ class RecipeService:
                 })
             
             # Calculate cost
-            ingredient_cost = InventoryService.calculate_item_cost(recipe_item.ingredient)
+            ingredient_cost = costs[recipe_item.ingredient_id]
             validation_result['total_cost'] += Decimal(str(qty_needed)) * ingredient_cost
         
         return validation_result
 
+class ProductionService:
+    """
+    Service for running several production runs in one transaction
+    against pooled ingredient stock
+    """
+    
+    @staticmethod
+    def get_auto_unit_cost(recipe):
+        """
+        Unit cost of one yield unit calculated from recipe ingredient costs
+        """
+        total_cost = RecipeService.calculate_recipe_cost(recipe)
+        return total_cost / recipe.yield_qty if recipe.yield_qty > 0 else Decimal('0.00')
+
+    @staticmethod
+    def attach_ingredients_used(productions):
+        """
+        Set ingredients_used on each produce movement from the first active recipe (by name)
+        for its item, loading every recipe and ingredient in two queries
+        """
+        productions = list(productions)
+        recipes = {}
+        for recipe in Recipe.objects.filter(
+            product_id__in={production.item_id for production in productions},
+            is_active=True
+        ).prefetch_related(Prefetch('recipe_items', queryset=RecipeItem.objects.select_related('ingredient'))):
+            recipes.setdefault(recipe.product_id, recipe)
+
+        for production in productions:
+            recipe = recipes.get(production.item_id)
+            production.ingredients_used = []
+            if not recipe or not recipe.yield_qty:
+                continue
+            for recipe_item in recipe.recipe_items.all():
+                # Scaled to the produced quantity, including the loss factor
+                production.ingredients_used.append({
+                    'ingredient': recipe_item.ingredient,
+                    'qty': recipe_item.get_adjusted_qty() * float(production.qty) / float(recipe.yield_qty),
+                    'unit': recipe_item.unit
+                })
+        return productions
+
+    @staticmethod
+    def prepare_runs(runs):
+        """
+        Prefetch recipe products and ingredients, then calculate ingredient requirements per run.
+        Runs are dicts with recipe, production_qty and lot_no plus optional expires_at, notes and unit_cost.
+        """
+        recipes = Recipe.objects.select_related('product').prefetch_related(
+            Prefetch('recipe_items', queryset=RecipeItem.objects.select_related('ingredient'))
+        ).in_bulk({run['recipe'].pk for run in runs})
+        
+        prepared = []
+        for run in runs:
+            recipe = recipes[run['recipe'].pk]
+            prepared.append({
+                **run,
+                'recipe': recipe,
+                'production_qty': Decimal(str(run['production_qty'])),
+                'required_ingredients': InventoryService.get_required_ingredients(recipe, run['production_qty']),
+            })
+        
+        return prepared
+    
+    @staticmethod
+    def get_pooled_demand(prepared_runs):
+        """
+        Total ingredient demand across runs
+        Returns dict of ingredient_id -> {'ingredient', 'needed'}
+        """
+        demand = {}
+        for run in prepared_runs:
+            for ingredient_data in run['required_ingredients']:
+                ingredient = ingredient_data['ingredient']
+                entry = demand.setdefault(ingredient.id, {'ingredient': ingredient, 'needed': Decimal('0')})
+                entry['needed'] += ingredient_data['qty']
+        return demand
+    
+    @staticmethod
+    def check_pooled_stock(demand, pool):
+        """
+        Compare pooled demand against the lot pool
+        """
+        validation_result = {
+            'can_produce': True,
+            'missing_ingredients': [],
+        }
+        
+        for ingredient_id, entry in demand.items():
+            available_stock = sum((lot.qty for lot in pool[ingredient_id]), Decimal('0'))
+            if available_stock < entry['needed']:
+                validation_result['can_produce'] = False
+                validation_result['missing_ingredients'].append({
+                    'ingredient': entry['ingredient'],
+                    'needed': entry['needed'],
+                    'available': available_stock,
+                    'shortage': entry['needed'] - available_stock
+                })
+        
+        return validation_result
+    
+    @staticmethod
+    def validate_batch(runs):
+        """
+        Validate if all runs can be produced together with current stock
+        """
+        prepared = ProductionService.prepare_runs(runs)
+        demand = ProductionService.get_pooled_demand(prepared)
+        pool = InventoryService.get_lot_pool([entry['ingredient'] for entry in demand.values()])
+        return ProductionService.check_pooled_stock(demand, pool)
+    
+    @staticmethod
+    @transaction.atomic
+    def produce_batch(runs, user):
+        """
+        Produce several recipes in one locked transaction.
+        Ingredient demand is pooled across runs and validated once, then FEFO/FIFO lots
+        are allocated run by run from the shared pool. Nothing is written if any ingredient is short.
+        Returns one result dict per run: recipe, production_qty, lot and consumed (ingredient, lot, qty) tuples.
+        """
+        prepared = ProductionService.prepare_runs(runs)
+        demand = ProductionService.get_pooled_demand(prepared)
+        touched_items = [run['recipe'].product for run in prepared] + [entry['ingredient'] for entry in demand.values()]
+        InventoryService.lock_stock_balances(touched_items)
+        pool = InventoryService.get_lot_pool(
+            [entry['ingredient'] for entry in demand.values()], lock=True
+        )
+        
+        validation = ProductionService.check_pooled_stock(demand, pool)
+        if not validation['can_produce']:
+            missing = validation['missing_ingredients'][0]
+            raise ValueError(
+                f"Insufficient stock for {missing['ingredient'].name}. "
+                f"Need: {missing['needed']}, Available: {missing['available']}"
+            )
+        
+        results = []
+        touched_lots = {}
+        produced_lots = []
+        movements = []
+        
+        for run in prepared:
+            recipe = run['recipe']
+            plan = InventoryService.plan_ingredient_consumption(run['required_ingredients'], pool)
+            touched_lots.update((lot.pk, lot) for _, lot, _ in plan)
+            
+            produced_lot = StockLot(
+                item=recipe.product,
+                lot_no=run['lot_no'],
+                qty=run['production_qty'],
+                unit=recipe.yield_unit,
+                unit_cost=run.get('unit_cost') or 0,
+                expires_at=run.get('expires_at'),
+                notes=run.get('notes'),
+                created_by=user
+            )
+            produced_lots.append(produced_lot)
+            
+            movements.extend(
+                StockMovement(
+                    item=ingredient,
+                    lot=lot,
+                    movement_type='consume',
+                    qty=qty_to_consume,
+                    unit=ingredient.unit,
+                    reason=f"Production: {recipe.name}",
+                    ref_no=f"PROD-{recipe.id}",
+                    notes=f"Used in production of {recipe.product.name}",
+                    created_by=user
+                )
+                for ingredient, lot, qty_to_consume in plan
+            )
+            movements.append(StockMovement(
+                item=recipe.product,
+                lot=produced_lot,
+                movement_type='produce',
+                qty=run['production_qty'],
+                unit=recipe.yield_unit,
+                ref_no=f"PROD-{recipe.id}",
+                notes=f"Produced using recipe: {recipe.name}",
+                created_by=user
+            ))
+            
+            results.append({
+                'recipe': recipe,
+                'production_qty': run['production_qty'],
+                'lot': produced_lot,
+                'consumed': plan,
+            })
+        
+        StockLot.objects.bulk_update(touched_lots.values(), ['qty'])
+        StockLot.objects.bulk_create(produced_lots)
+        StockMovement.objects.bulk_create(movements)
+        
+        InventoryService.refresh_stock_balances(touched_items)
+        InventoryService.record_movement_rollups(movements)
+        
+        return results
+
 
 class PurchaseOrderService:
     """
     Service class for purchase order management
     """
     
+    # format -> content type of the QR code images served by purchase_order_qr
+    QR_IMAGE_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+    
     @staticmethod
     @transaction.atomic
     def create_purchase_order(supplier, items_data, user, notes=None, expected_delivery_date=None):
@@ -473,9 +1211,8 @@ class PurchaseOrderService:
         )
         
         # Create order items
-        total_amount = Decimal('0.00')
-        for item_data in items_data:
-            po_item = PurchaseOrderItem.objects.create(
+        PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(
                 purchase_order=po,
                 item=item_data['item'],
                 qty_ordered=item_data['qty'],
@@ -483,20 +1220,62 @@ class PurchaseOrderService:
                 unit_price=item_data.get('unit_price', 0),
                 notes=item_data.get('notes', '')
             )
-            total_amount += po_item.subtotal()
+            for item_data in items_data
+        ])
+        
+        PurchaseOrderService.refresh_order_totals([po])
+        return po
+    
+    @staticmethod
+    def refresh_order_totals(orders):
+        """
+        Recalculate total_amount of the given orders from their lines with one UPDATE ... SET = (subquery),
+        and copy the new totals onto the instances
+        """
+        orders = list(orders)
+        if not orders:
+            return
         
-        # Update total amount
-        po.total_amount = total_amount
-        po.save()
+        amount = DecimalField(max_digits=12, decimal_places=2)
+        line_totals = PurchaseOrderItem.objects.filter(
+            purchase_order=OuterRef('pk')
+        ).values('purchase_order').annotate(
+            total=Sum(F('qty_ordered') * F('unit_price'), output_field=amount)
+        ).values('total')
+        PurchaseOrder.objects.filter(pk__in=[po.pk for po in orders]).update(
+            total_amount=Coalesce(Subquery(line_totals, output_field=amount), Value(Decimal('0.00'), output_field=amount)),
+            updated_at=timezone.now()
+        )
         
+        totals = dict(PurchaseOrder.objects.filter(pk__in=[po.pk for po in orders]).values_list('pk', 'total_amount'))
+        for po in orders:
+            po.total_amount = totals[po.pk]
+    
+    @staticmethod
+    def update_item_prices(po, item_prices, order_items=None):
+        """
+        Set supplier unit prices (order item id -> price) with one bulk update and refresh the order total
+        """
+        order_items = order_items if order_items is not None else po.order_items.all()
+        priced = []
+        for po_item in order_items:
+            price = item_prices.get(str(po_item.id))
+            if price is not None:
+                po_item.unit_price = price
+                priced.append(po_item)
+        
+        PurchaseOrderItem.objects.bulk_update(priced, ['unit_price'])
+        PurchaseOrderService.refresh_order_totals([po])
         return po
     
     @staticmethod
     @transaction.atomic
-    def supplier_approve_purchase_order(po, user, supplier_notes=None, expected_delivery_date=None):
+    def supplier_approve_purchase_order(po, user, supplier_notes=None, expected_delivery_date=None, item_prices=None, order_items=None):
         """
         Supplier approves purchase order with pricing
         """
+        if item_prices:
+            PurchaseOrderService.update_item_prices(po, item_prices, order_items)
         po.supplier_approve_order(user=user, supplier_notes=supplier_notes, expected_delivery_date=expected_delivery_date)
         return po
     
@@ -537,55 +1316,226 @@ class PurchaseOrderService:
         return po
     
     @staticmethod
-    @transaction.atomic
     def receive_purchase_order_by_qr(qr_code, user):
         """
         Receive purchase order by scanning QR code
         Automatically creates stock lots for all items in the order
         """
-        try:
-            po = PurchaseOrder.objects.get(qr_code=qr_code)
-        except PurchaseOrder.DoesNotExist:
-            raise ValueError("Invalid QR code. Purchase order not found.")
+        result = PurchaseOrderService.receive_purchase_orders_by_qr([qr_code], user)[0]
+        if not result['success']:
+            raise ValueError(result['error'])
+        return result['order'], result['lots']
+    
+    @staticmethod
+    @transaction.atomic
+    def receive_purchase_orders_by_qr(qr_codes, user):
+        """
+        Receive every shipped purchase order scanned in a session in one transaction.
+        The orders are locked with one query; lots, movements, order lines and orders are written in bulk.
+        Returns one result per distinct code, in scan order:
+        {'qr_code', 'order' (or None), 'success', 'lots', 'error'}
+        """
+        qr_codes = list(dict.fromkeys(code.strip().upper() for code in qr_codes if code and code.strip()))
+        orders = {
+            order.qr_code: order
+            for order in PurchaseOrder.objects.select_for_update().filter(qr_code__in=qr_codes)
+        }
+        # Suppliers are read separately so the lock covers the orders only
+        suppliers = Supplier.objects.in_bulk({order.supplier_id for order in orders.values()})
+        for order in orders.values():
+            order.supplier = suppliers[order.supplier_id]
         
-        if not po.can_be_received():
-            raise ValueError(f"Purchase order cannot be received. Current status: {po.get_status_display()}")
+        results = []
+        receiving = []
+        lots_by_order = {}
+        for qr_code in qr_codes:
+            po = orders.get(qr_code)
+            result = {'qr_code': qr_code, 'order': po, 'success': False, 'lots': [], 'error': None}
+            if po is None:
+                result['error'] = "Invalid QR code. Purchase order not found."
+            elif not po.can_be_received():
+                result['error'] = f"Purchase order cannot be received. Current status: {po.get_status_display()}"
+            else:
+                result['success'] = True
+                receiving.append(po)
+                lots_by_order[po.pk] = result['lots']
+            results.append(result)
         
-        # Mark order as received
-        po.mark_received(user)
+        if not receiving:
+            return results
         
-        # Auto-receive all items as stock lots
-        received_lots = []
-        for po_item in po.order_items.all():
-            # Generate lot number
-            lot_no = f"{po.order_no}-{po_item.item.code}"
+        now = timezone.now()
+        lots = []
+        movements = []
+        orders_by_pk = {po.pk: po for po in receiving}
+        po_items = list(PurchaseOrderItem.objects.filter(purchase_order__in=receiving).select_related('item'))
+        items = {po_item.item_id: po_item.item for po_item in po_items}.values()
+        InventoryService.lock_stock_balances(items)
+        for po_item in po_items:
+            po = orders_by_pk[po_item.purchase_order_id]
+            item = po_item.item
+            remaining = po_item.qty_ordered - po_item.qty_received
+            if remaining <= 0:
+                # Already received through a partial receipt
+                continue
             
             # Calculate expiry date if item is perishable
             expires_at = None
-            if po_item.item.is_perishable and po_item.item.shelf_life_days > 0:
-                expires_at = timezone.now().date() + timedelta(days=po_item.item.shelf_life_days)
+            if item.is_perishable and item.shelf_life_days > 0:
+                expires_at = now.date() + timedelta(days=item.shelf_life_days)
             
-            # Create stock lot
-            lot = InventoryService.receive_stock(
-                item=po_item.item,
-                lot_no=lot_no,
-                qty=po_item.qty_ordered,
+            lot = StockLot(
+                item=item,
+                lot_no=f"{po.order_no}-{item.code}",
+                qty=remaining,
                 unit=po_item.unit,
-                user=user,
-                supplier=po.supplier,
                 expires_at=expires_at,
                 unit_cost=po_item.unit_price,
-                ref_no=po.order_no,
-                notes=f"Received from PO: {po.order_no}"
+                supplier=po.supplier,
+                notes=f"Received from PO: {po.order_no}",
+                created_by=user
             )
-            
-            # Update qty_received
+            lots.append(lot)
+            lots_by_order[po.pk].append(lot)
+            movements.append(StockMovement(
+                item=item,
+                lot=lot,
+                movement_type='receive',
+                qty=remaining,
+                unit=po_item.unit,
+                ref_no=po.order_no,
+                notes=f"Received from PO: {po.order_no}",
+                created_by=user
+            ))
             po_item.qty_received = po_item.qty_ordered
-            po_item.save()
+        
+        for po in receiving:
+            po.status = 'received'
+            po.received_at = now
+            po.actual_delivery_date = now.date()
+            po.received_by = user
+            po.updated_at = now
+        
+        StockLot.objects.bulk_create(lots)
+        StockMovement.objects.bulk_create(movements)
+        PurchaseOrderItem.objects.bulk_update(po_items, ['qty_received'])
+        PurchaseOrder.objects.bulk_update(receiving, ['status', 'received_at', 'actual_delivery_date', 'received_by', 'updated_at'])
+        
+        InventoryService.refresh_stock_balances(items)
+        InventoryService.record_movement_rollups(movements)
+        
+        return results
+    
+    @staticmethod
+    @transaction.atomic
+    def receive_with_details(order, lines, user, delivery_notes=None):
+        """
+        Receive a purchase order with per-line quantities, lot numbers, expiry dates and notes.
+        `lines` maps order item ids to {'qty_received', 'lot_no', 'expires_at', 'notes'};
+        missing or zero quantities skip the line. Every line is validated before anything is written,
+        then lots and movements are bulk-inserted and qty_received bulk-updated. The order is marked
+        received only once every line is complete; a partial receipt leaves it open.
+        Raises ValueError listing every invalid line.
+        """
+        from decimal import InvalidOperation
+        from django.utils.dateparse import parse_date
+        
+        order = PurchaseOrder.objects.select_for_update().select_related('supplier').get(pk=order.pk)
+        if not order.can_be_received():
+            raise ValueError(f"Purchase order cannot be received. Current status: {order.get_status_display()}")
+        
+        po_items = list(order.order_items.select_related('item'))
+        lines = {str(item_id): line for item_id, line in lines.items()}
+        today = timezone.localdate()
+        errors = []
+        receipts = []
+        for po_item in po_items:
+            line = lines.get(str(po_item.id)) or {}
+            item = po_item.item
+            try:
+                qty = Decimal(str(line.get('qty_received') or 0))
+            except InvalidOperation:
+                errors.append(f"{item.name}: invalid quantity")
+                continue
+            if qty == 0:
+                continue
+            
+            remaining = po_item.qty_ordered - po_item.qty_received
+            expires_at = line.get('expires_at') or None
+            if isinstance(expires_at, str):
+                expires_at = parse_date(expires_at)
+                if expires_at is None:
+                    errors.append(f"{item.name}: invalid expiration date")
+                    continue
             
-            received_lots.append(lot)
+            if qty < 0:
+                errors.append(f"{item.name}: quantity cannot be negative")
+            elif qty > remaining:
+                errors.append(f"{item.name}: receiving {qty} exceeds the {remaining} still outstanding")
+            elif item.is_perishable and not expires_at:
+                errors.append(f"{item.name}: expiration date is required for perishable items")
+            elif expires_at and expires_at < today:
+                errors.append(f"{item.name}: expiration date is in the past")
+            else:
+                receipts.append((po_item, qty, (line.get('lot_no') or '').strip(), expires_at, line.get('notes') or ''))
+        
+        if errors:
+            raise ValueError("; ".join(errors))
+        if not receipts:
+            raise ValueError("Enter a quantity for at least one item.")
+        
+        items = [receipt[0].item for receipt in receipts]
+        InventoryService.lock_stock_balances(items)
+        
+        # Lines left without a lot number get one from the lot sequence
+        missing_lot_numbers = sum(1 for receipt in receipts if not receipt[2])
+        generated = iter(InventoryService.generate_lot_numbers('LOT', missing_lot_numbers) if missing_lot_numbers else [])
         
-        return po, received_lots
+        lots = []
+        movements = []
+        for po_item, qty, lot_no, expires_at, notes in receipts:
+            lot = StockLot(
+                item=po_item.item,
+                lot_no=lot_no or next(generated),
+                qty=qty,
+                unit=po_item.unit,
+                expires_at=expires_at,
+                unit_cost=po_item.unit_price,
+                supplier=order.supplier,
+                notes=notes,
+                created_by=user
+            )
+            lots.append(lot)
+            movements.append(StockMovement(
+                item=po_item.item,
+                lot=lot,
+                movement_type='receive',
+                qty=qty,
+                unit=po_item.unit,
+                ref_no=order.order_no,
+                reason=f"Received from PO {order.order_no}",
+                notes=notes,
+                created_by=user
+            ))
+            po_item.qty_received += qty
+        
+        StockLot.objects.bulk_create(lots)
+        StockMovement.objects.bulk_create(movements)
+        PurchaseOrderItem.objects.bulk_update([receipt[0] for receipt in receipts], ['qty_received'])
+        
+        if all(po_item.qty_received >= po_item.qty_ordered for po_item in po_items):
+            order.status = 'received'
+            order.received_by = user
+            order.received_at = timezone.now()
+            order.actual_delivery_date = today
+        if delivery_notes:
+            order.notes = (order.notes or '') + f"\n\nDelivery Notes: {delivery_notes}"
+        order.save()
+        
+        InventoryService.refresh_stock_balances(items)
+        InventoryService.record_movement_rollups(movements)
+        
+        return order, lots
     
     @staticmethod
     def generate_qr_code_image(qr_code):
@@ -593,9 +1543,28 @@ class PurchaseOrderService:
         Generate QR code image for a purchase order
         Returns base64 encoded image
         """
+        import base64
+        
+        img_base64 = base64.b64encode(PurchaseOrderService.get_qr_code_image(qr_code)).decode()
+        return f"data:image/png;base64,{img_base64}"
+    
+    @staticmethod
+    def get_qr_code_image(qr_code, image_format='png'):
+        """
+        Rendered QR code image (PNG or SVG bytes) for a purchase order's qr_code.
+        An order's code never changes, so each image is rendered once and kept in the cache.
+        """
+        if image_format not in PurchaseOrderService.QR_IMAGE_TYPES:
+            raise ValueError(f"Unsupported QR image format: {image_format}")
+        
+        cache_key = f'po_qr:{image_format}:{qr_code}'
+        image = cache.get(cache_key)
+        if image is not None:
+            return image
+        
         import qrcode
         from io import BytesIO
-        import base64
+        from itertools import groupby
         
         # Create QR code
         qr = qrcode.QRCode(
@@ -607,16 +1576,28 @@ class PurchaseOrderService:
         qr.add_data(qr_code)
         qr.make(fit=True)
         
-        # Create image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
+        if image_format == 'svg':
+            # One path segment per run of dark modules in a row; scales without a raster encode
+            matrix = qr.get_matrix()
+            runs = []
+            for y, row in enumerate(matrix):
+                x = 0
+                for dark, modules in groupby(row):
+                    length = len(list(modules))
+                    if dark:
+                        runs.append(f'M{x} {y}h{length}v1h-{length}z')
+                    x += length
+            image = (
+                f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {len(matrix)} {len(matrix)}" shape-rendering="crispEdges">'
+                f'<rect width="100%" height="100%" fill="#fff"/><path d="{"".join(runs)}"/></svg>'
+            ).encode()
+        else:
+            buffer = BytesIO()
+            qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+            image = buffer.getvalue()
         
-        return f"data:image/png;base64,{img_base64}"
+        cache.set(cache_key, image, timeout=None)
+        return image
     
     @staticmethod
     def get_pending_orders():
@@ -630,7 +1611,7 @@ class PurchaseOrderService:
         """
         Get all shipped purchase orders waiting to be received
         """
-        return PurchaseOrder.objects.filter(status='shipped').order_by('-shipped_at')
+        return PurchaseOrder.objects.filter(status='shipped').select_related('supplier').order_by('-shipped_at')
     
     @staticmethod
     def get_order_summary():
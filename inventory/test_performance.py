@@ -0,0 +1,323 @@
+"""
+Query-count and wall-time budgets for every named URL in inventory/urls.py.
+
+A realistic dataset (PERF_ITEMS items, 2000 by default, with their lots, movements, purchase
+orders, recipes, attendance and audit logs) is seeded once with bulk_create, then every URL
+is requested with GET as each role. A request fails when it runs more queries than its
+view's budget, which is what a per-row query reintroduced into a list or report does at
+this data size. Set PERF_CHECK_TIME=1 to also fail requests slower than the view's time
+budget (off by default: wall time is noisy on shared CI). Set PERF_REPORT to a path to
+write every measurement there as JSON for comparison between runs.
+"""
+import json
+import os
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import urls
+from .models import (
+    User, UserAccess, AuditLog, AttendanceRecord, Supplier, Item, StockLot, StockMovement,
+    Recipe, RecipeItem, PurchaseOrder, PurchaseOrderItem
+)
+from .services import InventoryService
+
+
+PERF_ITEMS = int(os.environ.get('PERF_ITEMS', 2000))
+PERF_REPORT = os.environ.get('PERF_REPORT')
+PERF_CHECK_TIME = os.environ.get('PERF_CHECK_TIME', '') not in ('', '0')
+
+# url name -> (max queries, max seconds) for one GET, whatever the role.
+# Query budgets are the measured count plus 2: a query per listed row blows through them.
+# Time budgets are only enforced with PERF_CHECK_TIME.
+BUDGETS = {
+    'login': (5, 1.0),
+    'logout': (2, 1.0),
+    'dashboard': (8, 1.0),
+    'attendance_dashboard': (10, 1.0),
+    'clock_event': (4, 1.0),
+    'user_list': (6, 1.0),
+    'user_create': (4, 1.0),
+    'user_detail': (8, 1.0),
+    'user_update': (6, 1.0),
+    'user_delete': (6, 1.0),
+    'user_permissions': (8, 1.0),
+    'user_toggle_status': (2, 1.0),
+    'audit_logs': (9, 1.0),
+    'admin_attendance_overview': (10, 1.0),
+    'nav_debug': (5, 1.0),
+    'inventory_dashboard': (20, 1.0),
+    'item_list': (5, 1.0),
+    'item_create': (4, 1.0),
+    'item_detail': (8, 1.0),
+    'item_update': (5, 1.0),
+    'stock_receive': (5, 1.0),
+    'stock_consume': (4, 1.0),
+    'damage_log': (4, 1.0),
+    'api_item_lots': (6, 1.0),
+    'api_item_meta': (6, 1.0),
+    'api_items_batch': (7, 1.0),
+    'api_search': (7, 1.0),
+    'production_create': (5, 1.0),
+    'production_batch_create': (9, 1.0),
+    'production_list': (12, 1.0),
+    'supplier_list': (5, 1.0),
+    'supplier_create': (4, 1.0),
+    'recipe_list': (5, 1.0),
+    'recipe_create': (6, 1.0),
+    'recipe_detail': (8, 1.0),
+    'stock_report': (6, 2.0),
+    'damage_report': (16, 2.0),
+    'expiration_tracker': (6, 2.0),
+    'purchase_order_list': (12, 1.0),
+    'purchase_order_create': (6, 1.0),
+    'purchase_order_detail': (9, 1.0),
+    'purchase_order_qr': (5, 1.0),
+    'purchase_order_approve': (7, 1.0),
+    'purchase_order_admin_approve': (7, 1.0),
+    'purchase_order_admin_reject': (7, 1.0),
+    'purchase_order_ship': (5, 1.0),
+    'purchase_order_receive': (7, 1.0),
+    'purchase_order_cancel': (8, 1.0),
+    'purchase_order_scan_receive': (5, 1.0),
+    'purchase_order_scan_session': (5, 1.0),
+    'supplier_login': (5, 1.0),
+    'supplier_dashboard': (12, 1.0),
+    'supplier_orders': (6, 1.0),
+    'supplier_order_detail': (8, 1.0),
+    'supplier_order_approve': (8, 1.0),
+    'supplier_order_ship': (6, 1.0),
+}
+
+# Query strings for views that need input to do their real work
+QUERY_PARAMS = {
+    'api_search': {'type': 'item', 'q': 'flour'},
+}
+
+# url name -> (order status it acts on, status code at least one role must get).
+# Order views are requested with an order in that status (others get a pending one) so they
+# render their form instead of redirecting. The ship views only act on POST and redirect on GET.
+ORDER_STATUSES = {
+    'purchase_order_approve': ('pending', 200),
+    'purchase_order_admin_approve': ('supplier_approved', 200),
+    'purchase_order_admin_reject': ('supplier_approved', 200),
+    'purchase_order_ship': ('admin_approved', 302),
+    'purchase_order_receive': ('shipped', 200),
+    'purchase_order_cancel': ('pending', 200),
+    'supplier_order_approve': ('pending', 200),
+    'supplier_order_ship': ('admin_approved', 302),
+}
+
+ROLES = ['super_admin', 'admin', 'staff', 'supplier']
+
+
+class QueryBudgetTestCase(TestCase):
+    """Query-count and wall-time budgets for every named URL, as every role"""
+
+    report = []
+
+    @classmethod
+    def setUpTestData(cls):
+        """Seed the dataset with bulk inserts"""
+        today = timezone.localdate()
+        cls.users = {}
+        for role in ROLES:
+            cls.users[role] = User.objects.create_user(
+                username=f'perf_{role}',
+                email=f'{role}@perf.test',
+                password='testpass123',
+                role=role,
+                first_name=role.title(),
+                last_name='Perf'
+            )
+        admin = cls.users['super_admin']
+        for permission in ('inventory_read', 'inventory_write', 'reports_read'):
+            UserAccess.objects.create(user=cls.users['staff'], permission_type=permission, granted_by=admin)
+
+        suppliers = Supplier.objects.bulk_create([
+            Supplier(name=f'Supplier {n:03d}', contact_person=f'Contact {n}', created_by=admin)
+            for n in range(20)
+        ])
+        cls.users['supplier'].supplier = suppliers[0]
+        cls.users['supplier'].save(validate=False)
+
+        staff = User.objects.bulk_create([
+            User(username=f'perf_staff_{n:03d}', email=f'staff{n}@perf.test', role='staff', first_name=f'Staff{n}', last_name='Perf')
+            for n in range(50)
+        ])
+        AttendanceRecord.objects.bulk_create([
+            AttendanceRecord(user=user, date=today - timedelta(days=days), time_in_am=timezone.now())
+            for user in staff for days in range(10)
+        ])
+
+        items = Item.objects.bulk_create([
+            Item(
+                code=f'PERF{n:05d}',
+                name=f'{"Flour" if n % 10 == 0 else "Ingredient"} {n}',
+                category='finished_good' if n % 20 == 0 else 'ingredient',
+                unit='kg',
+                reorder_level=10,
+                is_perishable=n % 2 == 0,
+                shelf_life_days=30,
+                created_by=admin
+            )
+            for n in range(PERF_ITEMS)
+        ])
+        lots = StockLot.objects.bulk_create([
+            StockLot(
+                item=item,
+                lot_no=f'{item.code}-{n}',
+                qty=Decimal(5 + n * 10),
+                unit='kg',
+                expires_at=today + timedelta(days=(index + n * 7) % 40 - 5) if item.is_perishable else None,
+                unit_cost=Decimal('2.50'),
+                supplier=suppliers[index % len(suppliers)],
+                created_by=admin
+            )
+            for index, item in enumerate(items) for n in range(2)
+        ], batch_size=500)
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                item=lot.item,
+                lot=lot,
+                movement_type=movement_type,
+                qty=Decimal('1.00'),
+                unit='kg',
+                reason='Seed',
+                created_by=admin
+            )
+            for lot in lots for movement_type in ('receive', 'consume', 'produce' if lot.item.category == 'finished_good' else 'damage')
+        ], batch_size=500)
+        InventoryService.refresh_stock_balances(items)
+        InventoryService.refresh_movement_rollups()
+
+        products = [item for item in items if item.category == 'finished_good']
+        ingredients = [item for item in items if item.category == 'ingredient']
+        recipes = Recipe.objects.bulk_create([
+            Recipe(name=f'Recipe {n:03d}', product=product, yield_qty=10, yield_unit='kg', created_by=admin)
+            for n, product in enumerate(products)
+        ])
+        RecipeItem.objects.bulk_create([
+            RecipeItem(recipe=recipe, ingredient=ingredients[(n * 5 + k) % len(ingredients)], qty=Decimal('0.50'), unit='kg')
+            for n, recipe in enumerate(recipes) for k in range(5)
+        ])
+
+        statuses = [status for status, _ in PurchaseOrder.STATUS_CHOICES]
+        orders = PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(
+                order_no=f'PO-PERF-{n:05d}',
+                qr_code=f'PERFQR{n:05d}',
+                # The first order of each status belongs to the supplier user's supplier
+                supplier=suppliers[(n // len(statuses)) % len(suppliers)],
+                status=statuses[n % len(statuses)],
+                created_by=admin
+            )
+            for n in range(500)
+        ])
+        PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(purchase_order=order, item=ingredients[(n * 5 + k) % len(ingredients)], qty_ordered=10, unit='kg', unit_price=Decimal('2.50'))
+            for n, order in enumerate(orders) for k in range(5)
+        ])
+
+        AuditLog.objects.bulk_create([
+            AuditLog(user=admin, action_type='read', target_model='Item', description=f'Seed {n}', ip_address='127.0.0.1', user_agent='perf')
+            for n in range(2000)
+        ], batch_size=500)
+
+        cls.kwargs = {
+            'user_id': staff[0].id,
+            'item_id': ingredients[0].id,
+            'recipe_id': recipes[0].id,
+        }
+        cls.order_ids = {status: orders[n].id for n, status in enumerate(statuses)}
+        cls.query_params = {
+            **QUERY_PARAMS,
+            'api_item_lots': {'item_id': ingredients[0].id},
+            'api_item_meta': {'item_id': ingredients[0].id},
+            'api_items_batch': {'item_id': [item.id for item in ingredients[:50]]},
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        if PERF_REPORT:
+            with open(PERF_REPORT, 'w', encoding='utf-8') as report:
+                json.dump(cls.report, report, indent=2)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_url_has_a_budget(self):
+        """New views must declare a budget"""
+        names = {pattern.name for pattern in urls.urlpatterns if pattern.name}
+        self.assertEqual(names - set(BUDGETS), set())
+
+    def get_url(self, pattern):
+        kwargs = {
+            key: self.order_ids[ORDER_STATUSES.get(pattern.name, ('pending',))[0]] if key == 'order_id' else self.kwargs[key]
+            for key in pattern.pattern.converters
+        }
+        return reverse(f'inventory:{pattern.name}', kwargs=kwargs)
+
+    def test_order_views_get_expected_status(self):
+        """Order views are measured doing their real work, not bouncing off the order's status"""
+        patterns = {pattern.name: pattern for pattern in urls.urlpatterns if pattern.name in ORDER_STATUSES}
+        for name, pattern in patterns.items():
+            codes = set()
+            for role in ROLES:
+                client = Client()
+                client.force_login(self.users[role])
+                codes.add(client.get(self.get_url(pattern)).status_code)
+            with self.subTest(url=name):
+                self.assertIn(ORDER_STATUSES[name][1], codes)
+
+    def check_role(self, role):
+        client = Client()
+        client.force_login(self.users[role])
+        seen = set()
+        for pattern in urls.urlpatterns:
+            name = pattern.name
+            if name in seen:
+                continue
+            seen.add(name)
+            url = self.get_url(pattern)
+            max_queries, max_seconds = BUDGETS[name]
+
+            # The query log keeps only the last 9000 queries; start each capture from empty
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url, self.query_params.get(name, {}))
+                elapsed = time.perf_counter() - start
+
+            self.report.append({
+                'url': name,
+                'role': role,
+                'status': response.status_code,
+                'queries': len(queries.captured_queries),
+                'seconds': round(elapsed, 4),
+                'max_queries': max_queries,
+                'max_seconds': max_seconds,
+            })
+            with self.subTest(url=name, role=role):
+                self.assertLess(response.status_code, 500)
+                self.assertLessEqual(len(queries.captured_queries), max_queries)
+                if PERF_CHECK_TIME:
+                    self.assertLessEqual(elapsed, max_seconds)
+
+    def test_super_admin(self):
+        self.check_role('super_admin')
+
+    def test_admin(self):
+        self.check_role('admin')
+
+    def test_staff(self):
+        self.check_role('staff')
+
+    def test_supplier(self):
+        self.check_role('supplier')
@@ -1,17 +1,28 @@
 """
 Unit tests for inventory management system
 """
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections, transaction
+import os
+import threading
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta, date
 from decimal import Decimal
 from .models import (
     User, UserLinks, UserAccess, AuditLog, AttendanceRecord, ShiftSchedule,
-    Supplier, Item, StockLot, StockMovement, Recipe, RecipeItem,
+    Supplier, Item, ItemStockBalance, DailyMovementRollup, InventorySnapshot, SequenceCounter, StockLot, StockMovement, Recipe, RecipeItem,
     PurchaseOrder, PurchaseOrderItem
 )
-from .services import InventoryService, RecipeService, PurchaseOrderService
+from .services import InventoryService, RecipeService, PurchaseOrderService, DashboardMetricsService, ProductionService
+from .forms import StockConsumeForm
+from .search import search
 from django.core.exceptions import ValidationError
 
 
@@ -758,6 +769,254 @@ class AuditLogTestCase(TestCase):
         self.assertEqual(log.target_model, 'Item')
 
 
+class AuditLogWriterTestCase(TransactionTestCase):
+    """Test cases for the buffered audit log writer"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from .audit import AuditLogWriter
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123'
+        )
+        self.spool_path = os.path.join(tempfile.mkdtemp(), 'audit_spool.jsonl')
+        self.writer = AuditLogWriter(batch_size=3, flush_interval_ms=50, spool_path=self.spool_path)
+    
+    def tearDown(self):
+        self.writer.shutdown()
+    
+    def _entry(self, n):
+        import uuid
+        return {
+            'id': uuid.uuid4(),
+            'user_id': self.user.pk,
+            'action_type': 'read',
+            'target_model': 'Item',
+            'target_id': str(n),
+            'description': f'Event {n}',
+            'ip_address': '127.0.0.1',
+            'user_agent': 'Test Agent',
+            'timestamp': timezone.now(),
+        }
+    
+    def test_background_thread_writes_batches(self):
+        """Test queued events are bulk inserted by the background thread"""
+        for n in range(5):
+            self.writer.enqueue(self._entry(n))
+        
+        deadline = timezone.now() + timedelta(seconds=5)
+        while AuditLog.objects.count() < 5 and timezone.now() < deadline:
+            threading.Event().wait(0.05)
+        self.assertEqual(AuditLog.objects.count(), 5)
+    
+    def test_shutdown_drains_buffer(self):
+        """Test events still queued at shutdown are written"""
+        for n in range(4):
+            self.writer.queue.put_nowait(self._entry(n))
+        self.writer.shutdown()
+        self.assertEqual(AuditLog.objects.count(), 4)
+    
+    def test_spool_and_replay_when_database_unavailable(self):
+        """Test failed batches go to the spool file and are replayed on the next write"""
+        from unittest import mock
+        from django.db import OperationalError
+        
+        entries = [self._entry(n) for n in range(2)]
+        with mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=OperationalError('gone away')):
+            self.writer._write(entries)
+        self.assertEqual(AuditLog.objects.count(), 0)
+        with open(self.spool_path) as spool:
+            self.assertEqual(len(spool.readlines()), 2)
+        
+        self.writer._write([self._entry(2)])
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.spool_path))
+        log = AuditLog.objects.get(target_id='0')
+        self.assertEqual(log.id, entries[0]['id'])
+        self.assertEqual(log.timestamp, entries[0]['timestamp'])
+    
+    def test_bad_event_does_not_drop_batch(self):
+        """Test a batch rejected by the database is retried row by row, losing only the bad event"""
+        existing = self._entry(0)
+        self.writer._write([existing])
+        
+        # Reusing an id violates the primary key
+        batch = [self._entry(1), {**self._entry(2), 'id': existing['id']}, self._entry(3)]
+        with self.assertLogs('inventory.audit', level='ERROR'):
+            self.writer._write(batch)
+        
+        self.assertEqual(sorted(AuditLog.objects.values_list('target_id', flat=True)), ['0', '1', '3'])
+        self.assertFalse(os.path.exists(self.spool_path))
+    
+    def test_log_user_action_modes(self):
+        """Test synchronous mode writes immediately and buffered mode leaves the request alone"""
+        from unittest import mock
+        from django.test import override_settings
+        from .security import log_user_action
+        
+        with override_settings(AUDIT_LOG_SYNC=True):
+            log_user_action(self.user, 'create', 'Item', target_id=1, description='Created item')
+        self.assertEqual(AuditLog.objects.filter(action_type='create').count(), 1)
+        
+        with override_settings(AUDIT_LOG_SYNC=False), \
+                mock.patch('inventory.audit.get_audit_writer', return_value=self.writer):
+            with self.assertNumQueries(0):
+                log_user_action(self.user, 'update', 'Item', target_id=1, description='Updated item')
+            self.writer.shutdown()
+        log = AuditLog.objects.get(action_type='update')
+        self.assertEqual(log.user, self.user)
+        self.assertEqual(log.target_id, '1')
+
+
+class AuditLogRetentionTestCase(TestCase):
+    """Test cases for audit log archival and keyset pagination"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='superadmin',
+            email='superadmin@test.com',
+            password='testpass123',
+            role='super_admin'
+        )
+    
+    def _log(self, timestamp, n=0):
+        return AuditLog.objects.create(
+            user=self.user,
+            action_type='read',
+            target_model='Item',
+            target_id=str(n),
+            description=f'Event {n}',
+            ip_address='127.0.0.1',
+            user_agent='Test Agent',
+            timestamp=timestamp
+        )
+    
+    def test_archive_audit_logs_command(self):
+        """Test old logs are written to monthly gzipped JSONL files and deleted"""
+        import gzip
+        import json
+        from .models import AuditLogArchive
+        
+        now = timezone.now()
+        old = [self._log(now - timedelta(days=100 + n * 10), n) for n in range(5)]
+        recent = self._log(now - timedelta(days=1), 99)
+        output_dir = tempfile.mkdtemp()
+        
+        call_command('archive_audit_logs', older_than=90, output_dir=output_dir, chunk_size=2, stdout=StringIO())
+        
+        self.assertEqual(list(AuditLog.objects.values_list('id', flat=True)), [recent.id])
+        archived = []
+        for name in sorted(os.listdir(output_dir)):
+            with gzip.open(os.path.join(output_dir, name), 'rt') as archive:
+                archived.extend(json.loads(line) for line in archive)
+        self.assertEqual(sorted(row['id'] for row in archived), sorted(str(log.id) for log in old))
+        self.assertEqual(archived[0]['username'], 'superadmin')
+        self.assertEqual(sum(AuditLogArchive.objects.values_list('row_count', flat=True)), 5)
+        self.assertEqual(AuditLogArchive.objects.count(), len(os.listdir(output_dir)))
+    
+    def test_audit_logs_view_keyset_pagination(self):
+        """Test the audit log view walks pages by cursor without counting the table"""
+        now = timezone.now()
+        for n in range(45):
+            self._log(now - timedelta(minutes=n), n)
+        client = Client()
+        client.login(username='superadmin', password='testpass123')
+        url = reverse('inventory:audit_logs')
+        
+        seen = []
+        cursor = ''
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.get(url, {'cursor': cursor})
+            self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'] and 'audit_log' in q['sql']])
+            seen.extend(log.id for log in response.context['logs'])
+            cursor = response.context['logs'].next_cursor
+            if not cursor:
+                break
+        
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), set(AuditLog.objects.values_list('id', flat=True)))
+
+
+class CursorPaginatorTestCase(TestCase):
+    """Test cases for keyset (cursor) pagination"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        self.suppliers = [
+            Supplier.objects.create(name=f'Supplier {n:02d}', created_by=self.user)
+            for n in range(25)
+        ]
+    
+    def _walk(self, paginator):
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return pages
+    
+    def test_forward_and_backward(self):
+        """Test next and previous cursors cover every row once in ordering order"""
+        from .pagination import CursorPaginator
+        # Every supplier ties on is_active, so pages are split by the primary key tie-breaker
+        paginator = CursorPaginator(Supplier.objects.all(), ('is_active',), per_page=4)
+        pages = self._walk(paginator)
+        
+        forward = [supplier.id for page in pages for supplier in page]
+        expected = list(Supplier.objects.order_by('is_active', 'pk').values_list('id', flat=True))
+        self.assertEqual(forward, expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertEqual(len(pages), 7)
+        
+        back = paginator.get_page(pages[3].previous_cursor)
+        self.assertEqual([s.id for s in back], [s.id for s in pages[2]])
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+        first = paginator.get_page(pages[1].previous_cursor)
+        self.assertEqual([s.id for s in first], [s.id for s in pages[0]])
+        self.assertFalse(first.has_previous())
+    
+    def test_descending_related_ordering(self):
+        """Test descending orderings and related lookups page correctly"""
+        from .pagination import CursorPaginator
+        paginator = CursorPaginator(Supplier.objects.all(), ('-created_by__username', '-name'), per_page=6)
+        forward = [supplier.id for page in self._walk(paginator) for supplier in page]
+        expected = list(Supplier.objects.order_by('-created_by__username', '-name', '-pk').values_list('id', flat=True))
+        self.assertEqual(forward, expected)
+    
+    def test_invalid_cursor_returns_first_page(self):
+        """Test a malformed token falls back to the first page"""
+        from .pagination import CursorPaginator
+        paginator = CursorPaginator(Supplier.objects.all(), ('name',), per_page=4)
+        self.assertEqual(
+            [s.id for s in paginator.get_page('not-a-cursor')],
+            [s.id for s in paginator.get_page()]
+        )
+    
+    def test_list_view_deep_page_costs_same_queries(self):
+        """Test a later supplier_list page runs the same queries as the first and no COUNT"""
+        client = Client()
+        client.login(username='admin', password='testpass123')
+        url = reverse('inventory:supplier_list')
+        
+        with CaptureQueriesContext(connection) as first:
+            response = client.get(url)
+        cursor = response.context['suppliers'].next_cursor
+        self.assertIsNotNone(cursor)
+        with CaptureQueriesContext(connection) as second:
+            response = client.get(url, {'cursor': cursor})
+        self.assertEqual(len(response.context['suppliers']), 5)
+        self.assertEqual(len(first.captured_queries), len(second.captured_queries))
+        self.assertFalse([q for q in second.captured_queries if 'COUNT(' in q['sql']])
+
+
 class SecurityTestCase(TestCase):
     """Test cases for security module"""
     
@@ -1063,6 +1322,182 @@ class ProductionWorkflowTestCase(TestCase):
                 user=self.user
             )
 
+    
+    def add_ingredients(self, count, start=0):
+        """Add stocked ingredients with two lots each to the recipe"""
+        for index in range(start, start + count):
+            ingredient = Item.objects.create(
+                code=f'ING{index + 100:03d}',
+                name=f'Ingredient {index}',
+                category='ingredient',
+                unit='kg',
+                created_by=self.user
+            )
+            RecipeItem.objects.create(
+                recipe=self.recipe, ingredient=ingredient, qty=3, unit='kg', loss_factor=0
+            )
+            for lot_index in range(2):
+                StockLot.objects.create(
+                    item=ingredient, lot_no=f'L{index}-{lot_index}', qty=2, unit='kg', created_by=self.user
+                )
+    
+    def test_produce_stock_overflows_lots_and_records_movements(self):
+        """Test production consumes across lots and updates ingredient balances"""
+        self.add_ingredients(3)
+        StockLot.objects.create(item=self.ingredient, lot_no='ING-LOT001', qty=10, unit='kg', created_by=self.user)
+        
+        InventoryService.produce_stock(
+            recipe=self.recipe, production_qty=10, lot_no='PROD-LOT001', user=self.user
+        )
+        
+        for recipe_item in self.recipe.recipe_items.select_related('ingredient'):
+            consumed = sum(
+                m.qty for m in StockMovement.objects.filter(item=recipe_item.ingredient, movement_type='consume')
+            )
+            self.assertEqual(consumed, recipe_item.qty)
+            self.assertEqual(
+                ItemStockBalance.objects.get(item=recipe_item.ingredient).on_hand_qty,
+                recipe_item.ingredient.get_current_stock()
+            )
+        self.assertEqual(StockMovement.objects.filter(movement_type='consume').count(), 7)
+        self.assertEqual(StockMovement.objects.filter(movement_type='produce').count(), 1)
+    
+    def test_produce_stock_query_count_independent_of_ingredients(self):
+        """Test production round trips do not grow with the number of ingredients"""
+        StockLot.objects.create(item=self.ingredient, lot_no='ING-LOT001', qty=100, unit='kg', created_by=self.user)
+        self.add_ingredients(2)
+        
+        with CaptureQueriesContext(connection) as few:
+            InventoryService.produce_stock(recipe=self.recipe, production_qty=1, lot_no='P1', user=self.user)
+        
+        self.add_ingredients(30, start=2)
+        with CaptureQueriesContext(connection) as many:
+            InventoryService.produce_stock(recipe=self.recipe, production_qty=1, lot_no='P2', user=self.user)
+        
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+    
+    def test_production_view_auto_unit_cost(self):
+        """Test the production form costs a run without a unit cost like the service does"""
+        InventoryService.receive_stock(
+            item=self.ingredient, lot_no='ING-LOT001', qty=100, unit='kg', user=self.user, unit_cost=Decimal('3.00')
+        )
+        admin = User.objects.create_user(username='admin', email='admin@test.com', password='testpass123', role='admin')
+        client = Client()
+        client.force_login(admin)
+        
+        response = client.post(reverse('inventory:production_create'), {
+            'recipe': self.recipe.id,
+            'production_qty': '10',
+            'lot_no': 'PROD-LOT001',
+        })
+        
+        self.assertRedirects(response, reverse('inventory:item_detail', args=[self.product.id]))
+        lot = StockLot.objects.get(lot_no='PROD-LOT001')
+        self.assertEqual(lot.unit_cost, ProductionService.get_auto_unit_cost(self.recipe).quantize(Decimal('0.01')))
+        self.assertEqual(lot.unit_cost, Decimal('1.50'))
+
+
+class ProductionBatchTestCase(TestCase):
+    """Test cases for batch production with pooled ingredients"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        
+        self.flour = Item.objects.create(
+            code='ING001', name='Flour', category='ingredient', unit='kg',
+            is_perishable=True, created_by=self.user
+        )
+        self.old_lot = StockLot.objects.create(
+            item=self.flour, lot_no='FLOUR-OLD', qty=6, unit='kg',
+            expires_at=timezone.now().date() + timedelta(days=3), created_by=self.user
+        )
+        self.new_lot = StockLot.objects.create(
+            item=self.flour, lot_no='FLOUR-NEW', qty=10, unit='kg',
+            expires_at=timezone.now().date() + timedelta(days=30), created_by=self.user
+        )
+        
+        self.recipes = []
+        for code in ('BREAD', 'CAKE'):
+            product = Item.objects.create(
+                code=code, name=code.title(), category='finished_good', unit='pcs', created_by=self.user
+            )
+            recipe = Recipe.objects.create(
+                name=f'{code.title()} Recipe', product=product, yield_qty=10, yield_unit='pcs', created_by=self.user
+            )
+            RecipeItem.objects.create(recipe=recipe, ingredient=self.flour, qty=4, unit='kg', loss_factor=0)
+            self.recipes.append(recipe)
+    
+    def runs(self, qty=10):
+        return [
+            {'recipe': recipe, 'production_qty': qty, 'lot_no': f'{recipe.product.code}-LOT'}
+            for recipe in self.recipes
+        ]
+    
+    def test_produce_batch_allocates_fefo_across_runs(self):
+        """Test runs share the ingredient pool in FEFO order"""
+        results = ProductionService.produce_batch(self.runs(), self.user)
+        
+        self.assertEqual(len(results), 2)
+        self.assertEqual([(lot.lot_no, qty) for _, lot, qty in results[0]['consumed']], [('FLOUR-OLD', 4)])
+        self.assertEqual(
+            [(lot.lot_no, qty) for _, lot, qty in results[1]['consumed']],
+            [('FLOUR-OLD', 2), ('FLOUR-NEW', 2)]
+        )
+        self.old_lot.refresh_from_db()
+        self.new_lot.refresh_from_db()
+        self.assertEqual(self.old_lot.qty, 0)
+        self.assertEqual(self.new_lot.qty, 8)
+        self.assertEqual(ItemStockBalance.objects.get(item=self.flour).on_hand_qty, 8)
+        for recipe in self.recipes:
+            self.assertEqual(recipe.product.get_current_stock(), 10)
+    
+    def test_pooled_shortage_rejects_whole_batch(self):
+        """Test demand is validated across runs and nothing is written when short"""
+        runs = self.runs(qty=25)  # 10 kg each run, 16 kg in stock
+        
+        validation = ProductionService.validate_batch(runs)
+        self.assertFalse(validation['can_produce'])
+        self.assertEqual(validation['missing_ingredients'][0]['needed'], 20)
+        
+        with self.assertRaises(ValueError):
+            ProductionService.produce_batch(runs, self.user)
+        
+        self.old_lot.refresh_from_db()
+        self.assertEqual(self.old_lot.qty, 6)
+        self.assertFalse(StockMovement.objects.exists())
+    
+    def test_batch_view_and_command(self):
+        """Test the batch production view and management command"""
+        client = Client()
+        client.force_login(self.user)
+        data = {
+            'form-TOTAL_FORMS': '2', 'form-INITIAL_FORMS': '0',
+            'form-0-recipe': self.recipes[0].pk, 'form-0-production_qty': '10', 'form-0-lot_no': 'WEB-1',
+            'form-1-recipe': '', 'form-1-production_qty': '', 'form-1-lot_no': '',
+        }
+        response = client.post(reverse('inventory:production_batch_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['results']), 1)
+        self.assertTrue(StockLot.objects.filter(lot_no='WEB-1', qty=10).exists())
+        
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('recipe,qty,lot_no\n')
+            handle.write(f'{self.recipes[1].name},10,CLI-1\n')
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('produce_batch', handle.name, '--user', 'testuser', stdout=out)
+        self.assertIn('Produced 1 run(s).', out.getvalue())
+        self.assertTrue(StockLot.objects.filter(lot_no='CLI-1', qty=10).exists())
+        
+        with self.assertRaises(CommandError):
+            call_command('produce_batch', handle.name, '--user', 'nobody', stdout=StringIO())
+
 
 class UserAccessTestCase(TestCase):
     """Test cases for UserAccess model"""
@@ -1125,6 +1560,101 @@ class UserAccessTestCase(TestCase):
         self.assertFalse(access2.is_expired())
 
 
+class PermissionResolverTestCase(TestCase):
+    """Test cases for the memoized per-request permission resolver"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from .security import resolve_user_permissions, invalidate_user_permissions
+        self.resolve_user_permissions = resolve_user_permissions
+        self.invalidate_user_permissions = invalidate_user_permissions
+        
+        self.admin = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        
+        self.staff = User.objects.create_user(
+            username='staff',
+            email='staff@test.com',
+            password='testpass123',
+            role='staff'
+        )
+        
+        UserAccess.objects.create(
+            user=self.staff,
+            permission_type='inventory_read',
+            granted_by=self.admin
+        )
+    
+    def _access_queries(self, queries):
+        return [q for q in queries if 'user_access' in q['sql']]
+    
+    def test_permissions_memoized_on_user(self):
+        """Test repeated permission checks on one user run a single query"""
+        staff = User.objects.get(pk=self.staff.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(staff.has_permission('inventory_read'))
+            self.assertFalse(staff.has_permission('inventory_write'))
+            self.assertTrue(staff.has_permission('inventory_read'))
+    
+    def test_grant_and_revoke_invalidate(self):
+        """Test granting or revoking bumps the version stamp so fresh loads see the change"""
+        staff = User.objects.get(pk=self.staff.pk)
+        self.assertFalse(staff.has_permission('reports_read'))
+        
+        UserAccess.objects.create(user=self.staff, permission_type='reports_read', granted_by=self.admin)
+        staff = User.objects.get(pk=self.staff.pk)
+        self.assertTrue(staff.has_permission('reports_read'))
+        
+        UserAccess.objects.filter(user=self.staff, permission_type='reports_read').update(is_active=False)
+        self.invalidate_user_permissions(staff)
+        self.assertFalse(staff.has_permission('reports_read'))
+    
+    def test_expired_grants_are_excluded(self):
+        """Test expired grants are ignored and a stored set lapses with its earliest expiry"""
+        UserAccess.objects.create(
+            user=self.staff,
+            permission_type='reports_read',
+            granted_by=self.admin,
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+        access = UserAccess.objects.create(
+            user=self.staff,
+            permission_type='inventory_write',
+            granted_by=self.admin,
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+        staff = User.objects.get(pk=self.staff.pk)
+        self.assertEqual(self.resolve_user_permissions(staff), {'inventory_read', 'inventory_write'})
+        
+        # Expire the grant behind the resolver's back; the stored valid_until forces a reload
+        UserAccess.objects.filter(pk=access.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        staff._permission_entry['valid_until'] = (timezone.now() - timedelta(seconds=1)).isoformat()
+        self.assertEqual(self.resolve_user_permissions(staff), {'inventory_read'})
+    
+    def test_session_skips_permission_queries(self):
+        """Test later requests reuse the session's permission set until it is invalidated"""
+        client = Client()
+        client.login(username='staff', password='testpass123')
+        url = reverse('inventory:item_list')
+        
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._access_queries(ctx.captured_queries), [])
+        
+        UserAccess.objects.filter(user=self.staff).update(is_active=False)
+        self.invalidate_user_permissions(self.staff)
+        response = client.get(url)
+        self.assertRedirects(response, reverse('inventory:dashboard'), fetch_redirect_response=False)
+
+
 class UserLinksTestCase(TestCase):
     """Test cases for UserLinks model"""
     
@@ -1284,3 +1814,1448 @@ class MultiLotConsumptionTestCase(TestCase):
         # LOT001 should have 30 remaining (50 - 20)
         self.assertEqual(lot1.qty, 30)
 
+    
+    def test_consume_specific_lot_overflows_in_fefo_order(self):
+        """Test overflow from a chosen lot continues with the earliest-expiring lots"""
+        chosen = StockLot.objects.create(
+            item=self.item, lot_no='LOT001', qty=10, unit='kg',
+            expires_at=timezone.now().date() + timedelta(days=30), created_by=self.user
+        )
+        early = StockLot.objects.create(
+            item=self.item, lot_no='LOT002', qty=10, unit='kg',
+            expires_at=timezone.now().date() + timedelta(days=5), created_by=self.user
+        )
+        
+        InventoryService.consume_stock(
+            item=self.item, qty=15, reason='Production', user=self.user, lot=chosen
+        )
+        
+        chosen.refresh_from_db()
+        early.refresh_from_db()
+        self.assertEqual(chosen.qty, 0)
+        self.assertEqual(early.qty, 5)
+        overflow = StockMovement.objects.get(lot=early, movement_type='consume')
+        self.assertEqual(overflow.notes, 'Overflow from lot LOT001')
+    
+    def test_insufficient_stock_leaves_lots_untouched(self):
+        """Test a failed consumption rolls back every lot decrement"""
+        lot = StockLot.objects.create(
+            item=self.item, lot_no='LOT001', qty=10, unit='kg',
+            expires_at=timezone.now().date() + timedelta(days=30), created_by=self.user
+        )
+        
+        with self.assertRaises(ValueError):
+            InventoryService.consume_stock(item=self.item, qty=11, reason='Production', user=self.user)
+        
+        lot.refresh_from_db()
+        self.assertEqual(lot.qty, 10)
+        self.assertFalse(StockMovement.objects.filter(movement_type='consume').exists())
+
+
+class ConcurrentConsumptionTestCase(TransactionTestCase):
+    """Stress test concurrent consumers of the same item"""
+    
+    WORKERS = 50
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123'
+        )
+        
+        self.item = Item.objects.create(
+            code='TEST001',
+            name='Test Item',
+            category='ingredient',
+            unit='kg',
+            is_perishable=True,
+            shelf_life_days=30,
+            created_by=self.user
+        )
+        
+        for index, days in enumerate([10, 20, 30]):
+            StockLot.objects.create(
+                item=self.item,
+                lot_no=f'LOT00{index + 1}',
+                qty=Decimal('33.34') if index == 0 else Decimal('33.33'),
+                unit='kg',
+                expires_at=timezone.now().date() + timedelta(days=days),
+                created_by=self.user
+            )
+    
+    def test_concurrent_consumers_never_oversell(self):
+        """Test 50 threads consuming 3 kg each from 100 kg of stock"""
+        qty = Decimal('3')
+        barrier = threading.Barrier(self.WORKERS)
+        results = []
+        lock = threading.Lock()
+        
+        def worker():
+            try:
+                barrier.wait()
+                InventoryService.consume_stock(
+                    item=self.item, qty=qty, reason='Production', user=self.user
+                )
+                outcome = True
+            except Exception:
+                # Insufficient stock, or "database is locked" on backends without row locks
+                outcome = False
+            finally:
+                connections.close_all()
+            with lock:
+                results.append(outcome)
+        
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        successes = results.count(True)
+        lots = StockLot.objects.filter(item=self.item)
+        remaining = sum(lot.qty for lot in lots)
+        consumed = sum(
+            movement.qty for movement in StockMovement.objects.filter(item=self.item, movement_type='consume')
+        )
+        
+        self.assertEqual(len(results), self.WORKERS)
+        self.assertFalse(lots.filter(qty__lt=0).exists())
+        self.assertEqual(consumed, qty * successes)
+        self.assertEqual(remaining + consumed, Decimal('100'))
+        self.assertEqual(ItemStockBalance.objects.get(item=self.item).on_hand_qty, remaining)
+        if connection.features.has_select_for_update:
+            self.assertEqual(successes, 33)
+
+
+class SequenceCounterTestCase(TestCase):
+    """Test cases for sequence-allocated item codes, order numbers and lot numbers"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='testuser', email='test@test.com', password='testpass123')
+        self.supplier = Supplier.objects.create(name='Test Supplier', created_by=self.user)
+    
+    def test_reserve_blocks(self):
+        """Reservations hand out consecutive, non-overlapping blocks"""
+        self.assertEqual(SequenceCounter.reserve('test'), range(1, 2))
+        self.assertEqual(SequenceCounter.reserve('test', 5), range(2, 7))
+        self.assertEqual(SequenceCounter.reserve('other', start=lambda: 41), range(42, 43))
+        self.assertEqual(SequenceCounter.objects.get(key='test').value, 6)
+        with self.assertRaises(ValueError):
+            SequenceCounter.reserve('test', 0)
+    
+    def test_item_codes_continue_existing_codes(self):
+        """The first code of a month follows codes issued before the counter existed"""
+        prefix = timezone.now().strftime('%Y%m')
+        Item.objects.create(code=f'{prefix}0007', name='Legacy', category='ingredient', unit='kg', created_by=self.user)
+        
+        item = Item.objects.create(name='Flour', category='ingredient', unit='kg', created_by=self.user)
+        self.assertEqual(item.code, f'{prefix}0008')
+        self.assertEqual(Item.generate_item_codes(3), [f'{prefix}0009', f'{prefix}0010', f'{prefix}0011'])
+        self.assertEqual(Item.generate_item_codes(1, month=date(2020, 1, 1)), ['2020010001'])
+    
+    def test_order_numbers(self):
+        """Order numbers count up per day without reading the last order"""
+        prefix = f"PO-{timezone.now():%Y%m%d}"
+        first = PurchaseOrder.objects.create(supplier=self.supplier, created_by=self.user)
+        
+        with CaptureQueriesContext(connection) as queries:
+            numbers = PurchaseOrder.generate_order_numbers(2)
+        self.assertEqual(first.order_no, f'{prefix}-0001')
+        self.assertEqual(numbers, [f'{prefix}-0002', f'{prefix}-0003'])
+        self.assertFalse(any('"purchase_order"' in query['sql'] for query in queries.captured_queries))
+    
+    def test_generated_lot_numbers_do_not_collide(self):
+        """Adjustments in the same second get distinct lot numbers"""
+        item = Item.objects.create(name='Sugar', category='ingredient', unit='kg', created_by=self.user)
+        for _ in range(3):
+            InventoryService.adjust_stock(item=item, qty=Decimal('1'), reason='Count', user=self.user)
+        
+        lot_numbers = list(StockLot.objects.filter(item=item).values_list('lot_no', flat=True))
+        self.assertEqual(len(set(lot_numbers)), 3)
+        self.assertEqual(
+            InventoryService.generate_lot_numbers('LOT', 2, item=item),
+            [f"LOT-{item.code}-{timezone.localdate():%Y%m%d}-{number:04d}" for number in (1, 2)]
+        )
+    
+    def test_stock_receive_generates_lot_number(self):
+        """Stock received without a lot number gets one from the sequence"""
+        client = Client()
+        admin = User.objects.create_user(username='admin', email='admin@test.com', password='testpass123', role='admin')
+        client.force_login(admin)
+        item = Item.objects.create(name='Butter', category='ingredient', unit='kg', created_by=self.user)
+        
+        for _ in range(2):
+            client.post(reverse('inventory:stock_receive'), {'item': item.id, 'qty': '5', 'unit': 'kg', 'unit_cost': '1'})
+        self.assertEqual(
+            sorted(StockLot.objects.filter(item=item).values_list('lot_no', flat=True)),
+            [f"LOT-{item.code}-{timezone.localdate():%Y%m%d}-{number:04d}" for number in (1, 2)]
+        )
+
+
+class ConcurrentSequenceTestCase(TransactionTestCase):
+    """Concurrent creates never draw the same code"""
+    
+    WORKERS = 20
+    
+    def test_concurrent_item_creates(self):
+        """Test 20 threads creating items at once"""
+        user = User.objects.create_user(username='testuser', email='test@test.com', password='testpass123')
+        barrier = threading.Barrier(self.WORKERS)
+        results = []
+        lock = threading.Lock()
+        
+        def worker(n):
+            try:
+                barrier.wait()
+                outcome = Item.objects.create(name=f'Item {n}', category='ingredient', unit='kg', created_by=user).code
+            except Exception as error:
+                # "database is locked" on backends without row locks
+                outcome = error
+            finally:
+                connections.close_all()
+            with lock:
+                results.append(outcome)
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        codes = [result for result in results if isinstance(result, str)]
+        self.assertEqual(len(codes), len(set(codes)))
+        self.assertEqual(sorted(codes), sorted(Item.objects.values_list('code', flat=True)))
+        if connection.features.has_select_for_update:
+            self.assertEqual(len(codes), self.WORKERS)
+
+
+class ItemStockBalanceTestCase(TestCase):
+    """Test cases for the materialized ItemStockBalance"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123'
+        )
+        
+        self.item = Item.objects.create(
+            code='TEST001',
+            name='Test Item',
+            category='ingredient',
+            unit='kg',
+            is_perishable=True,
+            shelf_life_days=30,
+            reorder_level=10,
+            created_by=self.user
+        )
+    
+    def test_receive_and_consume_update_balance(self):
+        """Test stock services keep the balance in step with lots"""
+        expiry = timezone.now().date() + timedelta(days=5)
+        InventoryService.receive_stock(
+            item=self.item,
+            lot_no='LOT001',
+            qty=100,
+            unit='kg',
+            user=self.user,
+            expires_at=expiry,
+            unit_cost=2
+        )
+        InventoryService.receive_stock(
+            item=self.item,
+            lot_no='LOT002',
+            qty=50,
+            unit='kg',
+            user=self.user,
+            expires_at=expiry + timedelta(days=10),
+            unit_cost=4
+        )
+        
+        balance = ItemStockBalance.objects.get(item=self.item)
+        self.assertEqual(balance.on_hand_qty, 150)
+        self.assertEqual(balance.on_hand_value, 400)
+        self.assertEqual(balance.lot_count, 2)
+        self.assertEqual(balance.earliest_expiry, expiry)
+        
+        # Consuming the first lot entirely moves the earliest expiry forward
+        InventoryService.consume_stock(
+            item=self.item,
+            qty=100,
+            reason='Production',
+            user=self.user
+        )
+        
+        balance.refresh_from_db()
+        self.assertEqual(balance.on_hand_qty, 50)
+        self.assertEqual(balance.on_hand_value, 200)
+        self.assertEqual(balance.lot_count, 1)
+        self.assertEqual(balance.earliest_expiry, expiry + timedelta(days=10))
+    
+    def test_adjust_and_damage_update_balance(self):
+        """Test adjustments and damage logs update the balance"""
+        InventoryService.adjust_stock(
+            item=self.item,
+            qty=40,
+            reason='Inventory correction',
+            user=self.user
+        )
+        self.assertEqual(ItemStockBalance.objects.get(item=self.item).on_hand_qty, 40)
+        
+        lot = StockLot.objects.get(item=self.item)
+        InventoryService.log_damage(
+            item=self.item,
+            qty=Decimal('15'),
+            unit='kg',
+            reason='Accident/Breakage: dropped',
+            user=self.user,
+            lot=lot
+        )
+        self.assertEqual(ItemStockBalance.objects.get(item=self.item).on_hand_qty, 25)
+    
+    def test_with_stock_balance_defaults_to_zero(self):
+        """Test items without a balance row annotate as zero stock"""
+        item = Item.objects.with_stock_balance().get(pk=self.item.pk)
+        self.assertEqual(item.balance_qty, 0)
+        self.assertEqual(item.balance_lot_count, 0)
+        
+        low_stock = InventoryService.get_low_stock_items()
+        self.assertIn(self.item, [data['item'] for data in low_stock])
+    
+    def test_rebuild_stock_balances_command(self):
+        """Test rebuild command reconciles balances with lots changed outside the services"""
+        
+        StockLot.objects.create(
+            item=self.item,
+            lot_no='LOT001',
+            qty=30,
+            unit='kg',
+            unit_cost=1,
+            created_by=self.user
+        )
+        self.assertFalse(ItemStockBalance.objects.filter(item=self.item).exists())
+        
+        out = StringIO()
+        call_command('rebuild_stock_balances', '--dry-run', stdout=out)
+        self.assertIn('Found 1 drifted', out.getvalue())
+        self.assertFalse(ItemStockBalance.objects.filter(item=self.item).exists())
+        
+        call_command('rebuild_stock_balances', stdout=StringIO())
+        self.assertEqual(ItemStockBalance.objects.get(item=self.item).on_hand_qty, 30)
+    
+    def assertBalanceMatchesLots(self, item):
+        """The balance row equals the sum over the item's lots"""
+        lots = StockLot.objects.filter(item=item, qty__gt=0)
+        balance = ItemStockBalance.objects.get(item=item)
+        self.assertEqual(balance.on_hand_qty, sum((lot.qty for lot in lots), Decimal('0')))
+        self.assertEqual(balance.on_hand_value, sum((lot.qty * lot.unit_cost for lot in lots), Decimal('0')))
+        self.assertEqual(balance.lot_count, lots.count())
+    
+    def test_balance_matches_lots_after_every_operation(self):
+        """Test every stock service leaves the balance equal to Sum(StockLot.qty)"""
+        InventoryService.receive_stock(item=self.item, lot_no='LOT001', qty=60, unit='kg', user=self.user, unit_cost=2)
+        self.assertBalanceMatchesLots(self.item)
+        lot = InventoryService.receive_stock(item=self.item, lot_no='LOT002', qty=40, unit='kg', user=self.user, unit_cost=3)
+        self.assertBalanceMatchesLots(self.item)
+        InventoryService.consume_stock(item=self.item, qty=70, reason='Production', user=self.user)
+        self.assertBalanceMatchesLots(self.item)
+        InventoryService.adjust_stock(item=self.item, qty=-5, reason='Count', user=self.user)
+        self.assertBalanceMatchesLots(self.item)
+        InventoryService.log_damage(item=self.item, qty=Decimal('5'), unit='kg', reason='Spoiled', user=self.user, lot=lot)
+        self.assertBalanceMatchesLots(self.item)
+    
+    def test_lot_changes_use_database_quantity(self):
+        """Test damage and lot adjustments apply to the stored quantity, not a stale instance, and never overdraw"""
+        InventoryService.receive_stock(item=self.item, lot_no='LOT001', qty=20, unit='kg', user=self.user, unit_cost=2)
+        first = StockLot.objects.get(lot_no='LOT001')
+        stale = StockLot.objects.get(lot_no='LOT001')
+        
+        InventoryService.log_damage(item=self.item, qty=Decimal('5'), unit='kg', reason='Spoiled', user=self.user, lot=first)
+        InventoryService.log_damage(item=self.item, qty=Decimal('5'), unit='kg', reason='Spoiled', user=self.user, lot=stale)
+        self.assertEqual(stale.qty, 10)
+        InventoryService.adjust_stock(item=self.item, qty=-4, reason='Count', user=self.user, lot=first)
+        self.assertEqual(first.qty, 6)
+        
+        with self.assertRaises(ValueError):
+            InventoryService.log_damage(item=self.item, qty=Decimal('7'), unit='kg', reason='Spoiled', user=self.user, lot=stale)
+        with self.assertRaises(ValueError):
+            InventoryService.adjust_stock(item=self.item, qty=-7, reason='Count', user=self.user, lot=stale)
+        
+        self.assertEqual(StockLot.objects.get(lot_no='LOT001').qty, 6)
+        self.assertEqual(StockMovement.objects.filter(movement_type='damage').count(), 2)
+        self.assertBalanceMatchesLots(self.item)
+    
+    def test_lock_creates_missing_balance_rows(self):
+        """Test locking an item without a balance row creates an empty one"""
+        with transaction.atomic():
+            InventoryService.lock_stock_balances([self.item])
+        balance = ItemStockBalance.objects.get(item=self.item)
+        self.assertEqual(balance.on_hand_qty, 0)
+
+
+class ConcurrentStockBalanceTestCase(TransactionTestCase):
+    """Concurrent stock operations on one item keep its balance equal to its lots"""
+    
+    WORKERS = 10
+    
+    def test_concurrent_receive_and_consume(self):
+        """Test threads receiving and consuming the same item at once"""
+        user = User.objects.create_user(username='testuser', email='test@test.com', password='testpass123')
+        item = Item.objects.create(name='Flour', category='ingredient', unit='kg', created_by=user)
+        InventoryService.receive_stock(item=item, lot_no='LOT-START', qty=100, unit='kg', user=user, unit_cost=2)
+        barrier = threading.Barrier(self.WORKERS)
+        
+        def worker(n):
+            try:
+                barrier.wait()
+                if n % 2:
+                    InventoryService.consume_stock(item=item, qty=3, reason='Production', user=user)
+                else:
+                    InventoryService.receive_stock(item=item, lot_no=f'LOT-{n}', qty=5, unit='kg', user=user, unit_cost=4)
+            except Exception:
+                # "database is locked" on backends without row locks
+                pass
+            finally:
+                connections.close_all()
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        lots = StockLot.objects.filter(item=item, qty__gt=0)
+        balance = ItemStockBalance.objects.get(item=item)
+        self.assertEqual(balance.on_hand_qty, sum((lot.qty for lot in lots), Decimal('0')))
+        self.assertEqual(balance.on_hand_value, sum((lot.qty * lot.unit_cost for lot in lots), Decimal('0')))
+        
+        received = DailyMovementRollup.objects.get(item=item, movement_type='receive')
+        self.assertEqual(received.count, StockMovement.objects.filter(item=item, movement_type='receive').count())
+
+
+class ItemListTestCase(TestCase):
+    """Test cases for the database-annotated item list"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        self.client = Client()
+        self.client.login(username='admin', password='testpass123')
+        self.url = reverse('inventory:item_list')
+        
+        # ITEM00..ITEM04 hold 0, 5, 10, 15, 20 kg against a reorder level of 10
+        self.items = []
+        for n in range(5):
+            item = Item.objects.create(
+                code=f'ITEM{n:02d}',
+                name=f'Item {n}',
+                category='ingredient',
+                unit='kg',
+                reorder_level=10,
+                created_by=self.user
+            )
+            if n:
+                InventoryService.receive_stock(
+                    item=item,
+                    lot_no=f'LOT{n}',
+                    qty=n * 5,
+                    unit='kg',
+                    user=self.user,
+                    expires_at=timezone.now().date() + timedelta(days=3 if n == 4 else 60)
+                )
+            self.items.append(item)
+    
+    def _codes(self, response):
+        return [row['item'].code for row in response.context['items_with_stock']]
+    
+    def test_annotations(self):
+        """Test stock, low-stock flag and expiring count come from annotations"""
+        rows = {row['item'].code: row for row in self.client.get(self.url).context['items_with_stock']}
+        self.assertEqual(rows['ITEM03']['current_stock'], 15)
+        self.assertTrue(rows['ITEM02']['is_low_stock'])
+        self.assertFalse(rows['ITEM03']['is_low_stock'])
+        self.assertEqual(rows['ITEM04']['expiring_soon'], 1)
+        self.assertEqual(rows['ITEM03']['expiring_soon'], 0)
+    
+    def test_query_count_independent_of_catalogue_size(self):
+        """Test listing items costs the same number of queries for 5 or 25 items"""
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        for n in range(5, 25):
+            Item.objects.create(code=f'ITEM{n:02d}', name=f'Item {n}', category='ingredient', unit='kg', created_by=self.user)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+    
+    def test_stock_filters(self):
+        """Test low, out-of-stock and expiring filters"""
+        self.assertEqual(self._codes(self.client.get(self.url, {'stock': 'low'})), ['ITEM00', 'ITEM01', 'ITEM02'])
+        self.assertEqual(self._codes(self.client.get(self.url, {'stock': 'out'})), ['ITEM00'])
+        self.assertEqual(self._codes(self.client.get(self.url, {'stock': 'expiring'})), ['ITEM04'])
+    
+    def test_sort_by_stock_pages_by_cursor(self):
+        """Test sorting by stock keeps the order across cursor pages"""
+        for n in range(5, 25):
+            Item.objects.create(code=f'ITEM{n:02d}', name=f'Item {n}', category='ingredient', unit='kg', created_by=self.user)
+        
+        response = self.client.get(self.url, {'sort': '-stock'})
+        codes = self._codes(response)
+        self.assertEqual(codes[:4], ['ITEM04', 'ITEM03', 'ITEM02', 'ITEM01'])
+        cursor = response.context['items_with_stock'].next_cursor
+        codes += self._codes(self.client.get(self.url, {'sort': '-stock', 'cursor': cursor}))
+        self.assertEqual(len(codes), 25)
+        self.assertEqual(len(set(codes)), 25)
+
+
+class RecipeCostCacheTestCase(TestCase):
+    """Test cases for cached average costs and recipe cost rollups"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        self.flour = Item.objects.create(code='ING001', name='Flour', category='ingredient', unit='kg', created_by=self.user)
+        self.sugar = Item.objects.create(code='ING002', name='Sugar', category='ingredient', unit='kg', created_by=self.user)
+        self.product = Item.objects.create(code='PROD001', name='Bread', category='finished_good', unit='pcs', created_by=self.user)
+        
+        self.recipe = Recipe.objects.create(
+            name='Bread Recipe', product=self.product, yield_qty=10, yield_unit='pcs', created_by=self.user
+        )
+        RecipeItem.objects.create(recipe=self.recipe, ingredient=self.flour, qty=2, unit='kg', loss_factor=10)
+        RecipeItem.objects.create(recipe=self.recipe, ingredient=self.sugar, qty=1, unit='kg', loss_factor=0)
+    
+    def test_average_cost_follows_lot_changes(self):
+        """Test cached weighted average cost is updated on receive and consume"""
+        InventoryService.receive_stock(item=self.flour, lot_no='F1', qty=10, unit='kg', user=self.user, unit_cost=40)
+        InventoryService.receive_stock(item=self.flour, lot_no='F2', qty=30, unit='kg', user=self.user, unit_cost=60)
+        self.assertEqual(InventoryService.calculate_item_cost(self.flour), Decimal('55'))
+        
+        InventoryService.consume_stock(item=self.flour, qty=10, reason='Test', user=self.user)
+        self.assertEqual(InventoryService.calculate_item_cost(self.flour), Decimal('60'))
+        self.assertEqual(InventoryService.calculate_item_cost(self.sugar), Decimal('0'))
+    
+    def test_recipe_cost_rollup(self):
+        """Test recipe cost is rolled up from cached ingredient costs"""
+        InventoryService.receive_stock(item=self.flour, lot_no='F1', qty=10, unit='kg', user=self.user, unit_cost=50)
+        InventoryService.receive_stock(item=self.sugar, lot_no='S1', qty=10, unit='kg', user=self.user, unit_cost=30)
+        
+        # 2 kg flour + 10% loss at 50, 1 kg sugar at 30
+        self.assertEqual(RecipeService.calculate_recipe_cost(self.recipe), Decimal('140'))
+        recipe = Recipe.objects.with_cost().get(pk=self.recipe.pk)
+        self.assertEqual(recipe.total_cost, Decimal('140'))
+        self.assertEqual(recipe.ingredient_count, 2)
+        
+        InventoryService.adjust_stock(
+            item=self.sugar, qty=5, reason='Count', user=self.user,
+            lot=StockLot.objects.get(lot_no='S1')
+        )
+        InventoryService.receive_stock(item=self.sugar, lot_no='S2', qty=15, unit='kg', user=self.user, unit_cost=40)
+        self.assertEqual(RecipeService.calculate_recipe_cost(self.recipe), Decimal('145'))
+    
+    def test_calculate_item_costs_single_query(self):
+        """Test bulk weighted average costs are read from the cached balances with one query"""
+        StockLot.objects.create(item=self.flour, lot_no='F1', qty=10, unit='kg', unit_cost=40, created_by=self.user)
+        StockLot.objects.create(item=self.flour, lot_no='F2', qty=30, unit='kg', unit_cost=60, created_by=self.user)
+        StockLot.objects.create(item=self.sugar, lot_no='S1', qty=0, unit='kg', unit_cost=99, created_by=self.user)
+        InventoryService.refresh_stock_balances([self.flour, self.sugar])
+        
+        with self.assertNumQueries(1):
+            costs = InventoryService.calculate_item_costs([self.flour.id, self.sugar.id, self.product.id])
+        
+        self.assertEqual(costs, {self.flour.id: Decimal('55'), self.sugar.id: Decimal('0'), self.product.id: Decimal('0')})
+        self.assertEqual(costs[self.flour.id], InventoryService.calculate_item_cost(self.flour))
+        
+        with self.assertNumQueries(3):
+            validation = RecipeService.validate_recipe_production(self.recipe, production_qty=10)
+        self.assertFalse(validation['can_produce'])
+        self.assertEqual(validation['total_cost'], Decimal('121'))
+    
+    def test_recipe_list_query_count_independent_of_recipes(self):
+        """Test recipe list cost lookups do not grow with the number of recipes"""
+        client = Client()
+        client.force_login(self.user)
+        
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(client.get(reverse('inventory:recipe_list')).status_code, 200)
+        
+        for index in range(10):
+            recipe = Recipe.objects.create(
+                name=f'Recipe {index}', product=self.product, yield_qty=1, yield_unit='pcs', created_by=self.user
+            )
+            RecipeItem.objects.create(recipe=recipe, ingredient=self.flour, qty=1, unit='kg')
+        
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(client.get(reverse('inventory:recipe_list')).status_code, 200)
+        
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+
+class StockReportTestCase(TestCase):
+    """Test cases for the set-based stock report"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+        
+        self.flour = Item.objects.create(
+            code='ING001', name='Flour', category='ingredient', unit='kg', reorder_level=50, created_by=self.user
+        )
+        self.sugar = Item.objects.create(
+            code='ING002', name='Sugar', category='ingredient', unit='kg', reorder_level=5, created_by=self.user
+        )
+        InventoryService.receive_stock(
+            item=self.flour, lot_no='F1', qty=40, unit='kg', user=self.user, unit_cost=10,
+            expires_at=timezone.now().date() + timedelta(days=3)
+        )
+        InventoryService.receive_stock(item=self.sugar, lot_no='S1', qty=20, unit='kg', user=self.user, unit_cost=5)
+        InventoryService.consume_stock(item=self.flour, qty=15, reason='Production', user=self.user)
+        InventoryService.adjust_stock(item=self.sugar, qty=2, reason='Count', user=self.user)
+    
+    def test_report_rows_and_summary(self):
+        """Test report rows aggregate movements, stock, cost and expiry per item"""
+        response = self.client.get(reverse('inventory:stock_report'))
+        self.assertEqual(response.status_code, 200)
+        
+        rows = {row['item'].code: row for row in response.context['report_data']}
+        self.assertEqual(rows['ING001']['current_stock'], 25)
+        self.assertEqual(rows['ING001']['consumed'], 15)
+        self.assertEqual(rows['ING001']['received'], 40)
+        self.assertEqual(rows['ING001']['item_value'], 250)
+        self.assertEqual(rows['ING001']['expiring_soon'], 1)
+        self.assertTrue(rows['ING001']['is_low_stock'])
+        self.assertEqual(rows['ING002']['adjusted'], 2)
+        self.assertFalse(rows['ING002']['is_low_stock'])
+        
+        summary = response.context['summary']
+        self.assertEqual(summary['total_items'], 2)
+        self.assertEqual(summary['low_stock_count'], 1)
+        self.assertEqual(summary['total_received'], 60)
+        
+        response = self.client.get(reverse('inventory:stock_report'), {'low_stock': '1'})
+        self.assertEqual([row['item'].code for row in response.context['report_data']], ['ING001'])
+    
+    def test_past_period_shows_snapshot_value(self):
+        """Test a report ending in the past shows the on-hand value from snapshots"""
+        InventoryService.snapshot_inventory(timezone.localdate() - timedelta(days=10))
+        date_to = (timezone.localdate() - timedelta(days=5)).strftime('%Y-%m-%d')
+        
+        response = self.client.get(reverse('inventory:stock_report'), {'report_type': 'custom', 'date_to': date_to})
+        
+        self.assertEqual(response.context['historical_value']['value'], Decimal('350'))
+        self.assertEqual(response.context['historical_value']['date'], timezone.localdate() - timedelta(days=10))
+    
+    def test_csv_export_streams(self):
+        """Test CSV export is streamed and ends with the summary"""
+        response = self.client.get(reverse('inventory:stock_report'), {'export': 'csv'})
+        self.assertTrue(response.streaming)
+        
+        content = b''.join(response.streaming_content).decode('utf-8')
+        lines = content.splitlines()
+        self.assertTrue(lines[0].startswith('Item Code,Item Name'))
+        self.assertTrue(lines[1].startswith('ING001,Flour'))
+        self.assertIn('Total Items,2', content)
+    
+    def test_query_count_independent_of_items(self):
+        """Test the report issues a fixed number of queries"""
+        with CaptureQueriesContext(connection) as few:
+            list(InventoryService.get_stock_report())
+        
+        for index in range(20):
+            item = Item.objects.create(code=f'BULK{index:03d}', name=f'Bulk {index}', category='ingredient', unit='kg')
+            InventoryService.receive_stock(item=item, lot_no=f'B{index}', qty=5, unit='kg', user=self.user)
+        
+        with CaptureQueriesContext(connection) as many:
+            rows = list(InventoryService.get_stock_report())
+        
+        self.assertEqual(len(rows), 22)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+
+class DailyMovementRollupTestCase(TestCase):
+    """Test cases for daily movement rollups"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        self.item = Item.objects.create(code='ING001', name='Flour', category='ingredient', unit='kg', created_by=self.user)
+    
+    def test_services_maintain_rollups(self):
+        """Test receive and consume keep today's rollup buckets current"""
+        InventoryService.receive_stock(item=self.item, lot_no='L1', qty=10, unit='kg', user=self.user, unit_cost=5)
+        InventoryService.receive_stock(item=self.item, lot_no='L2', qty=20, unit='kg', user=self.user, unit_cost=5)
+        InventoryService.consume_stock(item=self.item, qty=15, reason='Production', user=self.user)
+        
+        today = timezone.localdate()
+        received = DailyMovementRollup.objects.get(date=today, item=self.item, movement_type='receive')
+        consumed = DailyMovementRollup.objects.get(date=today, item=self.item, movement_type='consume')
+        self.assertEqual((received.count, received.qty, received.value), (2, 30, 150))
+        self.assertEqual((consumed.count, consumed.qty, consumed.value), (2, 15, 75))
+        
+        series = DashboardMetricsService.get_daily_movement_series()
+        self.assertEqual(series['receive'][-1], 2)
+        self.assertEqual(series['consume'][-1], 2)
+        self.assertEqual(series['produce'], [0] * 7)
+        
+        activity = DashboardMetricsService.get_movement_activity()
+        self.assertEqual(activity['counts']['receive'], 2)
+        self.assertEqual(activity['top_consumed'][0]['total_qty'], 15)
+    
+    def test_increments_match_recalculation(self):
+        """Test incremented buckets equal a full recalculation from the movements"""
+        InventoryService.receive_stock(item=self.item, lot_no='L1', qty=10, unit='kg', user=self.user, unit_cost=Decimal('2.25'))
+        lot = InventoryService.receive_stock(item=self.item, lot_no='L2', qty=5, unit='kg', user=self.user, unit_cost=3)
+        InventoryService.consume_stock(item=self.item, qty=12, reason='Production', user=self.user)
+        InventoryService.adjust_stock(item=self.item, qty=4, reason='Count', user=self.user)
+        InventoryService.log_damage(item=self.item, qty=Decimal('1'), unit='kg', reason='Spoiled', user=self.user, lot=lot)
+        
+        def buckets():
+            return sorted(DailyMovementRollup.objects.values_list('date', 'item_id', 'movement_type', 'count', 'qty', 'value'))
+        
+        incremented = buckets()
+        InventoryService.refresh_movement_rollups()
+        self.assertEqual(incremented, buckets())
+        self.assertEqual(len(incremented), 4)
+    
+    def test_increment_query_count(self):
+        """Test existing buckets are locked and incremented with two queries"""
+        InventoryService.receive_stock(item=self.item, lot_no='L1', qty=10, unit='kg', user=self.user, unit_cost=5)
+        movements = [
+            StockMovement.objects.create(item=self.item, movement_type=movement_type, qty=1, unit='kg', created_by=self.user)
+            for movement_type in ('receive', 'receive')
+        ]
+        
+        with self.assertNumQueries(2):
+            InventoryService.record_movement_rollups(movements)
+        
+        received = DailyMovementRollup.objects.get(item=self.item, movement_type='receive')
+        self.assertEqual((received.count, received.qty, received.value), (3, 12, 50))
+    
+    def test_backfill_command(self):
+        """Test backfill rebuilds rollups from movement history"""
+        InventoryService.receive_stock(item=self.item, lot_no='L1', qty=10, unit='kg', user=self.user)
+        old = StockMovement.objects.create(item=self.item, movement_type='adjust', qty=3, unit='kg', created_by=self.user)
+        StockMovement.objects.filter(pk=old.pk).update(timestamp=timezone.now() - timedelta(days=40))
+        DailyMovementRollup.objects.all().delete()
+        
+        out = StringIO()
+        call_command('backfill_movement_rollups', '--days-per-chunk', '7', stdout=out)
+        
+        self.assertIn('Backfilled 2 rollup row(s)', out.getvalue())
+        self.assertTrue(DailyMovementRollup.objects.filter(
+            date=timezone.localdate() - timedelta(days=40), movement_type='adjust', qty=3
+        ).exists())
+        self.assertTrue(DailyMovementRollup.objects.filter(date=timezone.localdate(), movement_type='receive').exists())
+    
+    def test_inventory_dashboard_query_count_independent_of_history(self):
+        """Test dashboard charts do not scan movements per day"""
+        client = Client()
+        client.force_login(self.user)
+        
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(client.get(reverse('inventory:inventory_dashboard')).status_code, 200)
+        
+        for index in range(10):
+            InventoryService.receive_stock(
+                item=self.item, lot_no=f'L{index}', qty=1, unit='kg', user=self.user,
+                expires_at=timezone.localdate() + timedelta(days=index)
+            )
+        
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(client.get(reverse('inventory:inventory_dashboard')).status_code, 200)
+        
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertLess(len(many.captured_queries), 25)
+
+
+class DashboardMetricsServiceTestCase(TestCase):
+    """Test cases for DashboardMetricsService"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@test.com',
+            password='testpass123'
+        )
+    
+    def create_items(self, count, start=0):
+        """Bulk create items (half finished goods) with stock balances"""
+        items = Item.objects.bulk_create([
+            Item(
+                code=f'BULK{start + i:06d}',
+                name=f'Bulk Item {start + i}',
+                category='finished_good' if i % 2 else 'ingredient',
+                unit='pcs',
+                reorder_level=10,
+                created_by=self.user
+            )
+            for i in range(count)
+        ])
+        ItemStockBalance.objects.bulk_create([
+            ItemStockBalance(item=item, on_hand_qty=i % 20, on_hand_value=(i % 20) * 2, lot_count=1 if i % 20 else 0)
+            for i, item in enumerate(items)
+        ])
+        return items
+    
+    def test_inventory_kpis(self):
+        """Test KPI values match per-item stock status"""
+        self.create_items(10)
+        kpis = DashboardMetricsService.get_inventory_kpis()
+        
+        # Stocks are 0..9 with a reorder level of 10: one out of stock, nine low
+        self.assertEqual(kpis['total_products'], 10)
+        self.assertEqual(kpis['out_of_stock_count'], 1)
+        self.assertEqual(kpis['low_stock_count'], 9)
+        self.assertEqual(kpis['finished_goods_count'], 5)
+        self.assertEqual(kpis['finished_goods_low_stock'], 5)
+        self.assertEqual(kpis['finished_goods_value'], float(2 * (1 + 3 + 5 + 7 + 9)))
+        self.assertEqual(kpis['total_value'], 90)
+    
+    def test_value_trend(self):
+        """Test the trend reads the latest snapshot on or before each point and today's live value"""
+        item = self.create_items(1)[0]
+        today = timezone.localdate()
+        InventorySnapshot.objects.bulk_create([
+            InventorySnapshot(date=today - timedelta(days=100), item=item, qty=10, value=30),
+            InventorySnapshot(date=today - timedelta(days=35), item=item, qty=10, value=25),
+        ])
+        
+        trend = DashboardMetricsService.get_value_trend(current_value=Decimal('40'))
+        self.assertEqual(len(trend['labels']), DashboardMetricsService.TREND_MONTHS)
+        self.assertEqual(trend['values'][0], 0)
+        self.assertEqual(trend['values'][2], 30)
+        self.assertEqual(trend['values'][-2], 25)
+        self.assertEqual(trend['values'][-1], 40)
+        self.assertEqual(trend['prev_total_value'], 25)
+    
+    def test_snapshot_inventory_command(self):
+        """Test snapshots record current balances and answer what was on hand on a date"""
+        items = self.create_items(3)  # stocks 0, 1 and 2
+        today = timezone.localdate()
+        
+        out = StringIO()
+        call_command('snapshot_inventory', stdout=out)
+        self.assertIn('2 item(s)', out.getvalue())
+        
+        ItemStockBalance.objects.filter(item=items[1]).update(on_hand_qty=7, on_hand_value=14)
+        call_command('snapshot_inventory', stdout=StringIO())
+        self.assertEqual(InventorySnapshot.objects.filter(date=today).count(), 2)
+        
+        on_hand = {s.item_id: s.qty for s in InventoryService.get_inventory_on(today + timedelta(days=3))}
+        self.assertEqual(on_hand, {items[1].id: 7, items[2].id: 2})
+        self.assertFalse(InventoryService.get_inventory_on(today - timedelta(days=1)).exists())
+    
+    def test_query_count_independent_of_catalogue_size(self):
+        """Test dashboard metrics cost the same number of queries for 10 and 10,000 items"""
+        self.create_items(10)
+        with CaptureQueriesContext(connection) as small:
+            DashboardMetricsService.get_dashboard_metrics()
+        
+        self.create_items(9990, start=10)
+        with CaptureQueriesContext(connection) as large:
+            metrics = DashboardMetricsService.get_dashboard_metrics()
+        
+        self.assertEqual(metrics['total_products'], 10000)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertLessEqual(len(large.captured_queries), 2)
+
+
+class SearchTestCase(TestCase):
+    """Test cases for ranked item, supplier and user search"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            role='admin',
+            first_name='Ada',
+            last_name='Baker'
+        )
+        self.staff = User.objects.create_user(
+            username='staffer',
+            email='staff@test.com',
+            password='testpass123',
+            role='staff',
+            first_name='Sam',
+            last_name='Miller'
+        )
+        self.client = Client()
+        self.client.login(username='admin', password='testpass123')
+        
+        for code, name in [('FLR001', 'Bread Flour'), ('FLR002', 'Cake Flour'), ('SUG001', 'Brown Sugar'), ('BTR001', 'Butter')]:
+            Item.objects.create(code=code, name=name, category='ingredient', unit='kg', created_by=self.user)
+        Supplier.objects.create(name='Golden Mills', contact_person='Maria Santos', created_by=self.user)
+    
+    def test_ranked_item_search(self):
+        """Exact words rank first, typos and partial words still match"""
+        names = [item.name for item in search(Item.objects.all(), 'flour')]
+        self.assertEqual(sorted(names), ['Bread Flour', 'Cake Flour'])
+        
+        self.assertEqual([item.name for item in search(Item.objects.all(), 'cake flour')], ['Cake Flour'])
+        self.assertIn('Cake Flour', [item.name for item in search(Item.objects.all(), 'flor')])
+        self.assertEqual([item.code for item in search(Item.objects.all(), 'sug001')], ['SUG001'])
+        self.assertFalse(search(Item.objects.all(), '').exists())
+    
+    def test_search_sees_new_rows(self):
+        """The fallback index is refreshed when the table changes"""
+        self.assertFalse(search(Item.objects.all(), 'yeast').exists())
+        Item.objects.create(code='YST001', name='Instant Yeast', category='ingredient', unit='g', created_by=self.user)
+        self.assertEqual([item.code for item in search(Item.objects.all(), 'yeast')], ['YST001'])
+    
+    def test_api_search(self):
+        """The typeahead endpoint returns Select2 results and checks permissions"""
+        url = reverse('inventory:api_search')
+        response = self.client.get(url, {'type': 'item', 'q': 'butter'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[0]['code'], 'BTR001')
+        self.assertEqual(results[0]['text'], 'Butter (BTR001)')
+        
+        response = self.client.get(url, {'type': 'supplier', 'q': 'golden'})
+        self.assertEqual([r['text'] for r in response.json()['results']], ['Golden Mills'])
+        
+        response = self.client.get(url, {'type': 'user', 'q': 'miller'})
+        self.assertEqual([r['id'] for r in response.json()['results']], [str(self.staff.id)])
+        
+        self.assertEqual(self.client.get(url, {'type': 'recipe', 'q': 'x'}).status_code, 400)
+        
+        self.client.login(username='staffer', password='testpass123')
+        self.assertEqual(self.client.get(url, {'type': 'user', 'q': 'ada'}).status_code, 403)
+    
+    def test_list_views_rank_matches(self):
+        """Item and user lists order search results by relevance"""
+        response = self.client.get(reverse('inventory:item_list'), {'search': 'brown sugar'})
+        self.assertEqual([row['item'].code for row in response.context['items_with_stock']], ['SUG001'])
+        
+        response = self.client.get(reverse('inventory:user_list'), {'search': 'sam'})
+        self.assertEqual([user.username for user in response.context['users']], ['staffer'])
+    
+    def test_typeahead_widget_renders_selected_only(self):
+        """Stock forms render only the selected item instead of every item"""
+        item = Item.objects.get(code='BTR001')
+        html = StockConsumeForm(initial={'item': item.pk})['item'].as_widget()
+        self.assertIn('data-typeahead-type="item"', html)
+        self.assertIn(str(item), html)
+        self.assertNotIn('Cake Flour', html)
+
+
+class ItemBatchApiTestCase(TestCase):
+    """Test cases for the batched item metadata and lots endpoint"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            role='admin'
+        )
+        self.client = Client()
+        self.client.login(username='admin', password='testpass123')
+        self.url = reverse('inventory:api_items_batch')
+        
+        self.items = []
+        for n in range(3):
+            item = Item.objects.create(
+                code=f'BAT{n:02d}',
+                name=f'Batch Item {n}',
+                category='ingredient',
+                unit='kg',
+                is_perishable=n == 0,
+                created_by=self.user
+            )
+            for days in (30, 10):
+                InventoryService.receive_stock(
+                    item=item,
+                    lot_no=f'L{n}-{days}',
+                    qty=5,
+                    unit='kg',
+                    user=self.user,
+                    expires_at=timezone.now().date() + timedelta(days=days)
+                )
+            self.items.append(item)
+    
+    def _get(self, items, **headers):
+        return self.client.get(self.url, {'item_id': [str(item.id) for item in items]}, headers=headers)
+    
+    def test_batch_returns_meta_and_ordered_lots(self):
+        """Perishable lots come back FEFO, others FIFO, with current stock"""
+        data = self._get(self.items).json()
+        self.assertEqual(data['missing'], [])
+        perishable = data['items'][str(self.items[0].id)]
+        self.assertEqual([lot['lot_no'] for lot in perishable['lots']], ['L0-10', 'L0-30'])
+        self.assertEqual(Decimal(perishable['current_stock']), 10)
+        self.assertTrue(perishable['is_perishable'])
+        self.assertEqual([lot['lot_no'] for lot in data['items'][str(self.items[1].id)]['lots']], ['L1-30', 'L1-10'])
+    
+    def test_query_count_independent_of_item_count(self):
+        """Metadata and lots for any number of items cost the same queries"""
+        self._get(self.items[:1])
+        with CaptureQueriesContext(connection) as one:
+            self._get(self.items[:1])
+        with CaptureQueriesContext(connection) as many:
+            self._get(self.items)
+        self.assertEqual(len(one.captured_queries), len(many.captured_queries))
+    
+    def test_conditional_requests(self):
+        """Unchanged items revalidate with 304; a lot change produces a new ETag"""
+        response = self._get(self.items)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        
+        response = self._get(self.items, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        InventoryService.consume_stock(item=self.items[1], qty=1, reason='test', user=self.user)
+        response = self._get(self.items, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_invalid_ids(self):
+        """Malformed ids are rejected and unknown ids reported as missing"""
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'item_id': 'not-a-uuid'}).status_code, 400)
+        
+        unknown = '00000000-0000-0000-0000-000000000000'
+        data = self.client.get(self.url, {'item_id': f'{self.items[0].id},{unknown}'}).json()
+        self.assertEqual(list(data['items']), [str(self.items[0].id)])
+        self.assertEqual(data['missing'], [unknown])
+
+
+class ExplainHotQueriesTestCase(TestCase):
+    """Test cases for the explain_hot_queries command"""
+    
+    def test_hot_queries_use_indexes(self):
+        """Every registered hot query is served by an index"""
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertIn('All hot queries use an index.', out.getvalue())
+    
+    def test_full_scan_fails(self):
+        """An unindexed filter is reported and fails the command"""
+        from unittest import mock
+        from inventory.management.commands.explain_hot_queries import HOT_QUERIES, full_scans
+        
+        out = StringIO()
+        with mock.patch.dict(HOT_QUERIES, {'lot_notes': lambda: StockLot.objects.filter(notes='x')}):
+            with self.assertRaises(CommandError):
+                call_command('explain_hot_queries', query=['lot_notes'], stdout=out)
+        self.assertIn('FULL SCAN lot_notes: stock_lot', out.getvalue())
+        
+        mysql_plan = '{"query_block": {"nested_loop": [{"table": {"table_name": "stock_lot", "access_type": "ALL"}}, {"table": {"table_name": "item", "access_type": "eq_ref"}}]}}'
+        self.assertEqual(full_scans(mysql_plan, 'mysql'), ['stock_lot'])
+        self.assertEqual(full_scans('Seq Scan on purchase_order  (cost=0.00..1.01 rows=1)', 'postgresql'), ['purchase_order'])
+
+
+class PurchaseOrderQrTestCase(TestCase):
+    """Test cases for the cached purchase order QR image endpoint"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@test.com', password='testpass123', role='admin')
+        self.supplier = Supplier.objects.create(name='Test Supplier', created_by=self.admin)
+        self.other_supplier = Supplier.objects.create(name='Other Supplier', created_by=self.admin)
+        self.order = PurchaseOrder.objects.create(supplier=self.supplier, created_by=self.admin)
+        self.url = reverse('inventory:purchase_order_qr', args=[self.order.id])
+        self.client = Client()
+    
+    def supplier_user(self, supplier):
+        user = User.objects.create_user(
+            username=f'supplier{supplier.pk.hex[:6]}', email=f'{supplier.pk.hex[:6]}@test.com',
+            password='testpass123', role='supplier'
+        )
+        user.supplier = supplier
+        user.save(validate=False)
+        return user
+    
+    def test_png_and_svg(self):
+        """Images are served with a long-lived cache policy and revalidate by ETag"""
+        self.client.force_login(self.admin)
+        
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        
+        svg = self.client.get(self.url, {'format': 'svg'})
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertTrue(svg.content.startswith(b'<svg'))
+        self.assertNotEqual(svg['ETag'], response['ETag'])
+        
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, {'format': 'gif'}).status_code, 400)
+    
+    def test_images_are_rendered_once(self):
+        """Repeated requests come from the cache instead of re-rendering"""
+        from unittest import mock
+        import qrcode
+        
+        self.client.force_login(self.admin)
+        first = self.client.get(self.url, {'format': 'svg'}).content
+        with mock.patch.object(qrcode, 'QRCode') as qr_code:
+            self.assertEqual(self.client.get(self.url, {'format': 'svg'}).content, first)
+        qr_code.assert_not_called()
+    
+    def test_access(self):
+        """Only inventory readers and the order's own supplier get the image"""
+        self.client.force_login(self.supplier_user(self.supplier))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        
+        self.client.force_login(self.supplier_user(self.other_supplier))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        
+        staff = User.objects.create_user(username='staff', email='staff@test.com', password='testpass123', role='staff')
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+    
+    def test_detail_page_links_image(self):
+        """The detail page references the image instead of inlining it"""
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('inventory:purchase_order_detail', args=[self.order.id]))
+        self.assertContains(response, f'{self.url}?format=svg')
+        self.assertNotContains(response, 'data:image/png;base64')
+
+
+class PurchaseOrderScanSessionTestCase(TestCase):
+    """Test cases for receiving many purchase orders from one QR scan session"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='admin', email='admin@test.com', password='testpass123', role='admin')
+        self.supplier = Supplier.objects.create(name='Test Supplier', created_by=self.user)
+        self.flour = Item.objects.create(name='Flour', category='ingredient', unit='kg', created_by=self.user)
+        self.milk = Item.objects.create(
+            name='Milk', category='ingredient', unit='L', is_perishable=True, shelf_life_days=7, created_by=self.user
+        )
+        self.orders = [self.create_order('shipped') for _ in range(4)]
+        self.draft = self.create_order('draft')
+    
+    def create_order(self, status):
+        order = PurchaseOrder.objects.create(supplier=self.supplier, status=status, created_by=self.user)
+        for item, qty in ((self.flour, '10'), (self.milk, '4')):
+            PurchaseOrderItem.objects.create(
+                purchase_order=order, item=item, qty_ordered=Decimal(qty), unit=item.unit, unit_price=Decimal('2.00')
+            )
+        return order
+    
+    def test_session_report(self):
+        """Every distinct code gets a result; receivable orders are received, the rest are reported"""
+        first, second = self.orders[:2]
+        results = PurchaseOrderService.receive_purchase_orders_by_qr(
+            [first.qr_code, self.draft.qr_code, 'PO-MISSING', second.qr_code.lower(), first.qr_code], self.user
+        )
+        
+        self.assertEqual([result['qr_code'] for result in results], [first.qr_code, self.draft.qr_code, 'PO-MISSING', second.qr_code])
+        self.assertEqual([result['success'] for result in results], [True, False, False, True])
+        self.assertIn('Current status: Draft', results[1]['error'])
+        self.assertIn('not found', results[2]['error'])
+        self.assertEqual(len(results[0]['lots']), 2)
+        
+        for order in (first, second):
+            order.refresh_from_db()
+            self.assertEqual(order.status, 'received')
+            self.assertEqual(order.received_by, self.user)
+            self.assertEqual(
+                list(order.order_items.values_list('qty_received', flat=True).order_by('qty_received')),
+                [Decimal('4'), Decimal('10')]
+            )
+        self.draft.refresh_from_db()
+        self.assertEqual(self.draft.status, 'draft')
+        
+        milk_lot = StockLot.objects.get(lot_no=f'{first.order_no}-{self.milk.code}')
+        self.assertEqual(milk_lot.expires_at, timezone.now().date() + timedelta(days=7))
+        self.assertEqual(milk_lot.supplier, self.supplier)
+        self.assertEqual(StockMovement.objects.filter(movement_type='receive', ref_no=first.order_no).count(), 2)
+        self.assertEqual(ItemStockBalance.objects.get(item=self.flour).on_hand_qty, Decimal('20'))
+        self.assertEqual(
+            DailyMovementRollup.objects.get(item=self.milk, movement_type='receive', date=timezone.localdate()).qty,
+            Decimal('8')
+        )
+        
+        again = PurchaseOrderService.receive_purchase_orders_by_qr([first.qr_code], self.user)
+        self.assertFalse(again[0]['success'])
+        self.assertEqual(StockLot.objects.count(), 4)
+    
+    def test_query_count_does_not_grow_with_orders(self):
+        """Receiving three orders costs the same queries as receiving one"""
+        # An item's first stock operation creates its balance row and the day's first movement its
+        # rollup bucket; start from existing rows
+        InventoryService.refresh_stock_balances([self.flour, self.milk])
+        DailyMovementRollup.objects.bulk_create([
+            DailyMovementRollup(date=timezone.localdate(), item=item, movement_type='receive') for item in (self.flour, self.milk)
+        ])
+        with CaptureQueriesContext(connection) as one:
+            PurchaseOrderService.receive_purchase_orders_by_qr([self.orders[0].qr_code], self.user)
+        with CaptureQueriesContext(connection) as three:
+            PurchaseOrderService.receive_purchase_orders_by_qr([order.qr_code for order in self.orders[1:]], self.user)
+        self.assertEqual(len(three), len(one))
+    
+    def test_single_scan(self):
+        """The single-code receive raises for orders that cannot be received"""
+        order, lots = PurchaseOrderService.receive_purchase_order_by_qr(self.orders[0].qr_code, self.user)
+        self.assertEqual(order.status, 'received')
+        self.assertEqual(len(lots), 2)
+        with self.assertRaises(ValueError):
+            PurchaseOrderService.receive_purchase_order_by_qr(self.draft.qr_code, self.user)
+    
+    def test_scan_session_view(self):
+        """The view receives the posted codes and renders the report"""
+        client = Client()
+        client.force_login(self.user)
+        codes = f"{self.orders[0].qr_code}\n{self.orders[1].qr_code}, PO-MISSING"
+        response = client.post(reverse('inventory:purchase_order_scan_session'), {'qr_codes': codes})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['success'] for result in response.context['results']], [True, True, False])
+        self.assertContains(response, self.orders[0].order_no)
+        self.assertContains(response, 'Purchase order not found')
+        self.assertEqual(PurchaseOrder.objects.filter(status='received').count(), 2)
+
+
+class PurchaseOrderReceiveWithDetailsTestCase(TestCase):
+    """Test cases for manual receiving with per-line details and partial receipts"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='admin', email='admin@test.com', password='testpass123', role='admin')
+        self.supplier = Supplier.objects.create(name='Test Supplier', created_by=self.user)
+        self.flour = Item.objects.create(name='Flour', category='ingredient', unit='kg', created_by=self.user)
+        self.milk = Item.objects.create(
+            name='Milk', category='ingredient', unit='L', is_perishable=True, shelf_life_days=7, created_by=self.user
+        )
+        self.order = PurchaseOrder.objects.create(supplier=self.supplier, status='shipped', created_by=self.user)
+        self.flour_line = PurchaseOrderItem.objects.create(
+            purchase_order=self.order, item=self.flour, qty_ordered=Decimal('10'), unit='kg', unit_price=Decimal('2.00')
+        )
+        self.milk_line = PurchaseOrderItem.objects.create(
+            purchase_order=self.order, item=self.milk, qty_ordered=Decimal('4'), unit='L', unit_price=Decimal('3.00')
+        )
+        self.expiry = timezone.localdate() + timedelta(days=7)
+    
+    def test_full_receipt(self):
+        """Receiving every line closes the order with one bulk insert of lots"""
+        with CaptureQueriesContext(connection) as queries:
+            order, lots = PurchaseOrderService.receive_with_details(self.order, {
+                self.flour_line.id: {'qty_received': '10', 'lot_no': 'LOT-A'},
+                self.milk_line.id: {'qty_received': '4', 'lot_no': 'LOT-B', 'expires_at': self.expiry.isoformat()},
+            }, self.user, delivery_notes='Boxes dented')
+        
+        self.assertEqual(order.status, 'received')
+        self.assertEqual(len(lots), 2)
+        self.assertIn('Boxes dented', order.notes)
+        self.assertEqual(StockLot.objects.get(lot_no='LOT-B').expires_at, self.expiry)
+        self.assertEqual(ItemStockBalance.objects.get(item=self.flour).on_hand_qty, Decimal('10'))
+        self.assertEqual(StockMovement.objects.filter(ref_no=self.order.order_no, movement_type='receive').count(), 2)
+        self.assertEqual(sum(query['sql'].startswith('INSERT INTO "stock_lot"') for query in queries.captured_queries), 1)
+    
+    def test_partial_receipts_keep_order_open(self):
+        """A short delivery leaves the order open until the rest arrives"""
+        order, _ = PurchaseOrderService.receive_with_details(self.order, {
+            self.flour_line.id: {'qty_received': '6', 'lot_no': ''},
+        }, self.user)
+        self.assertEqual(order.status, 'shipped')
+        self.flour_line.refresh_from_db()
+        self.assertEqual(self.flour_line.qty_received, Decimal('6'))
+        self.assertTrue(StockLot.objects.get(item=self.flour).lot_no.startswith('LOT-'))
+        
+        with self.assertRaises(ValueError):
+            PurchaseOrderService.receive_with_details(self.order, {self.flour_line.id: {'qty_received': '5'}}, self.user)
+        
+        # Scanning the QR code receives only what is still outstanding
+        order, lots = PurchaseOrderService.receive_purchase_order_by_qr(self.order.qr_code, self.user)
+        self.assertEqual(order.status, 'received')
+        self.assertEqual(sorted(lot.qty for lot in lots), [Decimal('4'), Decimal('4')])
+        self.assertEqual(ItemStockBalance.objects.get(item=self.flour).on_hand_qty, Decimal('10'))
+    
+    def test_invalid_lines_write_nothing(self):
+        """Every line is validated before any write"""
+        with self.assertRaises(ValueError) as error:
+            PurchaseOrderService.receive_with_details(self.order, {
+                self.flour_line.id: {'qty_received': '12'},
+                self.milk_line.id: {'qty_received': '4'},
+            }, self.user)
+        self.assertIn('Flour', str(error.exception))
+        self.assertIn('Milk: expiration date is required', str(error.exception))
+        
+        with self.assertRaises(ValueError):
+            PurchaseOrderService.receive_with_details(self.order, {}, self.user)
+        
+        self.assertFalse(StockLot.objects.exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'shipped')
+    
+    def test_receive_view(self):
+        """The receive page posts per-line details to the service"""
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('inventory:purchase_order_receive', args=[self.order.id])
+        
+        response = client.get(url)
+        self.assertContains(response, f'name="qty_received_{self.flour_line.id}"')
+        
+        response = client.post(url, {
+            f'qty_received_{self.flour_line.id}': '10',
+            f'lot_no_{self.flour_line.id}': 'LOT-FLOUR',
+            f'qty_received_{self.milk_line.id}': '0',
+        })
+        self.assertRedirects(response, reverse('inventory:purchase_order_detail', args=[self.order.id]))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'shipped')
+        self.assertTrue(StockLot.objects.filter(lot_no='LOT-FLOUR', qty=Decimal('10')).exists())
+
+
+class PurchaseOrderTotalsTestCase(TestCase):
+    """Test cases for purchase order totals kept in step with their lines"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='admin', email='admin@test.com', password='testpass123', role='admin')
+        self.supplier = Supplier.objects.create(name='Test Supplier', created_by=self.user)
+        self.supplier_user = User.objects.create_user(
+            username='supplier', email='supplier@test.com', password='testpass123', role='supplier', supplier=self.supplier
+        )
+        self.items = [
+            Item.objects.create(name=f'Ingredient {n}', category='ingredient', unit='kg', created_by=self.user)
+            for n in range(3)
+        ]
+
+    def create_order(self, prices):
+        return PurchaseOrderService.create_purchase_order(
+            supplier=self.supplier,
+            items_data=[
+                {'item': item, 'qty': Decimal('4'), 'unit': 'kg', 'unit_price': price}
+                for item, price in zip(self.items, prices)
+            ],
+            user=self.user
+        )
+
+    def test_create_sets_total_with_one_insert(self):
+        """Lines are inserted in one statement and the total comes from the database"""
+        with CaptureQueriesContext(connection) as queries:
+            po = self.create_order([Decimal('1.25'), Decimal('2.00'), Decimal('0.50')])
+
+        self.assertEqual(po.total_amount, Decimal('15.00'))
+        po.refresh_from_db()
+        self.assertEqual(po.total_amount, Decimal('15.00'))
+        self.assertEqual(po.calculate_total(), Decimal('15.00'))
+        self.assertEqual(sum(query['sql'].startswith('INSERT INTO "purchase_order_item"') for query in queries.captured_queries), 1)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "purchase_order"') for query in queries.captured_queries), 1)
+
+    def test_refresh_without_lines(self):
+        """An order without lines totals zero"""
+        po = PurchaseOrder.objects.create(supplier=self.supplier, created_by=self.user, total_amount=Decimal('9.99'))
+        PurchaseOrderService.refresh_order_totals([po])
+        self.assertEqual(po.total_amount, Decimal('0.00'))
+        self.assertEqual(po.calculate_total(), Decimal('0.00'))
+
+    def test_supplier_approve_prices_lines(self):
+        """Supplier prices are written in bulk and the total refreshed before approval"""
+        po = self.create_order([Decimal('0'), Decimal('0'), Decimal('0')])
+        lines = list(po.order_items.all())
+        prices = {str(line.id): Decimal('3.00') for line in lines}
+
+        with CaptureQueriesContext(connection) as queries:
+            PurchaseOrderService.supplier_approve_purchase_order(
+                po, self.supplier_user, expected_delivery_date=timezone.localdate(), item_prices=prices, order_items=lines
+            )
+
+        po.refresh_from_db()
+        self.assertEqual(po.status, 'supplier_approved')
+        self.assertEqual(po.total_amount, Decimal('36.00'))
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "purchase_order_item"') for query in queries.captured_queries), 1)
+
+    def test_supplier_approve_view(self):
+        """The supplier portal approves an order with prices"""
+        po = self.create_order([Decimal('0'), Decimal('0'), Decimal('0')])
+        client = Client()
+        client.force_login(self.supplier_user)
+
+        data = {'expected_delivery_date': (timezone.localdate() + timedelta(days=3)).isoformat(), 'supplier_notes': 'OK'}
+        data.update({f'item_price_{line.id}': '2.50' for line in po.order_items.all()})
+        response = client.post(reverse('inventory:supplier_order_approve', args=[po.id]), data)
+
+        self.assertRedirects(response, reverse('inventory:supplier_order_detail', args=[po.id]))
+        po.refresh_from_db()
+        self.assertEqual(po.status, 'supplier_approved')
+        self.assertEqual(po.total_amount, Decimal('30.00'))
+
+
+class SeedInventoryTestCase(TestCase):
+    """Test cases for the seed_inventory command"""
+    
+    def seed(self, seed):
+        call_command(
+            'seed_inventory', items=20, lots_per_item=3, days=14, users=2, seed=seed,
+            end_date='2026-10-15', chunk_size=7, stdout=StringIO()
+        )
+        return list(StockMovement.objects.order_by('timestamp', 'pk').values_list('item__code', 'movement_type', 'qty', 'timestamp'))
+    
+    def test_seed_is_consistent(self):
+        """Lots, movements, balances and purchase orders agree with each other"""
+        self.seed(3)
+        
+        self.assertEqual(Item.objects.count(), 20)
+        self.assertEqual(Item.objects.filter(category='finished_good').count(), 4)
+        self.assertEqual(Recipe.objects.count(), 4)
+        self.assertTrue(all(len(code) == 10 and code.startswith('202610') for code in Item.objects.values_list('code', flat=True)))
+        self.assertEqual(
+            set(PurchaseOrder.objects.values_list('status', flat=True)),
+            {status for status, _ in PurchaseOrder.STATUS_CHOICES}
+        )
+        self.assertTrue(AttendanceRecord.objects.exists())
+        
+        for lot in StockLot.objects.all():
+            movements = list(lot.movements.order_by('timestamp'))
+            self.assertIn(movements[0].movement_type, ('receive', 'produce'))
+            self.assertEqual(movements[0].timestamp, lot.received_at)
+            self.assertEqual(movements[0].qty - sum(movement.qty for movement in movements[1:]), lot.qty)
+            self.assertGreaterEqual(lot.qty, 0)
+        for item in Item.objects.select_related('stock_balance'):
+            self.assertEqual(item.stock_balance.on_hand_qty, sum(lot.qty for lot in item.stock_lots.all()))
+        
+        with self.assertRaises(CommandError):
+            self.seed(3)
+    
+    def test_seed_is_deterministic(self):
+        """The same seed reproduces the same history"""
+        from django.db import transaction
+        
+        sid = transaction.savepoint()
+        first = self.seed(5)
+        transaction.savepoint_rollback(sid)
+        self.assertFalse(Item.objects.exists())
+        self.assertEqual(self.seed(5), first)
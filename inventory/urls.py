@@ -48,9 +48,12 @@ urlpatterns = [
     path('stock/damage-log/', views.damage_log, name='damage_log'),
     path('api/item-lots/', views.api_item_lots, name='api_item_lots'),
     path('api/item-meta/', views.api_item_meta, name='api_item_meta'),
+    path('api/items/batch/', views.api_items_batch, name='api_items_batch'),
+    path('api/search/', views.api_search, name='api_search'),
     
     # Production
     path('production/', views.production_create, name='production_create'),
+    path('production/batch/', views.production_batch_create, name='production_batch_create'),
     path('production/list/', views.production_list, name='production_list'),
     
     # Suppliers
@@ -73,6 +76,7 @@ urlpatterns = [
     path('purchase-orders/', views.purchase_order_list, name='purchase_order_list'),
     path('purchase-orders/create/', views.purchase_order_create, name='purchase_order_create'),
     path('purchase-orders/<uuid:order_id>/', views.purchase_order_detail, name='purchase_order_detail'),
+    path('purchase-orders/<uuid:order_id>/qr/', views.purchase_order_qr, name='purchase_order_qr'),
     path('purchase-orders/<uuid:order_id>/approve/', views.purchase_order_approve, name='purchase_order_approve'),
     path('purchase-orders/<uuid:order_id>/admin-approve/', views.purchase_order_admin_approve, name='purchase_order_admin_approve'),
     path('purchase-orders/<uuid:order_id>/admin-reject/', views.purchase_order_admin_reject, name='purchase_order_admin_reject'),
@@ -80,6 +84,7 @@ urlpatterns = [
     path('purchase-orders/<uuid:order_id>/receive/', views.purchase_order_receive, name='purchase_order_receive'),
     path('purchase-orders/<uuid:order_id>/cancel/', views.purchase_order_cancel, name='purchase_order_cancel'),
     path('purchase-orders/scan/receive/', views.purchase_order_scan_receive, name='purchase_order_scan_receive'),
+    path('purchase-orders/scan/session/', views.purchase_order_scan_session, name='purchase_order_scan_session'),
     
     # Supplier Portal
     path('supplier/login/', views.supplier_login, name='supplier_login'),
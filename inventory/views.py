@@ -5,22 +5,24 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_http_methods
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import F, Q
+from django.forms import formset_factory
 from django.utils import timezone
 import pytz
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .models import User, UserLinks, UserAccess, AuditLog, AttendanceRecord, ShiftSchedule, Supplier, Item, StockLot, StockMovement, Recipe, RecipeItem, PurchaseOrder, PurchaseOrderItem
+from .models import User, UserLinks, UserAccess, AuditLog, AttendanceRecord, ShiftSchedule, Supplier, Item, StockLot, StockMovement, InventorySnapshot, Recipe, RecipeItem, PurchaseOrder, PurchaseOrderItem
 from .security import (
     role_required, permission_required, super_admin_required, admin_required,
     log_user_action, validate_user_input, sanitize_input, can_manage_user,
     get_user_permissions, check_user_permissions, get_manila_now,
-    supplier_required, supplier_or_admin_required
+    supplier_required, supplier_or_admin_required, invalidate_user_permissions
 )
-from .forms import UserForm, UserAccessForm, UserLinksForm, SupplierForm, ItemForm, StockLotForm, StockMovementForm, RecipeForm, RecipeItemForm, StockReceiveForm, StockConsumeForm, ProductionForm, PurchaseOrderForm, PurchaseOrderItemForm, PurchaseOrderApproveForm, QRCodeScanForm, DamageLogForm
-from .services import InventoryService, RecipeService, PurchaseOrderService
+from .forms import UserForm, UserAccessForm, UserLinksForm, SupplierForm, ItemForm, StockLotForm, StockMovementForm, RecipeForm, RecipeItemForm, StockReceiveForm, StockConsumeForm, ProductionForm, PurchaseOrderForm, PurchaseOrderItemForm, PurchaseOrderApproveForm, QRCodeScanForm, QRCodeBatchScanForm, DamageLogForm
+from .services import InventoryService, RecipeService, PurchaseOrderService, DashboardMetricsService, ProductionService
+from .pagination import CursorPaginator
+from .search import search
 import json
 from django.http import HttpResponseBadRequest
 from django.core.serializers.json import DjangoJSONEncoder
@@ -85,71 +87,15 @@ def dashboard(request):
     if request.user.role == 'staff':
         return redirect('inventory:attendance_dashboard')
 
-    from django.db.models import Sum, F, DecimalField, ExpressionWrapper
-    from datetime import timedelta
-    
-    # Calculate total products (active items)
-    total_products = Item.objects.filter(is_active=True).count()
-    
-    # Calculate total inventory value (sum of stock lots)
-    total_value = StockLot.objects.filter(
-        qty__gt=0
-    ).aggregate(
-        total=Sum(ExpressionWrapper(
-            F('qty') * F('unit_cost'),
-            output_field=DecimalField()
-        ))
-    )['total'] or 0
-    
-    # Calculate low stock items (items below reorder level)
-    low_stock_count = 0
-    out_of_stock_count = 0
-    finished_goods_count = 0
-    finished_goods_low_stock = 0
-    finished_goods_value = 0
-    
-    for item in Item.objects.filter(is_active=True):
-        current_stock = item.get_current_stock()
-        
-        # Count finished goods
-        if item.category == 'finished_good':
-            finished_goods_count += 1
-            # Calculate finished goods value
-            fg_value = StockLot.objects.filter(
-                item=item,
-                qty__gt=0
-            ).aggregate(
-                total=Sum(ExpressionWrapper(
-                    F('qty') * F('unit_cost'),
-                    output_field=DecimalField()
-                ))
-            )['total'] or 0
-            finished_goods_value += float(fg_value)
-            
-            # Check if finished good is low stock
-            if current_stock <= item.reorder_level and current_stock > 0:
-                finished_goods_low_stock += 1
-        
-        # Count all low stock
-        if current_stock == 0:
-            out_of_stock_count += 1
-        elif current_stock <= item.reorder_level:
-            low_stock_count += 1
+    # KPIs and the stock value trend come from a fixed number of grouped queries
+    metrics = DashboardMetricsService.get_dashboard_metrics()
     
     # Get recent items with stock information (last 5 items updated)
-    recent_items = Item.objects.filter(is_active=True).order_by('-updated_at')[:5]
+    recent_items = Item.objects.filter(is_active=True).with_stock_balance().order_by('-updated_at')[:5]
     recent_items_data = []
     for item in recent_items:
-        current_stock = item.get_current_stock()
-        item_value = StockLot.objects.filter(
-            item=item,
-            qty__gt=0
-        ).aggregate(
-            total=Sum(ExpressionWrapper(
-                F('qty') * F('unit_cost'),
-                output_field=DecimalField()
-            ))
-        )['total'] or 0
+        current_stock = item.balance_qty
+        item_value = item.balance_value
         
         # Determine status
         if current_stock == 0:
@@ -170,63 +116,21 @@ def dashboard(request):
             'status_class': status_class,
         })
     
-    # Get monthly data for stock value trend (last 6 months)
-    monthly_values = []
-    monthly_labels = []
-    current_date = timezone.now()
-    
-    for i in range(6):
-        # Calculate month offset
-        month_date = current_date - timedelta(days=30 * (5 - i))
-        month_label = month_date.strftime('%b')
-        monthly_labels.append(month_label)
-        
-        # Get total stock value at that time
-        month_value = StockLot.objects.filter(
-            received_at__lte=month_date,
-            qty__gt=0
-        ).aggregate(
-            total=Sum(ExpressionWrapper(
-                F('qty') * F('unit_cost'),
-                output_field=DecimalField()
-            ))
-        )['total'] or 0
-        
-        monthly_values.append(float(month_value))
-    
-    # Calculate previous month statistics for comparison
-    prev_month_date = current_date - timedelta(days=30)
-    
-    prev_total_value = StockLot.objects.filter(
-        received_at__lte=prev_month_date,
-        qty__gt=0
-    ).aggregate(
-        total=Sum(ExpressionWrapper(
-            F('qty') * F('unit_cost'),
-            output_field=DecimalField()
-        ))
-    )['total'] or 0
-    
-    # Calculate percentage changes
-    value_change = 0
-    if prev_total_value > 0:
-        value_change = ((float(total_value) - float(prev_total_value)) / float(prev_total_value)) * 100
-    
     context = {
         'user': request.user,
-        'permissions': get_user_permissions(request.user),
+        'permissions': get_user_permissions(request.user, request=request),
         'recent_activities': AuditLog.objects.select_related('user').order_by('-timestamp')[:6],
-        'total_products': total_products,
-        'total_value': total_value,
-        'low_stock_count': low_stock_count,
-        'out_of_stock_count': out_of_stock_count,
-        'finished_goods_count': finished_goods_count,
-        'finished_goods_low_stock': finished_goods_low_stock,
-        'finished_goods_value': finished_goods_value,
+        'total_products': metrics['total_products'],
+        'total_value': metrics['total_value'],
+        'low_stock_count': metrics['low_stock_count'],
+        'out_of_stock_count': metrics['out_of_stock_count'],
+        'finished_goods_count': metrics['finished_goods_count'],
+        'finished_goods_low_stock': metrics['finished_goods_low_stock'],
+        'finished_goods_value': metrics['finished_goods_value'],
         'recent_items_data': recent_items_data,
-        'monthly_values': json.dumps(monthly_values),
-        'monthly_labels': json.dumps(monthly_labels),
-        'value_change': value_change,
+        'monthly_values': json.dumps(metrics['monthly_values']),
+        'monthly_labels': json.dumps(metrics['monthly_labels']),
+        'value_change': metrics['value_change'],
     }
     return render(request, 'inventory/dashboard.html', context)
 
@@ -345,28 +249,10 @@ def attendance_dashboard(request):
         timestamp__lte=today_end
     ).select_related('item', 'lot', 'created_by').order_by('-timestamp')
     
-    today_total_items = today_productions.count()
+    # Ingredients used by each of today's productions, loaded in bulk
+    today_productions = ProductionService.attach_ingredients_used(today_productions)
+    today_total_items = len(today_productions)
     today_total_qty = sum(p.qty for p in today_productions)
-    
-    # Calculate ingredients for today's productions in staff dashboard
-    for production in today_productions:
-        try:
-            recipe = Recipe.objects.filter(product=production.item, is_active=True).first()
-            if recipe:
-                ingredients_used = []
-                for recipe_item in recipe.recipe_items.all():
-                    qty_needed = float(recipe_item.qty) * float(production.qty) / float(recipe.yield_qty)
-                    qty_needed = qty_needed * recipe_item.get_adjusted_qty() / float(recipe_item.qty)
-                    ingredients_used.append({
-                        'ingredient': recipe_item.ingredient,
-                        'qty': qty_needed,
-                        'unit': recipe_item.unit
-                    })
-                production.ingredients_used = ingredients_used
-            else:
-                production.ingredients_used = []
-        except Exception:
-            production.ingredients_used = []
 
     context = {
         'target_user': target_user,
@@ -450,23 +336,17 @@ def user_list(request):
     # Hide Super Admin accounts from the user list
     users = User.objects.exclude(role='super_admin')
     
-    # Apply search filter
+    # Apply search filter (ranked, best match first)
     if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(email__icontains=search_query)
-        )
+        users = search(users, search_query)
     
     # Apply role filter
     if role_filter:
         users = users.filter(role=role_filter)
     
     # Pagination
-    paginator = Paginator(users, 10)
-    page_number = request.GET.get('page')
-    users = paginator.get_page(page_number)
+    ordering = ('-search_rank',) if search_query else ('username',)
+    users = CursorPaginator(users, ordering, per_page=10).get_page(request.GET.get('cursor'))
     
     context = {
         'users': users,
@@ -738,6 +618,7 @@ def user_permissions(request, user_id):
                     )
                 else:
                     UserAccess.objects.filter(user=user, permission_type=perm_type).update(is_active=False)
+            invalidate_user_permissions(user)
 
             log_user_action(
                 user=request.user,
@@ -771,6 +652,7 @@ def user_permissions(request, user_id):
             messages.success(request, f"Permission {permission_type} granted to {user.username}.")
         elif action == 'revoke':
             UserAccess.objects.filter(user=user, permission_type=permission_type).update(is_active=False)
+            invalidate_user_permissions(user)
             log_user_action(
                 user=request.user,
                 action_type='permission_revoke',
@@ -802,26 +684,24 @@ def audit_logs(request):
     """
     View audit logs
     """
-    if not check_user_permissions(request.user, 'reports_read'):
+    if not check_user_permissions(request.user, 'reports_read', request=request):
         messages.error(request, "You don't have permission to view audit logs.")
         return redirect('inventory:dashboard')
     
-    logs = AuditLog.objects.all()
+    logs = AuditLog.objects.select_related('user')
     
     # Filter by user if specified
     user_filter = request.GET.get('user')
     if user_filter:
-        logs = logs.filter(user__username__icontains=user_filter)
+        logs = logs.filter(user__in=User.objects.filter(username__icontains=user_filter))
     
     # Filter by action type
     action_filter = request.GET.get('action')
     if action_filter:
         logs = logs.filter(action_type=action_filter)
     
-    # Pagination
-    paginator = Paginator(logs, 20)
-    page_number = request.GET.get('page')
-    logs = paginator.get_page(page_number)
+    # Keyset pagination on (timestamp, id): no COUNT(*) and no OFFSET scan on a large table
+    logs = CursorPaginator(logs, ('-timestamp',), per_page=20).get_page(request.GET.get('cursor'))
     
     context = {
         'logs': logs,
@@ -842,7 +722,7 @@ def user_toggle_status(request, user_id):
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=401)
     
-    if not check_user_permissions(request.user, 'user_write'):
+    if not check_user_permissions(request.user, 'user_write', request=request):
         return JsonResponse({'error': 'Permission denied'}, status=403)
     
     user = get_object_or_404(User, id=user_id)
@@ -907,14 +787,10 @@ def admin_attendance_overview(request):
     if user_filter:
         attendance_records = attendance_records.filter(user__id=user_filter)
     
-    # Order by date (most recent first)
-    attendance_records = attendance_records.order_by('-date', 'user__first_name')
-    
-    # Pagination
-    from django.core.paginator import Paginator
-    paginator = Paginator(attendance_records, 20)
-    page_number = request.GET.get('page')
-    attendance_records = paginator.get_page(page_number)
+    # Pagination, most recent first
+    attendance_records = CursorPaginator(
+        attendance_records, ('-date', 'user__first_name'), per_page=20
+    ).get_page(request.GET.get('cursor'))
     
     # Get summary statistics
     total_records = AttendanceRecord.objects.count()
@@ -960,9 +836,7 @@ def inventory_dashboard(request):
     """
     Bakery inventory dashboard with KPIs, analytics, and line graphs
     """
-    from django.db.models import Sum, Count, Avg
-    from django.utils import timezone
-    from datetime import timedelta, datetime
+    from django.db.models import Count
     import json
     
     # Get stock summary
@@ -978,7 +852,7 @@ def inventory_dashboard(request):
     expired_items = InventoryService.get_expired_items()
     
     # Recent movements
-    recent_movements = StockMovement.objects.select_related('item', 'created_by').order_by('-timestamp')[:10]
+    recent_movements = StockMovement.objects.select_related('item', 'lot', 'created_by').order_by('-timestamp')[:10]
     
     # Bakery-specific analytics
     bakery_analytics = {
@@ -988,61 +862,23 @@ def inventory_dashboard(request):
         'active_suppliers': Supplier.objects.filter(is_active=True).count(),
     }
     
-    # Production analytics (last 30 days)
-    thirty_days_ago = timezone.now() - timedelta(days=30)
+    # Production analytics (last 30 days), read from the daily movement rollups
+    activity = DashboardMetricsService.get_movement_activity()
     production_stats = {
-        'total_productions': StockMovement.objects.filter(
-            movement_type='produce',
-            timestamp__gte=thirty_days_ago
-        ).count(),
-        'total_consumption': StockMovement.objects.filter(
-            movement_type='consume',
-            timestamp__gte=thirty_days_ago
-        ).count(),
-        'total_receipts': StockMovement.objects.filter(
-            movement_type='receive',
-            timestamp__gte=thirty_days_ago
-        ).count(),
+        'total_productions': activity['counts'].get('produce', 0),
+        'total_consumption': activity['counts'].get('consume', 0),
+        'total_receipts': activity['counts'].get('receive', 0),
     }
     
     # Daily production trend (last 7 days)
-    daily_production = []
-    daily_consumption = []
-    daily_receipts = []
-    date_labels = []
-    
-    for i in range(7):
-        date = timezone.now().date() - timedelta(days=6-i)
-        date_labels.append(date.strftime('%m/%d'))
-        
-        # Production
-        prod_count = StockMovement.objects.filter(
-            movement_type='produce',
-            timestamp__date=date
-        ).count()
-        daily_production.append(prod_count)
-        
-        # Consumption
-        cons_count = StockMovement.objects.filter(
-            movement_type='consume',
-            timestamp__date=date
-        ).count()
-        daily_consumption.append(cons_count)
-        
-        # Receipts
-        rec_count = StockMovement.objects.filter(
-            movement_type='receive',
-            timestamp__date=date
-        ).count()
-        daily_receipts.append(rec_count)
+    daily_series = DashboardMetricsService.get_daily_movement_series()
+    daily_production = daily_series['produce']
+    daily_consumption = daily_series['consume']
+    daily_receipts = daily_series['receive']
+    date_labels = daily_series['labels']
     
     # Top selling items (by consumption)
-    top_consumed_items = StockMovement.objects.filter(
-        movement_type='consume',
-        timestamp__gte=thirty_days_ago
-    ).values('item__name', 'item__code').annotate(
-        total_qty=Sum('qty')
-    ).order_by('-total_qty')[:5]
+    top_consumed_items = activity['top_consumed']
     
     # Category distribution
     category_distribution = Item.objects.filter(is_active=True).values('category').annotate(
@@ -1050,18 +886,9 @@ def inventory_dashboard(request):
     ).order_by('-count')
     
     # Expiry trend (next 30 days)
-    expiry_trend = []
-    expiry_labels = []
-    for i in range(30):
-        date = timezone.now().date() + timedelta(days=i)
-        expiry_labels.append(date.strftime('%m/%d'))
-        
-        expiring_count = StockLot.objects.filter(
-            qty__gt=0,
-            expires_at=date,
-            expires_at__isnull=False
-        ).count()
-        expiry_trend.append(expiring_count)
+    expiry = DashboardMetricsService.get_expiry_trend()
+    expiry_trend = expiry['values']
+    expiry_labels = expiry['labels']
     
     context = {
         'stock_summary': stock_summary,
@@ -1090,44 +917,68 @@ def item_list(request):
     """
     List all items with search and filter
     """
+    stock_choices = [
+        ('low', 'Low Stock'),
+        ('out', 'Out of Stock'),
+        ('expiring', 'Expiring Soon'),
+    ]
+    # sort key -> (label, cursor ordering)
+    sorts = {
+        'code': ('Code', ('code',)),
+        'name': ('Name', ('name',)),
+        'stock': ('Stock (lowest first)', ('balance_qty',)),
+        '-stock': ('Stock (highest first)', ('-balance_qty',)),
+    }
+    
     search_query = request.GET.get('search', '')
     category_filter = request.GET.get('category', '')
+    stock_filter = request.GET.get('stock', '')
+    if search_query:
+        sorts = {'relevance': ('Relevance', ('-search_rank',)), **sorts}
+    sort = request.GET.get('sort') or next(iter(sorts))
+    if sort not in sorts:
+        sort = next(iter(sorts))
     
-    items = Item.objects.all()
+    items = Item.objects.with_stock_status()
     
-    # Apply search filter
+    # Apply search filter (ranked, best match first)
     if search_query:
-        items = items.filter(
-            Q(code__icontains=search_query) |
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        items = search(items, search_query)
     
     # Apply category filter
     if category_filter:
         items = items.filter(category=category_filter)
     
-    # Add current stock information
-    items_with_stock = []
-    for item in items:
-        current_stock = item.get_current_stock()
-        items_with_stock.append({
-            'item': item,
-            'current_stock': current_stock,
-            'is_low_stock': item.is_low_stock(),
-            'expiring_soon': item.get_expiring_soon().count()
-        })
+    # Apply stock status filter
+    if stock_filter == 'low':
+        items = items.filter(is_low_stock=True)
+    elif stock_filter == 'out':
+        items = items.filter(balance_qty__lte=0)
+    elif stock_filter == 'expiring':
+        items = items.expiring_only()
     
-    # Pagination
-    paginator = Paginator(items_with_stock, 20)
-    page_number = request.GET.get('page')
-    items_with_stock = paginator.get_page(page_number)
+    # Pagination (stock figures are annotations, so the page is a single query)
+    items_with_stock = CursorPaginator(items, sorts[sort][1], per_page=20).get_page(request.GET.get('cursor'))
+    
+    items_with_stock.object_list = [
+        {
+            'item': item,
+            'current_stock': item.balance_qty,
+            'is_low_stock': item.is_low_stock,
+            'expiring_soon': item.expiring_count
+        }
+        for item in items_with_stock.object_list
+    ]
     
     context = {
         'items_with_stock': items_with_stock,
         'search_query': search_query,
         'category_filter': category_filter,
         'category_choices': Item.CATEGORY_CHOICES,
+        'stock_filter': stock_filter,
+        'stock_choices': stock_choices,
+        'sort': sort,
+        'sort_choices': [(key, label) for key, (label, _) in sorts.items()],
     }
     
     return render(request, 'inventory/items/item_list.html', context)
@@ -1142,10 +993,10 @@ def item_detail(request, item_id):
     item = get_object_or_404(Item, id=item_id)
     
     # Get stock lots
-    stock_lots = StockLot.objects.filter(item=item).order_by('-received_at')
+    stock_lots = StockLot.objects.filter(item=item).select_related('supplier', 'created_by').order_by('-received_at')
     
     # Get recent movements
-    movements = StockMovement.objects.filter(item=item).order_by('-timestamp')[:20]
+    movements = StockMovement.objects.filter(item=item).select_related('lot', 'created_by').order_by('-timestamp')[:20]
     
     # Get current stock
     current_stock = item.get_current_stock()
@@ -1248,10 +1099,7 @@ def stock_receive(request):
                 lot_no = form.cleaned_data.get('lot_no')
                 # Auto-generate lot number if not provided
                 if not lot_no:
-                    import datetime
-                    item = form.cleaned_data['item']
-                    now_str = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-                    lot_no = f"LOT-{item.code}-{now_str}"
+                    lot_no = InventoryService.generate_lot_numbers('LOT', item=form.cleaned_data['item'])[0]
 
                 lot = InventoryService.receive_stock(
                     item=form.cleaned_data['item'],
@@ -1343,6 +1191,112 @@ def api_item_meta(request):
     return JsonResponse(data, encoder=DjangoJSONEncoder)
 
 
+@login_required
+def api_items_batch(request):
+    """
+    Metadata and available lots for many items in one round trip: ?item_id=<id>&item_id=<id> (or comma separated).
+    The ETag and Last-Modified come from the items' and their stock balances' update times, so
+    clients revalidate with one aggregate query instead of reloading every lot.
+    """
+    import hashlib
+    import uuid
+    from django.db.models import Count, Max
+    from django.utils.cache import get_conditional_response, patch_cache_control
+    from django.utils.http import http_date, quote_etag
+
+    raw_ids = [value.strip() for param in request.GET.getlist('item_id') for value in param.split(',') if value.strip()]
+    if not raw_ids:
+        return HttpResponseBadRequest('item_id required')
+    if len(raw_ids) > 200:
+        return HttpResponseBadRequest('at most 200 item_ids per request')
+    try:
+        item_ids = sorted({uuid.UUID(value) for value in raw_ids})
+    except ValueError:
+        return HttpResponseBadRequest('invalid item_id')
+
+    # Every lot change made through InventoryService refreshes the item's stock balance row
+    version = Item.objects.filter(pk__in=item_ids).aggregate(
+        count=Count('pk'),
+        items_updated=Max('updated_at'),
+        stock_updated=Max('stock_balance__updated_at'),
+    )
+    last_modified = max(filter(None, [version['items_updated'], version['stock_updated']]), default=None)
+    etag = quote_etag(hashlib.md5(repr((item_ids, version)).encode(), usedforsecurity=False).hexdigest())
+
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+    if response is None:
+        items = list(Item.objects.filter(pk__in=item_ids).with_stock_balance())
+        lots_by_item = InventoryService.get_lot_pool(items)
+        data = {}
+        for item in items:
+            data[str(item.id)] = {
+                'is_perishable': item.is_perishable,
+                'unit': item.unit,
+                'shelf_life_days': item.shelf_life_days,
+                'code': item.code,
+                'name': item.name,
+                'current_stock': item.balance_qty,
+                'lots': [
+                    {
+                        'id': str(lot.id),
+                        'lot_no': lot.lot_no,
+                        'qty': str(lot.qty),
+                        'unit': lot.unit,
+                        'expires_at': lot.expires_at.isoformat() if lot.expires_at else None,
+                    }
+                    for lot in lots_by_item[item.id]
+                ],
+            }
+        missing = [str(item_id) for item_id in item_ids if str(item_id) not in data]
+        response = JsonResponse({'items': data, 'missing': missing}, encoder=DjangoJSONEncoder)
+
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+def api_search(request):
+    """
+    Ranked typeahead search for pickers, in Select2 format: ?type=item|supplier|user&q=...&limit=10
+    """
+    search_type = request.GET.get('type', 'item')
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+
+    if search_type == 'user':
+        if request.user.role not in ['admin', 'super_admin']:
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+        queryset = User.objects.filter(is_active=True).exclude(role='super_admin')
+    elif search_type in ('item', 'supplier'):
+        if not check_user_permissions(request.user, 'inventory_read', request=request):
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+        model = Item if search_type == 'item' else Supplier
+        queryset = model.objects.filter(is_active=True)
+    else:
+        return HttpResponseBadRequest('type must be item, supplier or user')
+
+    results = []
+    for obj in search(queryset, query, limit=limit)[:limit]:
+        if search_type == 'item':
+            results.append({'id': obj.id, 'text': f"{obj.name} ({obj.code})", 'code': obj.code, 'name': obj.name, 'unit': obj.unit})
+        elif search_type == 'supplier':
+            results.append({'id': obj.id, 'text': obj.name, 'contact_person': obj.contact_person})
+        else:
+            results.append({'id': obj.id, 'text': f"{obj.username} - {obj.get_full_name()}", 'role': obj.role})
+
+    return JsonResponse({'results': results}, encoder=DjangoJSONEncoder)
+
+
 @login_required
 @permission_required('inventory_write')
 def stock_consume(request):
@@ -1405,24 +1359,18 @@ def damage_log(request):
                 description = form.cleaned_data['description']
                 ref_no = form.cleaned_data.get('ref_no')
                 
-                # Create damage movement
-                movement = StockMovement.objects.create(
+                # Create damage movement and deduct from the lot
+                movement = InventoryService.log_damage(
                     item=item,
-                    lot=lot,
-                    movement_type='damage',
                     qty=qty,
                     unit=unit,
                     reason=f"{dict(StockMovement.DAMAGE_REASONS)[damage_reason]}: {description}",
+                    user=request.user,
+                    lot=lot,
                     ref_no=ref_no,
-                    notes=description,
-                    created_by=request.user
+                    notes=description
                 )
                 
-                # Update lot quantity if lot specified
-                if lot:
-                    lot.qty -= qty
-                    lot.save()
-                
                 log_user_action(
                     user=request.user,
                     action_type='create',
@@ -1531,8 +1479,7 @@ def production_create(request):
                 
                 # Auto-calculate unit cost if not provided
                 if not unit_cost:
-                    total_cost = RecipeService.calculate_recipe_cost(recipe)
-                    unit_cost = total_cost / recipe.yield_qty if recipe.yield_qty > 0 else 0
+                    unit_cost = ProductionService.get_auto_unit_cost(recipe)
                     messages.info(request, f"Unit cost auto-calculated: ₱{unit_cost:.2f} per {recipe.get_yield_unit_display()}")
                 
                 # Validate production
@@ -1580,6 +1527,75 @@ def production_create(request):
     return render(request, 'inventory/production/production_form.html', context)
 
 
+@login_required
+@permission_required('inventory_write')
+def production_batch_create(request):
+    """
+    Batch production workflow: several recipe runs validated and produced together
+    """
+    ProductionFormSet = formset_factory(ProductionForm, extra=5)
+    results = None
+    
+    if request.method == 'POST':
+        formset = ProductionFormSet(request.POST)
+        if formset.is_valid():
+            runs = []
+            for form in formset:
+                if not form.cleaned_data:
+                    continue
+                
+                recipe = form.cleaned_data['recipe']
+                unit_cost = form.cleaned_data.get('unit_cost')
+                if not unit_cost:
+                    unit_cost = ProductionService.get_auto_unit_cost(recipe)
+                
+                runs.append({
+                    'recipe': recipe,
+                    'production_qty': form.cleaned_data['production_qty'],
+                    'lot_no': form.cleaned_data['lot_no'],
+                    'expires_at': form.cleaned_data.get('expires_at'),
+                    'notes': form.cleaned_data.get('notes'),
+                    'unit_cost': unit_cost,
+                })
+            
+            if not runs:
+                messages.error(request, "Add at least one production run.")
+            else:
+                validation = ProductionService.validate_batch(runs)
+                if not validation['can_produce']:
+                    messages.error(request, "Cannot produce batch due to insufficient ingredients:")
+                    for missing in validation['missing_ingredients']:
+                        messages.error(request, f"- {missing['ingredient'].name}: Need {missing['needed']}, Available {missing['available']}")
+                else:
+                    try:
+                        results = ProductionService.produce_batch(runs, request.user)
+                        
+                        for result in results:
+                            log_user_action(
+                                user=request.user,
+                                action_type='create',
+                                target_model='StockLot',
+                                target_id=result['lot'].id,
+                                description=f"Produced: {result['recipe'].product.code} - Lot {result['lot'].lot_no}",
+                                request=request
+                            )
+                        
+                        messages.success(request, f"Batch production completed: {len(results)} run(s).")
+                        formset = ProductionFormSet()
+                    except Exception as e:
+                        messages.error(request, f"Error in batch production: {str(e)}")
+    else:
+        formset = ProductionFormSet()
+    
+    context = {
+        'formset': formset,
+        'results': results,
+        'title': 'Batch Production',
+    }
+    
+    return render(request, 'inventory/production/production_batch_form.html', context)
+
+
 @login_required
 @permission_required('inventory_read')
 def production_list(request):
@@ -1595,7 +1611,7 @@ def production_list(request):
     # Get production records (StockMovements with type='produce')
     productions = StockMovement.objects.filter(
         movement_type='produce'
-    ).select_related('item', 'lot', 'created_by').order_by('-timestamp')
+    ).select_related('item', 'lot', 'created_by')
     
     # Apply date filter
     if date_filter:
@@ -1626,62 +1642,20 @@ def production_list(request):
     ).select_related('item', 'lot', 'created_by').order_by('-timestamp')
     
     # Calculate today's summary
-    today_total_items = today_productions.count()
+    today_productions = ProductionService.attach_ingredients_used(today_productions)
+    today_total_items = len(today_productions)
     today_total_qty = sum(p.qty for p in today_productions)
     
     # Pagination
-    paginator = Paginator(productions, 20)
-    page_number = request.GET.get('page')
-    productions = paginator.get_page(page_number)
+    productions = CursorPaginator(productions, ('-timestamp',), per_page=20).get_page(request.GET.get('cursor'))
     
-    # Calculate ingredients used for each production
+    # Calculate value and ingredients used for each production on the page
     for production in productions:
-        # Calculate total value
         if production.lot and production.lot.unit_cost:
             production.total_value = float(production.qty) * float(production.lot.unit_cost)
         else:
             production.total_value = None
-            
-        # Find the recipe for this product (get the first active one if multiple exist)
-        try:
-            recipe = Recipe.objects.filter(product=production.item, is_active=True).first()
-            if recipe:
-                # Calculate ingredients needed based on production quantity
-                ingredients_used = []
-                for recipe_item in recipe.recipe_items.all():
-                    qty_needed = float(recipe_item.qty) * float(production.qty) / float(recipe.yield_qty)
-                    # Apply loss factor if any
-                    qty_needed = qty_needed * recipe_item.get_adjusted_qty() / float(recipe_item.qty)
-                    ingredients_used.append({
-                        'ingredient': recipe_item.ingredient,
-                        'qty': qty_needed,
-                        'unit': recipe_item.unit
-                    })
-                production.ingredients_used = ingredients_used
-            else:
-                production.ingredients_used = []
-        except Exception:
-            production.ingredients_used = []
-    
-    # Calculate ingredients for today's productions
-    for production in today_productions:
-        try:
-            recipe = Recipe.objects.filter(product=production.item, is_active=True).first()
-            if recipe:
-                ingredients_used = []
-                for recipe_item in recipe.recipe_items.all():
-                    qty_needed = float(recipe_item.qty) * float(production.qty) / float(recipe.yield_qty)
-                    qty_needed = qty_needed * recipe_item.get_adjusted_qty() / float(recipe_item.qty)
-                    ingredients_used.append({
-                        'ingredient': recipe_item.ingredient,
-                        'qty': qty_needed,
-                        'unit': recipe_item.unit
-                    })
-                production.ingredients_used = ingredients_used
-            else:
-                production.ingredients_used = []
-        except Exception:
-            production.ingredients_used = []
+    ProductionService.attach_ingredients_used(productions)
     
     # Get all recipes for filter dropdown
     recipes = Recipe.objects.filter(is_active=True).values_list('product__name', flat=True).distinct()
@@ -1706,12 +1680,10 @@ def supplier_list(request):
     """
     List all suppliers
     """
-    suppliers = Supplier.objects.all().order_by('name')
+    suppliers = Supplier.objects.all()
     
     # Pagination
-    paginator = Paginator(suppliers, 20)
-    page_number = request.GET.get('page')
-    suppliers = paginator.get_page(page_number)
+    suppliers = CursorPaginator(suppliers, ('name',), per_page=20).get_page(request.GET.get('cursor'))
     
     context = {
         'suppliers': suppliers,
@@ -1803,22 +1775,20 @@ def recipe_list(request):
     """
     List all recipes
     """
-    recipes = Recipe.objects.filter(is_active=True).order_by('name')
-    
-    # Add cost information
-    recipes_with_cost = []
-    for recipe in recipes:
-        total_cost = RecipeService.calculate_recipe_cost(recipe)
-        recipes_with_cost.append({
-            'recipe': recipe,
-            'total_cost': total_cost,
-            'cost_per_unit': total_cost / recipe.yield_qty if recipe.yield_qty > 0 else 0
-        })
+    recipes = Recipe.objects.filter(is_active=True).with_cost().select_related('product')
     
     # Pagination
-    paginator = Paginator(recipes_with_cost, 20)
-    page_number = request.GET.get('page')
-    recipes_with_cost = paginator.get_page(page_number)
+    recipes_with_cost = CursorPaginator(recipes, ('name',), per_page=20).get_page(request.GET.get('cursor'))
+    
+    # Add cost information (rolled up from cached ingredient costs)
+    recipes_with_cost.object_list = [
+        {
+            'recipe': recipe,
+            'total_cost': recipe.total_cost,
+            'cost_per_unit': recipe.total_cost / recipe.yield_qty if recipe.yield_qty > 0 else 0
+        }
+        for recipe in recipes_with_cost.object_list
+    ]
     
     context = {
         'recipes_with_cost': recipes_with_cost,
@@ -1833,10 +1803,10 @@ def recipe_detail(request, recipe_id):
     """
     View recipe details
     """
-    recipe = get_object_or_404(Recipe, id=recipe_id)
+    recipe = get_object_or_404(Recipe.objects.with_cost(), id=recipe_id)
     
     # Get recipe items
-    recipe_items = RecipeItem.objects.filter(recipe=recipe)
+    recipe_items = RecipeItem.objects.filter(recipe=recipe).select_related('ingredient')
     
     # Calculate costs
     total_cost = RecipeService.calculate_recipe_cost(recipe)
@@ -1939,8 +1909,8 @@ def stock_report(request):
     """
     import csv
     from datetime import datetime, timedelta
-    from django.db.models import Sum, Count, Q
-    from django.http import HttpResponse
+    from django.db.models import Sum
+    from django.http import StreamingHttpResponse
     from decimal import Decimal
     
     # Get filters
@@ -1973,154 +1943,129 @@ def stock_report(request):
         except ValueError:
             pass
     
-    items = Item.objects.filter(is_active=True)
-    
-    if category_filter:
-        items = items.filter(category=category_filter)
-    
-    # Build report data
-    report_data = []
-    total_value = Decimal('0.00')
-    total_consumed = Decimal('0.00')
-    total_received = Decimal('0.00')
-    total_produced = Decimal('0.00')
-    
-    for item in items:
-        current_stock = item.get_current_stock()
-        is_low_stock = item.is_low_stock()
-        
-        if low_stock_only and not is_low_stock:
-            continue
-        
-        # Calculate consumption, receipts, and production for date range
-        movements = StockMovement.objects.filter(item=item)
-        if start_date:
-            movements = movements.filter(timestamp__date__gte=start_date)
-        if end_date:
-            movements = movements.filter(timestamp__date__lte=end_date)
-        
-        # Consumption
-        consumed = movements.filter(movement_type='consume').aggregate(
-            total=Sum('qty')
-        )['total'] or Decimal('0.00')
-        
-        # Receipts
-        received = movements.filter(movement_type='receive').aggregate(
-            total=Sum('qty')
-        )['total'] or Decimal('0.00')
-        
-        # Production
-        produced = movements.filter(movement_type='produce').aggregate(
-            total=Sum('qty')
-        )['total'] or Decimal('0.00')
-        
-        # Adjustments
-        adjusted = movements.filter(movement_type='adjust').aggregate(
-            total=Sum('qty')
-        )['total'] or Decimal('0.00')
-        
-        # Calculate value
-        unit_cost = InventoryService.calculate_item_cost(item)
-        item_value = current_stock * unit_cost
-        total_value += item_value
-        
-        # Track totals
-        total_consumed += consumed
-        total_received += received
-        total_produced += produced
-        
-        report_data.append({
-            'item': item,
-            'current_stock': current_stock,
-            'reorder_level': item.reorder_level,
-            'is_low_stock': is_low_stock,
-            'expiring_soon': item.get_expiring_soon().count(),
-            'unit_cost': unit_cost,
-            'item_value': item_value,
-            'consumed': consumed,
-            'received': received,
-            'produced': produced,
-            'adjusted': adjusted,
-        })
+    # Report rows come from one grouped movement query plus one annotated item query
+    rows = InventoryService.get_stock_report(
+        category=category_filter or None,
+        low_stock_only=bool(low_stock_only),
+        start_date=start_date,
+        end_date=end_date
+    )
     
-    # Summary statistics
-    summary = {
-        'total_items': len(report_data),
-        'low_stock_count': sum(1 for d in report_data if d['is_low_stock']),
-        'expiring_count': sum(1 for d in report_data if d['expiring_soon'] > 0),
-        'total_value': total_value,
-        'total_consumed': total_consumed,
-        'total_received': total_received,
-        'total_produced': total_produced,
-    }
+    def summarize(row, summary):
+        summary['total_items'] += 1
+        summary['low_stock_count'] += 1 if row['is_low_stock'] else 0
+        summary['expiring_count'] += 1 if row['expiring_soon'] > 0 else 0
+        summary['total_value'] += row['item_value']
+        summary['total_consumed'] += row['consumed']
+        summary['total_received'] += row['received']
+        summary['total_produced'] += row['produced']
+    
+    def empty_summary():
+        return {
+            'total_items': 0,
+            'low_stock_count': 0,
+            'expiring_count': 0,
+            'total_value': Decimal('0.00'),
+            'total_consumed': Decimal('0.00'),
+            'total_received': Decimal('0.00'),
+            'total_produced': Decimal('0.00'),
+        }
     
     # Check if CSV export is requested
     if request.GET.get('export') == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="stock_report_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-        
-        writer = csv.writer(response)
+        class Echo:
+            """Pseudo-buffer that returns each written line to the streaming generator"""
+            def write(self, value):
+                return value
         
-        # Write header
-        writer.writerow([
-            'Item Code',
-            'Item Name',
-            'Category',
-            'Current Stock',
-            'Unit',
-            'Reorder Level',
-            'Status',
-            'Unit Cost',
-            'Total Value',
-            'Consumed',
-            'Received',
-            'Produced',
-            'Adjusted',
-            'Expiring Soon'
-        ])
+        writer = csv.writer(Echo())
         
-        # Write data rows
-        for data in report_data:
-            status = 'Low Stock' if data['is_low_stock'] else 'OK'
-            writer.writerow([
-                data['item'].code,
-                data['item'].name,
-                data['item'].get_category_display(),
-                f"{data['current_stock']:.2f}",
-                data['item'].get_unit_display(),
-                f"{data['reorder_level']:.2f}",
-                status,
-                f"{data['unit_cost']:.2f}",
-                f"{data['item_value']:.2f}",
-                f"{data['consumed']:.2f}",
-                f"{data['received']:.2f}",
-                f"{data['produced']:.2f}",
-                f"{data['adjusted']:.2f}",
-                data['expiring_soon']
+        def stream_rows():
+            summary = empty_summary()
+            
+            # Write header
+            yield writer.writerow([
+                'Item Code',
+                'Item Name',
+                'Category',
+                'Current Stock',
+                'Unit',
+                'Reorder Level',
+                'Status',
+                'Unit Cost',
+                'Total Value',
+                'Consumed',
+                'Received',
+                'Produced',
+                'Adjusted',
+                'Expiring Soon'
             ])
+            
+            # Write data rows
+            for data in rows:
+                summarize(data, summary)
+                status = 'Low Stock' if data['is_low_stock'] else 'OK'
+                yield writer.writerow([
+                    data['item'].code,
+                    data['item'].name,
+                    data['item'].get_category_display(),
+                    f"{data['current_stock']:.2f}",
+                    data['item'].get_unit_display(),
+                    f"{data['reorder_level']:.2f}",
+                    status,
+                    f"{data['unit_cost']:.2f}",
+                    f"{data['item_value']:.2f}",
+                    f"{data['consumed']:.2f}",
+                    f"{data['received']:.2f}",
+                    f"{data['produced']:.2f}",
+                    f"{data['adjusted']:.2f}",
+                    data['expiring_soon']
+                ])
+            
+            # Write summary row
+            yield writer.writerow([])
+            yield writer.writerow(['SUMMARY'])
+            yield writer.writerow(['Total Items', summary['total_items']])
+            yield writer.writerow(['Low Stock Items', summary['low_stock_count']])
+            yield writer.writerow(['Items with Expiring Stock', summary['expiring_count']])
+            yield writer.writerow(['Total Inventory Value', f"₱{summary['total_value']:.2f}"])
+            yield writer.writerow(['Total Consumed', f"{summary['total_consumed']:.2f}"])
+            yield writer.writerow(['Total Received', f"{summary['total_received']:.2f}"])
+            yield writer.writerow(['Total Produced', f"{summary['total_produced']:.2f}"])
+            
+            if date_from or date_to:
+                yield writer.writerow([])
+                yield writer.writerow(['Report Period'])
+                yield writer.writerow(['From', date_from or 'Beginning'])
+                yield writer.writerow(['To', date_to or 'Today'])
         
-        # Write summary row
-        writer.writerow([])
-        writer.writerow(['SUMMARY'])
-        writer.writerow(['Total Items', summary['total_items']])
-        writer.writerow(['Low Stock Items', summary['low_stock_count']])
-        writer.writerow(['Items with Expiring Stock', summary['expiring_count']])
-        writer.writerow(['Total Inventory Value', f"₱{summary['total_value']:.2f}"])
-        writer.writerow(['Total Consumed', f"{summary['total_consumed']:.2f}"])
-        writer.writerow(['Total Received', f"{summary['total_received']:.2f}"])
-        writer.writerow(['Total Produced', f"{summary['total_produced']:.2f}"])
-        
-        if date_from or date_to:
-            writer.writerow([])
-            writer.writerow(['Report Period'])
-            writer.writerow(['From', date_from or 'Beginning'])
-            writer.writerow(['To', date_to or 'Today'])
-        
+        response = StreamingHttpResponse(stream_rows(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="stock_report_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
         return response
     
+    # Build report data
+    report_data = list(rows)
+    summary = empty_summary()
+    for data in report_data:
+        summarize(data, summary)
+    
+    # Historical on-hand value for past report periods comes from nightly snapshots
+    historical_value = None
+    if end_date and end_date < today:
+        snapshot_date = InventoryService.get_snapshot_date(end_date)
+        if snapshot_date:
+            snapshots = InventorySnapshot.objects.filter(date=snapshot_date, item__is_active=True)
+            if category_filter:
+                snapshots = snapshots.filter(item__category=category_filter)
+            historical_value = {
+                'date': snapshot_date,
+                'value': snapshots.aggregate(total=Sum('value'))['total'] or Decimal('0.00'),
+            }
+    
     context = {
         'report_data': report_data,
         'summary': summary,
+        'historical_value': historical_value,
         'category_filter': category_filter,
         'low_stock_only': low_stock_only,
         'report_type': report_type,
@@ -2153,9 +2098,7 @@ def purchase_order_list(request):
         orders = orders.filter(supplier__id=supplier_filter)
     
     # Pagination
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    orders = paginator.get_page(page_number)
+    orders = CursorPaginator(orders, ('-created_at',), per_page=20).get_page(request.GET.get('cursor'))
     
     # Get summary statistics
     order_summary = PurchaseOrderService.get_order_summary()
@@ -2188,16 +2131,12 @@ def purchase_order_detail(request, order_id):
     """
     order = get_object_or_404(PurchaseOrder, id=order_id)
     
-    # Generate QR code image
-    qr_code_image = PurchaseOrderService.generate_qr_code_image(order.qr_code)
-    
     # Get order items
     order_items = order.order_items.select_related('item').all()
     
     context = {
         'order': order,
         'order_items': order_items,
-        'qr_code_image': qr_code_image,
     }
     
     log_user_action(
@@ -2212,6 +2151,40 @@ def purchase_order_detail(request, order_id):
     return render(request, 'inventory/purchase_orders/purchase_order_detail.html', context)
 
 
+@login_required
+def purchase_order_qr(request, order_id):
+    """
+    QR code image of a purchase order (?format=svg for SVG, PNG by default) for users with
+    inventory access and the order's supplier. An order's code never changes, so the image
+    comes from the render cache and browsers may keep it for a year.
+    """
+    from django.http import HttpResponse, HttpResponseForbidden
+    from django.utils.cache import get_conditional_response, patch_cache_control
+    from django.utils.http import quote_etag
+
+    image_format = request.GET.get('format', 'png')
+    if image_format not in PurchaseOrderService.QR_IMAGE_TYPES:
+        return HttpResponseBadRequest('format must be png or svg')
+
+    orders = PurchaseOrder.objects.only('qr_code')
+    if request.user.role == 'supplier':
+        orders = orders.filter(supplier_id=request.user.supplier_id)
+    elif not check_user_permissions(request.user, 'inventory_read', request=request):
+        return HttpResponseForbidden()
+    order = get_object_or_404(orders, id=order_id)
+
+    etag = quote_etag(f'{order.qr_code}.{image_format}')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(
+            PurchaseOrderService.get_qr_code_image(order.qr_code, image_format),
+            content_type=PurchaseOrderService.QR_IMAGE_TYPES[image_format]
+        )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    return response
+
+
 @login_required
 @permission_required('inventory_write')
 def purchase_order_receive(request, order_id):
@@ -2221,84 +2194,56 @@ def purchase_order_receive(request, order_id):
     order = get_object_or_404(PurchaseOrder, id=order_id)
     
     # Check if order can be received
-    if order.status not in ['approved', 'shipped']:
+    if not order.can_be_received():
         messages.error(request, "This order cannot be received in its current status.")
         return redirect('inventory:purchase_order_detail', order_id=order.id)
     
     if request.method == 'POST':
-        # Process the receiving
+        lines = {
+            item_id: {
+                'qty_received': request.POST.get(f'qty_received_{item_id}'),
+                'lot_no': request.POST.get(f'lot_no_{item_id}'),
+                'expires_at': request.POST.get(f'expires_at_{item_id}'),
+                'notes': request.POST.get(f'notes_{item_id}', ''),
+            }
+            for item_id in order.order_items.values_list('id', flat=True)
+        }
+        
         try:
-            order_items = order.order_items.all()
-            
-            for item in order_items:
-                qty_received = request.POST.get(f'qty_received_{item.id}')
-                lot_no = request.POST.get(f'lot_no_{item.id}')
-                expires_at = request.POST.get(f'expires_at_{item.id}')
-                notes = request.POST.get(f'notes_{item.id}', '')
-                
-                if qty_received and float(qty_received) > 0:
-                    # Create stock lot
-                    stock_lot = StockLot.objects.create(
-                        item=item.item,
-                        lot_no=lot_no,
-                        qty=qty_received,
-                        unit=item.unit,
-                        expires_at=expires_at if expires_at else None,
-                        unit_cost=item.unit_price,
-                        supplier=order.supplier,
-                        notes=notes,
-                        created_by=request.user
-                    )
-                    
-                    # Create stock movement
-                    StockMovement.objects.create(
-                        item=item.item,
-                        lot=stock_lot,
-                        movement_type='receive',
-                        qty=qty_received,
-                        unit=item.unit,
-                        ref_no=order.order_no,
-                        reason=f"Received from PO {order.order_no}",
-                        notes=notes,
-                        created_by=request.user
-                    )
-                    
-                    # Update order item qty_received
-                    item.qty_received = float(qty_received)
-                    item.save()
-            
-            # Update order status
-            order.status = 'received'
-            order.received_by = request.user
-            order.received_at = timezone.now()
-            order.actual_delivery_date = timezone.now().date()
-            
-            # Add delivery notes if provided
-            delivery_notes = request.POST.get('delivery_notes', '')
-            if delivery_notes:
-                order.notes = (order.notes or '') + f"\n\nDelivery Notes: {delivery_notes}"
-            
-            order.save()
-            
-            # Log action
-            log_user_action(
+            order, lots = PurchaseOrderService.receive_with_details(
+                order=order,
+                lines=lines,
                 user=request.user,
-                action_type='update',
-                target_model='PurchaseOrder',
-                target_id=order.id,
-                description=f"Received purchase order {order.order_no}",
-                request=request
+                delivery_notes=request.POST.get('delivery_notes', '')
             )
-            
-            messages.success(request, f"Purchase order {order.order_no} has been successfully received!")
-            return redirect('inventory:purchase_order_detail', order_id=order.id)
-            
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('inventory:purchase_order_receive', order_id=order.id)
         except Exception as e:
             messages.error(request, f"Error receiving order: {str(e)}")
             return redirect('inventory:purchase_order_receive', order_id=order.id)
+        
+        # Log action
+        log_user_action(
+            user=request.user,
+            action_type='update',
+            target_model='PurchaseOrder',
+            target_id=order.id,
+            description=f"Received {len(lots)} line(s) of purchase order {order.order_no}",
+            request=request
+        )
+        
+        if order.status == 'received':
+            messages.success(request, f"Purchase order {order.order_no} has been successfully received!")
+        else:
+            messages.success(request, f"Received {len(lots)} line(s) of {order.order_no}. The order stays open for the remaining quantities.")
+        return redirect('inventory:purchase_order_detail', order_id=order.id)
     
     # GET request - show the form
-    order_items = order.order_items.select_related('item').all()
+    from django.db.models import DecimalField, ExpressionWrapper, F
+    order_items = order.order_items.select_related('item').annotate(
+        qty_remaining=ExpressionWrapper(F('qty_ordered') - F('qty_received'), output_field=DecimalField(max_digits=10, decimal_places=2))
+    )
     
     context = {
         'order': order,
@@ -2368,25 +2313,22 @@ def purchase_order_create(request):
     else:
         form = PurchaseOrderForm()
     
-    # Get all active items for selection
+    # Item pickers load matches from api_search; only low stock items are listed up front
     items = Item.objects.filter(is_active=True).order_by('name')
     
     # Get low stock items with current stock levels
     low_stock_items = []
-    for item in items:
-        current_stock = item.get_current_stock()
-        if current_stock <= item.reorder_level:
-            low_stock_items.append({
-                'item': item,
-                'current_stock': current_stock,
-                'reorder_level': item.reorder_level,
-                'min_order_qty': item.min_order_qty,
-                'is_out_of_stock': current_stock == 0
-            })
+    for item in items.with_stock_balance().filter(balance_qty__lte=F('reorder_level')):
+        low_stock_items.append({
+            'item': item,
+            'current_stock': item.balance_qty,
+            'reorder_level': item.reorder_level,
+            'min_order_qty': item.min_order_qty,
+            'is_out_of_stock': item.balance_qty == 0
+        })
     
     context = {
         'form': form,
-        'items': items,
         'low_stock_items': low_stock_items,
         'title': 'Create Purchase Order',
     }
@@ -2406,30 +2348,20 @@ def purchase_order_approve(request, order_id):
         messages.error(request, f"Purchase order cannot be approved. Current status: {order.get_status_display()}")
         return redirect('inventory:purchase_order_detail', order_id=order_id)
     
-    order_items = order.order_items.all()
+    order_items = order.order_items.select_related('item')
     
     if request.method == 'POST':
         form = PurchaseOrderApproveForm(request.POST, order_items=order_items)
         if form.is_valid():
             try:
-                # Update item prices from form
-                item_prices = form.get_item_prices()
-                for po_item in order_items:
-                    price_key = str(po_item.id)
-                    if price_key in item_prices:
-                        po_item.unit_price = item_prices[price_key]
-                        po_item.save()
-                
-                # Recalculate total
-                order.total_amount = order.calculate_total()
-                order.save()
-                
-                # Supplier approves order
+                # Price the items, refresh the total and approve in one transaction
                 PurchaseOrderService.supplier_approve_purchase_order(
                     po=order,
                     user=request.user,
                     supplier_notes=form.cleaned_data.get('supplier_notes'),
-                    expected_delivery_date=form.cleaned_data['expected_delivery_date']
+                    expected_delivery_date=form.cleaned_data['expected_delivery_date'],
+                    item_prices=form.get_item_prices(),
+                    order_items=order_items
                 )
                 
                 log_user_action(
@@ -2498,7 +2430,7 @@ def purchase_order_admin_approve(request, order_id):
     
     context = {
         'order': order,
-        'order_items': order.order_items.all(),
+        'order_items': order.order_items.select_related('item'),
         'title': f'Admin Approve Purchase Order: {order.order_no}',
     }
     
@@ -2546,7 +2478,7 @@ def purchase_order_admin_reject(request, order_id):
     
     context = {
         'order': order,
-        'order_items': order.order_items.all(),
+        'order_items': order.order_items.select_related('item'),
         'title': f'Reject Purchase Order: {order.order_no}',
     }
     
@@ -2633,6 +2565,53 @@ def purchase_order_scan_receive(request):
     return render(request, 'inventory/purchase_orders/purchase_order_scan.html', context)
 
 
+@login_required
+@permission_required('inventory_write')
+def purchase_order_scan_session(request):
+    """
+    Receive every purchase order of a delivery from one list of scanned QR codes
+    """
+    results = None
+    if request.method == 'POST':
+        form = QRCodeBatchScanForm(request.POST)
+        if form.is_valid():
+            try:
+                results = PurchaseOrderService.receive_purchase_orders_by_qr(
+                    qr_codes=form.cleaned_data['qr_codes'],
+                    user=request.user
+                )
+            except Exception as e:
+                messages.error(request, f"Error receiving purchase orders: {str(e)}")
+            else:
+                received = [result for result in results if result['success']]
+                for result in received:
+                    log_user_action(
+                        user=request.user,
+                        action_type='update',
+                        target_model='PurchaseOrder',
+                        target_id=result['order'].id,
+                        description=f"Received purchase order {result['order'].order_no} via QR scan session",
+                        request=request
+                    )
+                
+                if received:
+                    messages.success(request, f"{len(received)} of {len(results)} purchase order(s) received.")
+                if len(received) < len(results):
+                    messages.warning(request, f"{len(results) - len(received)} QR code(s) could not be received. See the report below.")
+                form = QRCodeBatchScanForm()
+    else:
+        form = QRCodeBatchScanForm()
+    
+    context = {
+        'form': form,
+        'results': results,
+        'shipped_orders': PurchaseOrderService.get_shipped_orders(),
+        'title': 'Receive Delivery (Scan Session)',
+    }
+    
+    return render(request, 'inventory/purchase_orders/purchase_order_scan_session.html', context)
+
+
 @login_required
 @permission_required('inventory_write')
 def purchase_order_cancel(request, order_id):
@@ -2674,6 +2653,7 @@ def purchase_order_cancel(request, order_id):
     
     context = {
         'order': order,
+        'order_items': order.order_items.select_related('item'),
         'title': f'Cancel Purchase Order: {order.order_no}',
     }
     
@@ -2702,7 +2682,7 @@ def supplier_dashboard(request):
     
     # Calculate total order value
     from django.db.models import Sum
-    total_order_value = orders.filter(status__in=['approved', 'shipped', 'received']).aggregate(
+    total_order_value = orders.filter(status__in=['supplier_approved', 'admin_approved', 'shipped', 'received']).aggregate(
         total=Sum('total_amount')
     )['total'] or 0
     
@@ -2733,18 +2713,18 @@ def supplier_orders(request):
     """
     List all orders for this supplier
     """
+    from django.db.models import Count
+    
     supplier = request.user.supplier
     status_filter = request.GET.get('status', '')
     
-    orders = PurchaseOrder.objects.filter(supplier=supplier)
+    orders = PurchaseOrder.objects.filter(supplier=supplier).annotate(item_count=Count('order_items'))
     
     if status_filter:
         orders = orders.filter(status=status_filter)
     
     # Pagination
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    orders = paginator.get_page(page_number)
+    orders = CursorPaginator(orders, ('-created_at',), per_page=20).get_page(request.GET.get('cursor'))
     
     context = {
         'orders': orders,
@@ -2765,16 +2745,12 @@ def supplier_order_detail(request, order_id):
     supplier = request.user.supplier
     order = get_object_or_404(PurchaseOrder, id=order_id, supplier=supplier)
     
-    # Generate QR code image
-    qr_code_image = PurchaseOrderService.generate_qr_code_image(order.qr_code)
-    
     # Get order items
     order_items = order.order_items.select_related('item').all()
     
     context = {
         'order': order,
         'order_items': order_items,
-        'qr_code_image': qr_code_image,
         'supplier': supplier,
     }
     
@@ -2799,37 +2775,26 @@ def supplier_order_approve(request, order_id):
     supplier = request.user.supplier
     order = get_object_or_404(PurchaseOrder, id=order_id, supplier=supplier)
     
-    if not order.can_be_approved():
+    if not order.can_supplier_approve():
         messages.error(request, f"Purchase order cannot be approved. Current status: {order.get_status_display()}")
         return redirect('inventory:supplier_order_detail', order_id=order_id)
     
-    order_items = order.order_items.all()
+    order_items = order.order_items.select_related('item')
     
     if request.method == 'POST':
         form = PurchaseOrderApproveForm(request.POST, order_items=order_items)
         if form.is_valid():
             try:
-                # Update item prices from supplier
-                item_prices = form.get_item_prices()
-                total_amount = Decimal('0')
-                
-                for po_item in order_items:
-                    price_key = str(po_item.id)
-                    if price_key in item_prices:
-                        po_item.unit_price = item_prices[price_key]
-                        po_item.save()
-                        total_amount += po_item.subtotal()
-                
-                # Update total amount
-                order.total_amount = total_amount
-                order.save()
-                
-                # Approve order
-                PurchaseOrderService.approve_purchase_order(
+                # Price the items, refresh the total and approve in one transaction
+                PurchaseOrderService.supplier_approve_purchase_order(
                     po=order,
+                    user=request.user,
                     supplier_notes=form.cleaned_data.get('supplier_notes'),
-                    expected_delivery_date=form.cleaned_data['expected_delivery_date']
+                    expected_delivery_date=form.cleaned_data['expected_delivery_date'],
+                    item_prices=form.get_item_prices(),
+                    order_items=order_items
                 )
+                total_amount = order.total_amount
                 
                 log_user_action(
                     user=request.user,